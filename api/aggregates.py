@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from api.crud import rebuild_percentage_aggregates, verify_percentage_aggregates
+
+
+async def _main(command: str, tolerance: float) -> int:
+    from api.database import SessionLocal, engine
+
+    async with SessionLocal() as db:
+        if command == "rebuild":
+            start = time.perf_counter()
+            await rebuild_percentage_aggregates(db)
+            print(f"rebuilt percentage_aggregate in {time.perf_counter() - start:.1f}s")
+        mismatches = await verify_percentage_aggregates(db, tolerance)
+    await engine.dispose()
+    if mismatches.empty:
+        print("percentage_aggregate matches a full recompute")
+        return 0
+    print(mismatches.to_string(index=False))
+    print(f"{len(mismatches)} groups differ from a full recompute")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the running percentage aggregates against a full "
+        "recompute, or rebuild them first"
+    )
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.command, args.tolerance)))
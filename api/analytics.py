@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import Select, Table, TextualSelect, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import POPULATIONS, Base, DataVersion
+
+if TYPE_CHECKING:
+    import pandas as pd  # type: ignore
+
+
+# Where the cohort reads behind the dashboards run: "postgres", or "duckdb" for
+# an in-process DuckDB over the latest Parquet snapshot in TEIKO_ANALYTICS_DIR,
+# which scans columns on every core and keeps that load off the database.
+# Snapshots are taken with `python -m api.analytics export`, and the dashboards
+# show the data as of the latest one.
+BACKEND = os.environ.get("TEIKO_ANALYTICS_BACKEND", "postgres")
+SNAPSHOT_DIR = Path(os.environ.get("TEIKO_ANALYTICS_DIR", "analytics"))
+THREADS = int(os.environ.get("TEIKO_DUCKDB_THREADS", os.cpu_count() or 1))
+
+# Snapshotted tables and the columns their Parquet files are partitioned by.
+# Cohorts are filtered on sample type and time point, so DuckDB skips the
+# directories of the others. percentage_aggregate is read in the same
+# transaction, so the screen's moments match the snapshotted samples.
+SNAPSHOT_TABLES: dict[str, list[str]] = {
+    "sample": ["sample_type", "time_from_treatment_start"],
+    "subject": [],
+    "treatment": [],
+    "project_subjects": [],
+    "percentage_aggregate": [],
+}
+
+# sample_frequency is derived from the sample counts, as in Postgres
+_TOTAL = " + ".join(f"COALESCE({p}, 0)" for p in POPULATIONS)
+SAMPLE_FREQUENCY_VIEW = "\nUNION ALL\n".join(
+    f"""
+    SELECT
+        sample_id,
+        '{p}' AS population,
+        {p} AS count,
+        total_count,
+        {p}::DOUBLE / NULLIF(total_count, 0) * 100 AS percentage
+    FROM (SELECT *, {_TOTAL} AS total_count FROM sample)
+    """
+    for p in POPULATIONS
+)
+
+
+def _column_types(table: Table) -> dict[str, str]:
+    dialect = postgresql.dialect()
+    return {column.name: column.type.compile(dialect) for column in table.columns}
+
+
+async def export_snapshot(db: AsyncSession, directory: Path = SNAPSHOT_DIR) -> Path:
+    # Every table is read in one REPEATABLE READ transaction, so the snapshot
+    # is consistent and matches one data version. Each is copied out of
+    # Postgres as CSV and rewritten as Parquet by DuckDB, then the snapshot is
+    # published by replacing the CURRENT pointer, so readers never see a
+    # partial one.
+    import duckdb  # type: ignore
+
+    await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    version = await db.scalar(select(DataVersion.version).where(DataVersion.id == 1))
+    name = f"v{version or 0}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}"
+    target = directory / name
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    with tempfile.TemporaryDirectory() as staging:
+        for table in SNAPSHOT_TABLES:
+            await raw_connection.driver_connection.copy_from_table(  # type: ignore
+                table, output=f"{staging}/{table}.csv", format="csv", header=True
+            )
+        await db.rollback()
+
+        def write_parquet() -> None:
+            target.mkdir(parents=True)
+            with duckdb.connect(config={"threads": THREADS}) as con:
+                for table, partition_by in SNAPSHOT_TABLES.items():
+                    types = _column_types(Base.metadata.tables[table])
+                    source = (
+                        f"SELECT * FROM read_csv('{staging}/{table}.csv', "
+                        f"header = true, columns = {types!r})"
+                    )
+                    if partition_by:
+                        options = f"PARTITION_BY ({', '.join(partition_by)})"
+                        path = target / table
+                    else:
+                        (target / table).mkdir()
+                        options = ""
+                        path = target / table / "data.parquet"
+                    con.execute(
+                        f"COPY ({source}) TO '{path}' (FORMAT PARQUET"
+                        f"{', ' + options if options else ''})"
+                    )
+
+        await asyncio.to_thread(write_parquet)
+    pointer = directory / "CURRENT.tmp"
+    pointer.write_text(name)
+    os.replace(pointer, directory / "CURRENT")
+    # Queries already running may still read the previous snapshot
+    for old in sorted(directory.glob("v*"), key=lambda p: p.stat().st_mtime)[:-2]:
+        shutil.rmtree(old)
+    return target
+
+
+def _read_csv_dtypes(frame: "pd.DataFrame") -> "pd.DataFrame":
+    # DuckDB returns nullable integer and boolean columns where the frames of
+    # the Postgres path, parsed by pandas.read_csv, have float64 with NaN and
+    # object columns, which the analyses and renderers expect
+    import numpy as np
+    import pandas as pd  # type: ignore
+
+    for name in frame.columns:
+        column = frame[name]
+        if isinstance(column.dtype, pd.BooleanDtype):
+            frame[name] = (
+                column.astype(object).where(column.notna(), np.nan)
+                if column.hasnans
+                else column.astype(bool)
+            )
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            frame[name] = (
+                column.astype(float) if column.hasnans else column.astype("int64")
+            )
+    return frame
+
+
+class AnalyticsEngine:
+    # One in-process DuckDB database with a view per snapshotted table, pointed
+    # at the current snapshot and re-pointed when a newer one is published.
+    # Queries run on their own cursor in a worker thread.
+
+    def __init__(self, directory: Path, threads: int):
+        self.directory = directory
+        self.threads = threads
+        self._lock = threading.Lock()
+        self._con: Any = None
+        self._snapshot: str | None = None
+
+    def current_snapshot(self) -> str | None:
+        try:
+            return (self.directory / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def _cursor(self) -> Any:
+        import duckdb  # type: ignore
+
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            raise RuntimeError(
+                f"No analytics snapshot in {self.directory}, "
+                "run `python -m api.analytics export`"
+            )
+        with self._lock:
+            if self._con is None:
+                self._con = duckdb.connect(config={"threads": self.threads})
+            if snapshot != self._snapshot:
+                root = self.directory / snapshot
+                for table, partition_by in SNAPSHOT_TABLES.items():
+                    types = {
+                        column: type_
+                        for column, type_ in _column_types(
+                            Base.metadata.tables[table]
+                        ).items()
+                        if column in partition_by
+                    }
+                    self._con.execute(
+                        f"""
+                        CREATE OR REPLACE VIEW {table} AS
+                        SELECT * FROM read_parquet(
+                            '{root / table}/**/*.parquet',
+                            hive_partitioning = true,
+                            hive_types = {types!r}
+                        )
+                        """
+                        if partition_by
+                        else f"""
+                        CREATE OR REPLACE VIEW {table} AS
+                        SELECT * FROM read_parquet('{root / table}/data.parquet')
+                        """
+                    )
+                self._con.execute(
+                    f"CREATE OR REPLACE VIEW sample_frequency AS {SAMPLE_FREQUENCY_VIEW}"
+                )
+                self._snapshot = snapshot
+            return self._con.cursor()
+
+    async def read_frame(self, stmt: Select | TextualSelect) -> "pd.DataFrame":
+        # The statement is compiled as for COPY in api.crud, with $n
+        # placeholders that DuckDB binds too. The cohort queries only use SQL
+        # that DuckDB reads the same way.
+        from api.database import compile_positional
+
+        sql, parameters = compile_positional(stmt)
+
+        def run() -> "pd.DataFrame":
+            cursor = self._cursor()
+            try:
+                return _read_csv_dtypes(cursor.execute(sql, parameters).df())
+            finally:
+                cursor.close()
+
+        return await asyncio.to_thread(run)
+
+
+engine = AnalyticsEngine(SNAPSHOT_DIR, THREADS)
+
+
+def current_snapshot() -> tuple[str, datetime] | None:
+    # Name and publication time of the snapshot the dashboards read, None on
+    # the postgres backend. Cache keys and validators follow it as well as the
+    # data version, since exporting changes the dashboards without a write.
+    if BACKEND != "duckdb":
+        return None
+    pointer = engine.directory / "CURRENT"
+    try:
+        published_at = datetime.fromtimestamp(pointer.stat().st_mtime, timezone.utc)
+        return pointer.read_text().strip(), published_at
+    except FileNotFoundError:
+        return None
+
+
+async def _main(directory: Path) -> None:
+    from api.database import SessionLocal
+    from api.database import engine as db_engine
+
+    start = time.perf_counter()
+    async with SessionLocal() as db:
+        target = await export_snapshot(db, directory)
+    await db_engine.dispose()
+    print(f"wrote {target} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Snapshot the cohort tables to Parquet for the DuckDB backend"
+    )
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--dir", type=Path, default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+    asyncio.run(_main(args.dir))
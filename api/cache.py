@@ -0,0 +1,63 @@
+import os
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+
+class ResultCache:
+    # An LRU cache of rendered results, bounded by entry count and total size.
+    # Keys include the data version, so entries for old data are never served
+    # and simply age out of the LRU order.
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[str, int]] = OrderedDict()
+        self.stats = CacheStats()
+
+    def get(self, key: Hashable) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: str) -> None:
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.stats.size_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.stats.size_bytes += size
+        while (
+            len(self._entries) > self.max_entries
+            or self.stats.size_bytes > self.max_bytes
+        ):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.stats.size_bytes -= evicted_size
+            self.stats.evictions += 1
+        self.stats.entries = len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.stats.entries = 0
+        self.stats.size_bytes = 0
+
+
+# Shared by the dashboards in api.services, and importable without loading them
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("TEIKO_CACHE_MAX_ENTRIES", 64)),
+    max_bytes=int(os.environ.get("TEIKO_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
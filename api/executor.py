@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import TypeVar
+
+from api.metrics import call_collecting_stages, record_stage
+
+T = TypeVar("T")
+
+
+# Where api.services runs its CPU-bound rendering (pivots, t-tests, plotly and
+# to_html): "inline" in the request, "thread" in the default thread pool, or
+# "process" in a pool of worker processes, which frees the event loop and the
+# GIL so one heavy page does not stall every other request on the worker.
+# Work sent to processes takes DataFrames read through COPY, which pickle as a
+# few numpy arrays, and returns the rendered page.
+EXECUTION_MODE = os.environ.get("TEIKO_ANALYSIS_EXECUTOR", "inline")
+WORKERS = int(os.environ.get("TEIKO_ANALYSIS_WORKERS", os.cpu_count() or 1))
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Forking would copy the event loop and pooled connections into the
+        # workers, so they are spawned and import api.services themselves
+        _pool = ProcessPoolExecutor(
+            max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def run_cpu(fn: Callable[..., T], *args) -> T:
+    # fn and its arguments must be picklable in "process" mode, i.e. fn is a
+    # module-level function
+    if EXECUTION_MODE == "process":
+        # Stages timed in the worker are sent back with the result and
+        # recorded for the request here
+        loop = asyncio.get_running_loop()
+        result, stages = await loop.run_in_executor(
+            _get_pool(), partial(call_collecting_stages, fn, *args)
+        )
+        for timing in stages:
+            record_stage(timing)
+        return result
+    if EXECUTION_MODE == "thread":
+        # to_thread copies the context, so stages land in the request's list
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+async def start(warm_up: Callable[[], None]) -> None:
+    # Spawns every worker process and runs warm_up in each, so the first
+    # requests do not wait for the workers to import the analysis stack
+    if EXECUTION_MODE != "process":
+        return
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    await asyncio.gather(*[loop.run_in_executor(pool, warm_up) for _ in range(WORKERS)])
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,113 @@
+import io
+import json
+from collections.abc import AsyncIterator, Sequence
+from typing import Literal
+
+from sqlalchemy import Row, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud import (
+    COHORT_COLUMNS,
+    FREQUENCY_COLUMNS,
+    SAMPLE_COLUMNS,
+    cohort_rows_stmt,
+    sample_rows_stmt,
+    stream_rows,
+)
+
+
+ExportFormat = Literal["ndjson", "arrow"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+DEFAULT_SAMPLE_COLUMNS = [*SAMPLE_COLUMNS, *FREQUENCY_COLUMNS]
+DEFAULT_COHORT_COLUMNS = list(COHORT_COLUMNS)
+
+
+def export_samples(
+    db: AsyncSession,
+    columns: list[str] | None,
+    filters: dict,
+    output_format: ExportFormat,
+    batch_size: int = 10000,
+) -> AsyncIterator[bytes]:
+    # One row per sample. Unknown columns raise ValueError here, before the
+    # response starts, rather than partway through the stream.
+    stmt = sample_rows_stmt(columns or DEFAULT_SAMPLE_COLUMNS, **filters)
+    return _encode(db, stmt, output_format, batch_size)
+
+
+def export_cohort(
+    db: AsyncSession,
+    columns: list[str] | None,
+    filters: dict,
+    populations: list[str] | None,
+    output_format: ExportFormat,
+    batch_size: int = 10000,
+) -> AsyncIterator[bytes]:
+    # One row per sample and population, as in sample_frequency
+    stmt = cohort_rows_stmt(
+        columns or DEFAULT_COHORT_COLUMNS, **filters, populations=populations
+    )
+    return _encode(db, stmt, output_format, batch_size)
+
+
+def _encode(
+    db: AsyncSession, stmt: Select, output_format: ExportFormat, batch_size: int
+) -> AsyncIterator[bytes]:
+    batches = stream_rows(db, stmt, batch_size)
+    if output_format == "arrow":
+        # pyarrow is optional, so a missing install fails the request up front
+        import pyarrow  # type: ignore # noqa: F401
+
+        return _arrow_stream(stmt, batches)
+    return _ndjson_stream(stmt, batches)
+
+
+async def _ndjson_stream(
+    stmt: Select, batches: AsyncIterator[Sequence[Row]]
+) -> AsyncIterator[bytes]:
+    names = [column.name for column in stmt.selected_columns]
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    async for rows in batches:
+        yield "".join(
+            encoder.encode(dict(zip(names, row))) + "\n" for row in rows
+        ).encode()
+
+
+async def _arrow_stream(
+    stmt: Select, batches: AsyncIterator[Sequence[Row]]
+) -> AsyncIterator[bytes]:
+    import pyarrow as pa  # type: ignore
+
+    types = {
+        str: pa.string(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+    }
+    schema = pa.schema(
+        [
+            (column.name, types[column.type.python_type])
+            for column in stmt.selected_columns
+        ]
+    )
+    # Each batch is written as one IPC record batch and sent as soon as it is
+    # encoded, so clients can read the stream incrementally
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for rows in batches:
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # Closing the writer adds the end-of-stream marker, and the schema alone
+    # when there were no rows
+    yield sink.getvalue()
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import io
+import time
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import asdict, dataclass
+
+import asyncpg  # type: ignore
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud import (
+    bump_data_version,
+    maintain_percentage_aggregates,
+    refresh_sample_frequencies,
+)
+from api.models import POPULATIONS
+from api.profiler import record_query
+
+
+CSV_COLUMNS = [
+    "project",
+    "subject",
+    "condition",
+    "age",
+    "sex",
+    "treatment",
+    "response",
+    "sample",
+    "sample_type",
+    "time_from_treatment_start",
+    *POPULATIONS,
+]
+REQUIRED_COLUMNS = {"project", "subject", "sample"}
+
+# Each batch is copied into a temp table that is dropped when its transaction
+# commits, then merged with set-based upserts. Conflicting rows are only
+# rewritten when a value actually changed, so re-loading a file is cheap.
+STAGING_DDL = """
+CREATE TEMP TABLE ingest_staging (
+    project VARCHAR(100),
+    subject VARCHAR(100),
+    condition VARCHAR(100),
+    age INT,
+    sex VARCHAR(100),
+    treatment VARCHAR(100),
+    response VARCHAR(100),
+    sample VARCHAR(100),
+    sample_type VARCHAR(100),
+    time_from_treatment_start INT,
+    b_cell INT,
+    cd8_t_cell INT,
+    cd4_t_cell INT,
+    nk_cell INT,
+    monocyte INT
+) ON COMMIT DROP
+"""
+
+# The subjects whose contributions to percentage_aggregate the batch can
+# change, since it writes their treatments, and its samples, which can be moving
+# from another subject
+AGGREGATED_SUBJECTS = """
+SELECT DISTINCT subject
+FROM ingest_staging
+WHERE subject IS NOT NULL
+"""
+
+AGGREGATED_SAMPLES = """
+SELECT DISTINCT sample
+FROM ingest_staging
+WHERE sample IS NOT NULL
+"""
+
+UPSERT_PROJECTS = """
+INSERT INTO project (project_id)
+SELECT DISTINCT project
+FROM ingest_staging
+WHERE project IS NOT NULL
+ON CONFLICT (project_id) DO NOTHING
+"""
+
+UPSERT_SUBJECTS = """
+INSERT INTO subject AS s (subject_id, age, sex)
+SELECT DISTINCT ON (subject) subject, age, sex
+FROM ingest_staging
+WHERE subject IS NOT NULL
+ORDER BY subject
+ON CONFLICT (subject_id) DO UPDATE
+SET age = EXCLUDED.age, sex = EXCLUDED.sex
+WHERE (s.age, s.sex) IS DISTINCT FROM (EXCLUDED.age, EXCLUDED.sex)
+"""
+
+UPSERT_SAMPLES = """
+INSERT INTO sample AS s (
+    sample_id,
+    sample_type,
+    time_from_treatment_start,
+    b_cell,
+    cd8_t_cell,
+    cd4_t_cell,
+    nk_cell,
+    monocyte,
+    subject_id
+)
+SELECT DISTINCT ON (sample)
+    sample,
+    sample_type,
+    time_from_treatment_start,
+    b_cell,
+    cd8_t_cell,
+    cd4_t_cell,
+    nk_cell,
+    monocyte,
+    subject
+FROM ingest_staging
+WHERE sample IS NOT NULL
+AND subject IS NOT NULL
+ORDER BY sample
+ON CONFLICT (sample_id) DO UPDATE
+SET sample_type = EXCLUDED.sample_type,
+    time_from_treatment_start = EXCLUDED.time_from_treatment_start,
+    b_cell = EXCLUDED.b_cell,
+    cd8_t_cell = EXCLUDED.cd8_t_cell,
+    cd4_t_cell = EXCLUDED.cd4_t_cell,
+    nk_cell = EXCLUDED.nk_cell,
+    monocyte = EXCLUDED.monocyte,
+    subject_id = EXCLUDED.subject_id
+WHERE (
+    s.sample_type,
+    s.time_from_treatment_start,
+    s.b_cell,
+    s.cd8_t_cell,
+    s.cd4_t_cell,
+    s.nk_cell,
+    s.monocyte,
+    s.subject_id
+) IS DISTINCT FROM (
+    EXCLUDED.sample_type,
+    EXCLUDED.time_from_treatment_start,
+    EXCLUDED.b_cell,
+    EXCLUDED.cd8_t_cell,
+    EXCLUDED.cd4_t_cell,
+    EXCLUDED.nk_cell,
+    EXCLUDED.monocyte,
+    EXCLUDED.subject_id
+)
+RETURNING s.sample_id, (xmax = 0) AS inserted
+"""
+
+UPSERT_SUBJECT_CONDITIONS = """
+INSERT INTO subject_condition (subject_id, condition_name)
+SELECT DISTINCT subject, condition
+FROM ingest_staging
+WHERE subject IS NOT NULL
+AND condition IS NOT NULL
+ON CONFLICT (subject_id, condition_name) DO NOTHING
+"""
+
+UPSERT_TREATMENTS = """
+INSERT INTO treatment AS t (
+    subject_id,
+    subject_condition_name,
+    treatment_name,
+    response
+)
+SELECT DISTINCT ON (subject, condition, treatment)
+    subject,
+    condition,
+    treatment,
+    CASE LOWER(response)
+        WHEN 'yes' THEN TRUE
+        WHEN 'no' THEN FALSE
+        ELSE NULL
+    END
+FROM ingest_staging
+WHERE subject IS NOT NULL
+AND condition IS NOT NULL
+AND treatment IS NOT NULL
+ORDER BY subject, condition, treatment
+ON CONFLICT (subject_id, subject_condition_name, treatment_name) DO UPDATE
+SET response = EXCLUDED.response
+WHERE t.response IS DISTINCT FROM EXCLUDED.response
+"""
+
+UPSERT_PROJECT_SUBJECTS = """
+INSERT INTO project_subjects (project_id, subject_id)
+SELECT DISTINCT project, subject
+FROM ingest_staging
+WHERE project IS NOT NULL
+AND subject IS NOT NULL
+ON CONFLICT (project_id, subject_id) DO NOTHING
+"""
+
+
+@dataclass
+class IngestReport:
+    rows: int = 0
+    batches: int = 0
+    samples_inserted: int = 0
+    samples_updated: int = 0
+    other_rows_written: int = 0
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+
+class IngestError(Exception):
+    # A batch the database rejected, raised by SQLAlchemy or, for the COPY, by
+    # the driver. Each batch is its own transaction, so the report counts the
+    # batches committed before it.
+
+    def __init__(self, error: Exception, report: IngestReport):
+        super().__init__(str(getattr(error, "orig", error)))
+        self.error = error
+        self.report = report
+
+
+async def _read_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    # Re-split arbitrary byte chunks into lines. Fields are not expected to
+    # contain quoted newlines, as in cell-count.csv.
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line + b"\n"
+    if pending.strip():
+        yield pending + b"\n"
+
+
+async def _load_batch(
+    db: AsyncSession, columns: list[str], lines: list[bytes], report: IngestReport
+) -> None:
+    await db.execute(text(STAGING_DDL))
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    start = time.perf_counter()
+    await raw_connection.driver_connection.copy_to_table(  # type: ignore
+        "ingest_staging",
+        source=io.BytesIO(b"".join(lines)),
+        columns=columns,
+        format="csv",
+    )
+    record_query(
+        f"COPY ingest_staging ({', '.join(columns)}) FROM STDIN",
+        time.perf_counter() - start,
+        len(lines),
+    )
+
+    written = 0
+    subject_ids = list((await db.scalars(text(AGGREGATED_SUBJECTS))).all())
+    sample_ids = list((await db.scalars(text(AGGREGATED_SAMPLES))).all())
+    async with maintain_percentage_aggregates(db, subject_ids, sample_ids):
+        for stmt in [UPSERT_PROJECTS, UPSERT_SUBJECTS]:
+            written += (await db.execute(text(stmt))).rowcount  # type: ignore
+        samples = (await db.execute(text(UPSERT_SAMPLES))).all()
+        if samples:
+            await refresh_sample_frequencies(
+                db, [sample.sample_id for sample in samples]
+            )
+        for stmt in [
+            UPSERT_SUBJECT_CONDITIONS,
+            UPSERT_TREATMENTS,
+            UPSERT_PROJECT_SUBJECTS,
+        ]:
+            written += (await db.execute(text(stmt))).rowcount  # type: ignore
+
+    if samples or written:
+        await bump_data_version(db)
+    await db.commit()
+
+    report.rows += len(lines)
+    report.batches += 1
+    report.samples_inserted += sum(1 for sample in samples if sample.inserted)
+    report.samples_updated += sum(1 for sample in samples if not sample.inserted)
+    report.other_rows_written += written
+
+
+async def ingest_csv(
+    db: AsyncSession, chunks: AsyncIterable[bytes], batch_rows: int = 50000
+) -> IngestReport:
+    # Raises ValueError for an unexpected header, and IngestError when the
+    # database rejects a batch
+    report = IngestReport()
+    start = time.perf_counter()
+    columns: list[str] | None = None
+    batch: list[bytes] = []
+
+    async def load() -> None:
+        assert columns is not None
+        try:
+            await _load_batch(db, columns, batch, report)
+        except (DBAPIError, asyncpg.PostgresError) as e:
+            await db.rollback()
+            _finish(report, start)
+            raise IngestError(e, report) from e
+
+    async for line in _read_lines(chunks):
+        if columns is None:
+            columns = [c.strip() for c in line.decode().strip().split(",")]
+            unknown = set(columns) - set(CSV_COLUMNS)
+            missing = REQUIRED_COLUMNS - set(columns)
+            if unknown or missing:
+                raise ValueError(
+                    f"Unexpected CSV header: unknown columns {sorted(unknown)}, "
+                    f"missing columns {sorted(missing)}"
+                )
+            continue
+        batch.append(line)
+        if len(batch) >= batch_rows:
+            await load()
+            batch = []
+    if batch and columns is not None:
+        await load()
+    return _finish(report, start)
+
+
+def _finish(report: IngestReport, start: float) -> IngestReport:
+    report.seconds = time.perf_counter() - start
+    report.rows_per_second = report.rows / report.seconds if report.seconds else 0.0
+    return report
+
+
+async def _file_chunks(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+async def _main(path: str, batch_rows: int) -> None:
+    from api.database import SessionLocal, engine
+
+    error = None
+    async with SessionLocal() as db:
+        try:
+            report = await ingest_csv(db, _file_chunks(path), batch_rows)
+        except IngestError as e:
+            error, report = e, e.report
+    await engine.dispose()
+    for name, value in asdict(report).items():
+        print(
+            f"{name}: {value:,.1f}" if isinstance(value, float) else f"{name}: {value}"
+        )
+    if error is not None:
+        raise SystemExit(f"Batch {report.batches + 1} was rejected: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stream a cell-count CSV into the database"
+    )
+    parser.add_argument("path")
+    parser.add_argument("--batch-rows", type=int, default=50000)
+    args = parser.parse_args()
+    asyncio.run(_main(args.path, args.batch_rows))
@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+import logging
+import os
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Literal
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud import (
+    claim_analysis_job,
+    create_analysis_job,
+    finish_analysis_job,
+    get_data_version,
+    requeue_analysis_jobs,
+)
+from api.database import SessionLocal
+from api.metrics import collecting_stages, request_metrics
+from api.profiler import profiling
+from api.models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+# The api.services analyses that can run as background jobs. Each takes the
+# session followed by JSON-serializable keyword parameters.
+JOB_ANALYSES = [
+    "statistical_analysis",
+    "statistical_screen",
+    "longitudinal_analysis",
+    "data_subset_analysis",
+]
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+WORKERS = int(os.environ.get("TEIKO_JOB_WORKERS", 2))
+POLL_INTERVAL_S = float(os.environ.get("TEIKO_JOB_POLL_S", 5))
+# The longest a job may run, after which it fails and may be claimed again.
+# Also the statement timeout of its queries, which may run far longer than
+# those of requests.
+TIMEOUT_S = float(os.environ.get("TEIKO_JOB_TIMEOUT_S", 3600))
+
+
+def _analysis(name: str) -> Callable[..., Awaitable[str]]:
+    if name not in JOB_ANALYSES:
+        raise ValueError(f"Unknown analysis {name!r}, expected one of {JOB_ANALYSES}")
+    from api import services
+
+    return getattr(services, name)
+
+
+def normalize_params(analysis: str, params: dict) -> dict:
+    # Every parameter with its default filled in, so submissions that only
+    # differ in spelled out defaults are deduplicated
+    try:
+        bound = inspect.signature(_analysis(analysis)).bind(None, **params)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for {analysis}: {e}")
+    bound.apply_defaults()
+    return dict(list(bound.arguments.items())[1:])
+
+
+def media_type(params: dict) -> str:
+    if params.get("output_format") == "json":
+        return "application/json"
+    return "text/html"
+
+
+async def submit_job(
+    db: AsyncSession, analysis: str, params: dict
+) -> tuple[AnalysisJob, bool]:
+    # Raises ValueError for unknown analyses and parameters. The job is keyed
+    # by the current data version, so a write makes resubmissions run again.
+    params = normalize_params(analysis, params)
+    job, created = await create_analysis_job(
+        db, analysis, params, await get_data_version(db)
+    )
+    if created:
+        job_workers.notify()
+    return job, created
+
+
+def job_summary(job: AnalysisJob) -> dict:
+    return {
+        "job_id": str(job.job_id),
+        "analysis": job.analysis,
+        "params": job.params,
+        "data_version": job.data_version,
+        "status": job.status,
+        "media_type": job.media_type,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobWorkers:
+    # Runs queued jobs as tasks on the event loop of this process, at most
+    # `workers` at a time. The analyses render through api.executor, so the
+    # heavy work still leaves the loop when it is configured to.
+
+    def __init__(self, workers: int, poll_interval_s: float, timeout_s: float):
+        self.workers = workers
+        self.poll_interval_s = poll_interval_s
+        self.timeout_s = timeout_s
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[uuid.UUID, asyncio.Task] = {}
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Jobs interrupted by the shutdown go back to the queue rather than
+        # waiting out the timeout
+        running = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        async with SessionLocal() as db:
+            await requeue_analysis_jobs(db, running)
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def cancel(self, job_id: uuid.UUID) -> None:
+        # Jobs running in other processes are left to finish, and their
+        # result is discarded by finish_analysis_job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                async with SessionLocal() as db:
+                    job = await claim_analysis_job(db, self.timeout_s)
+            except Exception:
+                logger.exception("Claiming an analysis job failed")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval_s)
+                except TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: AnalysisJob) -> None:
+        assert job.started_at is not None
+        # A job is claimed again once it has run for timeout_s, so it is
+        # stopped by then rather than running twice
+        task = asyncio.create_task(asyncio.wait_for(self._compute(job), self.timeout_s))
+        self._running[job.job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            # Either the job was cancelled, and its row already says so, or
+            # the worker itself is stopping
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            return
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                error = f"Timed out after {self.timeout_s:g}s"
+                logger.error("Analysis job %s timed out", job.job_id)
+            else:
+                error = repr(e)
+                logger.exception("Analysis job %s failed", job.job_id)
+            async with SessionLocal() as db:
+                await finish_analysis_job(
+                    db, job.job_id, job.started_at, "failed", error=error
+                )
+            return
+        finally:
+            self._running.pop(job.job_id, None)
+        async with SessionLocal() as db:
+            await finish_analysis_job(
+                db,
+                job.job_id,
+                job.started_at,
+                "succeeded",
+                media_type=media_type(job.params),
+                result=result,
+            )
+
+    async def _compute(self, job: AnalysisJob) -> str:
+        async with SessionLocal() as db:
+            await db.execute(
+                select(
+                    func.set_config(
+                        "statement_timeout", str(int(self.timeout_s * 1000)), True
+                    )
+                )
+            )
+            # Recorded under their own endpoint, like the stages of requests
+            with collecting_stages() as stages, profiling(f"job:{job.analysis}"):
+                result = await _analysis(job.analysis)(db, **job.params)
+            request_metrics.observe_stages(f"job:{job.analysis}", stages)
+            return result
+
+
+job_workers = JobWorkers(WORKERS, POLL_INTERVAL_S, TIMEOUT_S)
@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import stats  # type: ignore
+
+
+@dataclass
+class Trajectories:
+    subject_ids: np.ndarray
+    time_points: np.ndarray
+    # Per subject: 1.0 for responders, 0.0 for non-responders, NaN if unknown
+    response: np.ndarray
+    # Percentages by subject, time point and population, NaN where the subject
+    # has no sample at that time point
+    values: np.ndarray
+
+
+def build_trajectories(
+    subject_ids: np.ndarray,
+    time_points: np.ndarray,
+    response: np.ndarray,
+    values: np.ndarray,
+) -> Trajectories:
+    # Builds the dense array from one row per sample in a single pass: subjects
+    # and time points are coded to integers and each population is scattered
+    # with one weighted bincount. Several samples of a subject at a time point
+    # (e.g. of different sample types) are averaged, and a subject's response
+    # is the one of its first row.
+    subjects, first_rows, subject_codes = np.unique(
+        subject_ids, return_index=True, return_inverse=True
+    )
+    times, time_codes = np.unique(time_points, return_inverse=True)
+    n_cells = len(subjects) * len(times)
+    cells = subject_codes * len(times) + time_codes
+    dense = np.full((n_cells, values.shape[1]), np.nan)
+    for i in range(values.shape[1]):
+        present = ~np.isnan(values[:, i])
+        counts = np.bincount(cells[present], minlength=n_cells)
+        sums = np.bincount(cells[present], values[present, i], minlength=n_cells)
+        with np.errstate(invalid="ignore"):
+            dense[:, i] = sums / counts
+    return Trajectories(
+        subject_ids=subjects,
+        time_points=times,
+        response=np.asarray(response, dtype=float)[first_rows],
+        values=dense.reshape(len(subjects), len(times), values.shape[1]),
+    )
+
+
+def deltas_from_baseline(trajectories: Trajectories) -> np.ndarray:
+    # Change from the first time point, (n_subjects, n_times - 1, n_populations)
+    values = trajectories.values
+    return values[:, 1:, :] - values[:, :1, :]
+
+
+def nan_moments(x: np.ndarray, axis: int = 0) -> tuple[np.ndarray, ...]:
+    # Count, mean and sample variance along axis, ignoring NaN. Slices with
+    # fewer than two values give NaN rather than warnings.
+    present = ~np.isnan(x)
+    n = present.sum(axis=axis)
+    filled = np.where(present, x, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=axis) / n
+        squares = np.where(present, (x - np.expand_dims(mean, axis)) ** 2, 0.0)
+        var = squares.sum(axis=axis) / (n - 1)
+    return n, mean, var
+
+
+def paired_tests(trajectories: Trajectories) -> dict[str, np.ndarray]:
+    # Paired t-tests of each later time point against baseline, and Welch
+    # t-tests of responder vs non-responder changes, for every time point and
+    # population at once over subjects with both samples. Every array is
+    # (n_times - 1, n_populations).
+    deltas = deltas_from_baseline(trajectories)
+    n, mean, var = nan_moments(deltas)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = mean / np.sqrt(var / n)
+    p = 2 * stats.t.sf(np.abs(t), n - 1)
+
+    response = trajectories.response
+    r_n, r_mean, r_var = nan_moments(deltas[response == 1])
+    nr_n, nr_mean, nr_var = nan_moments(deltas[response == 0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        _, response_p = stats.ttest_ind_from_stats(
+            r_mean, np.sqrt(r_var), r_n, nr_mean, np.sqrt(nr_var), nr_n, equal_var=False
+        )
+    return {
+        "n": n,
+        "mean_delta": mean,
+        "sd_delta": np.sqrt(var),
+        "t": t,
+        "p_value": np.asarray(p, dtype=float),
+        "responders_n": r_n,
+        "responders_mean_delta": r_mean,
+        "non_responders_n": nr_n,
+        "non_responders_mean_delta": nr_mean,
+        "response_p_value": np.asarray(response_p, dtype=float),
+    }
+
+
+def repeated_measures(trajectories: Trajectories) -> dict[str, np.ndarray]:
+    # One-way repeated-measures ANOVA of time for every population, over the
+    # subjects sampled at every time point. The sums of squares are reduced
+    # over the masked array, so every array is (n_populations,).
+    values = trajectories.values
+    n_times = values.shape[1]
+    complete = ~np.isnan(values).any(axis=1)
+    n = complete.sum(axis=0)
+    if n_times < 2:
+        nan = np.full(values.shape[2], np.nan)
+        return {"n": n, "f": nan, "p_value": nan}
+    mask = complete[:, None, :]
+    filled = np.where(mask, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grand = filled.sum(axis=(0, 1)) / (n * n_times)
+        time_means = filled.sum(axis=0) / n
+        subject_means = filled.mean(axis=1)
+        ss_time = n * ((time_means - grand) ** 2).sum(axis=0)
+        ss_subjects = n_times * np.where(
+            complete, (subject_means - grand) ** 2, 0.0
+        ).sum(axis=0)
+        ss_total = np.where(mask, (values - grand) ** 2, 0.0).sum(axis=(0, 1))
+        ss_error = ss_total - ss_time - ss_subjects
+        df_time = n_times - 1
+        df_error = (n - 1) * df_time
+        f = (ss_time / df_time) / (ss_error / df_error)
+    p = stats.f.sf(f, df_time, df_error)
+    return {"n": n, "f": f, "p_value": np.asarray(p, dtype=float)}
+
+
+def mean_trajectories(trajectories: Trajectories) -> dict[str, np.ndarray]:
+    # Mean percentage and its standard error by time point and population for
+    # all subjects, responders and non-responders, (n_times, n_populations)
+    out = {}
+    response = trajectories.response
+    for prefix, subjects in [
+        ("all", slice(None)),
+        ("responders", response == 1),
+        ("non_responders", response == 0),
+    ]:
+        n, mean, var = nan_moments(trajectories.values[subjects])
+        out[f"{prefix}_n"] = n
+        out[f"{prefix}_mean"] = mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[f"{prefix}_sem"] = np.sqrt(var / n)
+    return out
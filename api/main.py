@@ -1,9 +1,33 @@
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 
+from api import executor
+from api.database import engine
+from api.jobs import job_workers
+from api.metrics import (
+    CompressionMiddleware,
+    StageMetricsMiddleware,
+    request_metrics,
+    startup_times,
+)
+from api.profiler import QueryProfileMiddleware
 from api.routers import (
+    bulk_router,
+    data_router,
+    debug_router,
+    ingest_router,
+    jobs_router,
     projects_router,
+    static_router,
     # subjects_router,
     # samples_router,
     # treatments_router,
@@ -11,16 +35,74 @@ from api.routers import (
 )
 
 
-app = FastAPI()
+def warm_up() -> None:
+    start = time.perf_counter()
+    from api import services
+
+    services.warm_up()
+    startup_times["warm_up_s"] = time.perf_counter() - start
+
+
+async def start_workers() -> None:
+    # Worker processes of the "process" analysis executor warm up the same way
+    start = time.perf_counter()
+    from api import services
+
+    await executor.start(services.warm_up)
+    startup_times["workers_s"] = time.perf_counter() - start
+
+
+async def warm_up_all() -> None:
+    await asyncio.to_thread(warm_up)
+    await start_workers()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # The analysis stack is loaded off the event loop, by default while the app
+    # already serves requests. "startup" holds the app back until it is loaded,
+    # and "off" leaves it to the first dashboard request.
+    mode = os.environ.get("TEIKO_WARM_UP", "background")
+    task = None
+    if mode == "startup":
+        await warm_up_all()
+    elif mode == "background":
+        task = asyncio.create_task(warm_up_all())
+    job_workers.start()
+    yield
+    await job_workers.stop()
+    if task is not None:
+        await task
+    executor.shutdown()
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("TEIKO_GZIP_MIN_SIZE", 1000)),
+    compresslevel=int(os.environ.get("TEIKO_GZIP_LEVEL", 6)),
+)
+app.add_middleware(StageMetricsMiddleware)
+app.add_middleware(QueryProfileMiddleware)
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        request_metrics.exposition(),
+        media_type="text/plain; version=0.0.4",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
 @app.get("/html", response_class=HTMLResponse)
-def read_html():
+async def read_html():
     from api.services import basic_html
 
     return basic_html()
@@ -28,6 +110,18 @@ def read_html():
 
 app.include_router(user_stories_router, prefix="", tags=["user_stories"])
 app.include_router(projects_router, prefix="/projects", tags=["projects"])
+app.include_router(data_router, prefix="", tags=["data"])
+app.include_router(bulk_router, prefix="/bulk", tags=["bulk"])
+app.include_router(ingest_router, prefix="/ingest", tags=["ingest"])
+app.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
+app.include_router(debug_router, prefix="/debug", tags=["debug"])
+# Versioned assets such as plotly.js are routed before the client files
+app.include_router(static_router, prefix="/client", tags=["static"])
+app.mount(
+    "/client",
+    StaticFiles(directory=Path(__file__).resolve().parent.parent / "client"),
+    name="client",
+)
 # app.include_router(subjects_router, prefix="/subjects", tags=["subjects"])
 # app.include_router(samples_router, prefix="/samples", tags=["samples"])
 # app.include_router(treatments_router, prefix="/treatments", tags=["treatments"])
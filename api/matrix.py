@@ -0,0 +1,292 @@
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import POPULATIONS
+
+if TYPE_CHECKING:
+    import pandas as pd  # type: ignore
+
+
+# Directory of the shared cell-count matrix, one subdirectory per data version.
+# Unset, analyses read their samples from the database as before. Every worker
+# process memory-maps the same read-only files, so the counts are paged in once
+# per machine rather than copied into each worker, and analyses sent to the
+# api.executor processes pass the store's path instead of pickled frames.
+DIRECTORY = os.environ.get("TEIKO_MATRIX_DIR") or None
+
+# Seconds a superseded version is kept after the next one is written, longer
+# than an analysis runs, since api.executor processes open a store by the path
+# they were sent and a worker can still hold the path of the previous version
+GRACE_S = float(os.environ.get("TEIKO_MATRIX_GRACE_S", 900))
+
+# Counts that are NULL in the database, which int32 cannot hold otherwise
+MISSING = np.iinfo(np.int32).min
+
+
+@dataclass
+class MatrixStore:
+    path: Path
+    version: int
+    # (n_samples, n_populations) counts in POPULATIONS order. Rows are sorted by
+    # sample type and time point, so each combination is a contiguous block.
+    counts: np.ndarray
+    # Dictionary-encoded dimensions, -1 where the value is NULL
+    subject_codes: np.ndarray
+    subjects: np.ndarray
+    sample_type_codes: np.ndarray
+    sample_types: np.ndarray
+    time_codes: np.ndarray
+    times: np.ndarray
+    # (n_blocks, 4) rows of sample type code, time code, start and stop
+    blocks: np.ndarray
+    # Sorted sample ids and the row each is stored at
+    sample_ids: np.ndarray
+    sample_rows: np.ndarray
+
+    @classmethod
+    def open(cls, path: Path) -> "MatrixStore":
+        meta = json.loads((path / "meta.json").read_text())
+        if meta["populations"] != POPULATIONS:
+            raise ValueError(f"{path} holds populations {meta['populations']}")
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r")
+            for name in [
+                "counts",
+                "subject_codes",
+                "subjects",
+                "sample_type_codes",
+                "sample_types",
+                "time_codes",
+                "times",
+                "blocks",
+                "sample_ids",
+                "sample_rows",
+            ]
+        }
+        return cls(path=path, version=meta["version"], **arrays)
+
+    def rows(self, sample_ids: list[str]) -> np.ndarray:
+        positions = np.searchsorted(self.sample_ids, sample_ids)
+        found = positions < len(self.sample_ids)
+        found[found] = (
+            self.sample_ids[positions[found]]
+            == np.asarray(sample_ids, dtype=str)[found]
+        )
+        if not found.all():
+            missing = np.asarray(sample_ids)[~found][:5].tolist()
+            raise KeyError(f"Samples not in {self.path}: {missing}")
+        return self.sample_rows[positions]
+
+    def block_slices(
+        self,
+        sample_types: list[str] | None = None,
+        time_points: list[int] | None = None,
+    ) -> list[slice]:
+        # The row ranges of the matching blocks. Slicing the store's arrays
+        # with them gives views of the mapped files, so nothing is copied.
+        blocks = self.blocks
+        keep = np.ones(len(blocks), dtype=bool)
+        if sample_types:
+            codes = np.flatnonzero(np.isin(self.sample_types, sample_types))
+            keep &= np.isin(blocks[:, 0], codes)
+        if time_points:
+            codes = np.flatnonzero(np.isin(self.times, time_points))
+            keep &= np.isin(blocks[:, 1], codes)
+        return [slice(start, stop) for _, _, start, stop in blocks[keep].tolist()]
+
+
+def _write_store(frame: "pd.DataFrame", directory: Path, version: int) -> Path:
+    import pandas as pd  # type: ignore
+
+    target = directory / f"v{version}"
+    if target.exists():
+        return target
+    directory.mkdir(parents=True, exist_ok=True)
+    subject_codes, subjects = pd.factorize(frame["subject_id"], sort=True)
+    sample_type_codes, sample_types = pd.factorize(frame["sample_type"], sort=True)
+    time_codes, times = pd.factorize(frame["time"], sort=True)
+    # lexsort is stable, so rows stay in sample id order within a block
+    order = np.lexsort((time_codes, sample_type_codes))
+    sample_type_codes = sample_type_codes[order]
+    time_codes = time_codes[order]
+    keys = sample_type_codes.astype(np.int64) * (len(times) + 1) + time_codes
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    stops = np.concatenate([starts[1:], [len(keys)]])
+    ids = frame["sample_id"].to_numpy(dtype=str)[order]
+    sample_rows = np.argsort(ids, kind="stable")
+    arrays = {
+        "counts": frame[POPULATIONS].fillna(MISSING).to_numpy(dtype=np.int32)[order],
+        "subject_codes": subject_codes.astype(np.int32)[order],
+        "subjects": np.asarray(subjects, dtype=str),
+        "sample_type_codes": sample_type_codes.astype(np.int16),
+        "sample_types": np.asarray(sample_types, dtype=str),
+        "time_codes": time_codes.astype(np.int16),
+        "times": np.asarray(times, dtype=np.int64),
+        "blocks": np.column_stack(
+            [sample_type_codes[starts], time_codes[starts], starts, stops]
+        ).astype(np.int64)
+        if len(keys)
+        else np.empty((0, 4), dtype=np.int64),
+        "sample_ids": ids[sample_rows],
+        "sample_rows": sample_rows.astype(np.int32),
+    }
+    # Written next to the final directory and renamed into place, so workers
+    # never map a partial store
+    staging = Path(tempfile.mkdtemp(dir=directory, prefix=".staging-"))
+    for name, array in arrays.items():
+        np.save(staging / f"{name}.npy", np.ascontiguousarray(array))
+    (staging / "meta.json").write_text(
+        json.dumps({"version": version, "populations": POPULATIONS})
+    )
+    staging.chmod(0o755)
+    os.rename(staging, target)
+    _prune(directory)
+    return target
+
+
+def _prune(directory: Path) -> None:
+    # The two newest versions are kept, and older ones until GRACE_S after the
+    # version that replaced them was written. Mappings already open survive
+    # the removal; the grace period covers readers that have only the path.
+    versions = sorted(directory.glob("v*"), key=lambda p: p.stat().st_mtime)
+    cutoff = time.time() - GRACE_S
+    for old, replacement in zip(versions[:-2], versions[1:-1]):
+        if replacement.stat().st_mtime < cutoff:
+            shutil.rmtree(old)
+
+
+async def build_store(directory: Path) -> Path:
+    # Reads the version and the samples in one REPEATABLE READ transaction, so
+    # the store matches the version it is named after
+    from api.crud import get_data_version, get_sample_count_frame
+    from api.database import SessionLocal
+
+    async with SessionLocal() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        version = await get_data_version(db)
+        if (directory / f"v{version}").exists():
+            return directory / f"v{version}"
+        frame = await get_sample_count_frame(db)
+    return await asyncio.to_thread(_write_store, frame, directory, version)
+
+
+def _lock(directory: Path) -> int:
+    # Serializes builds across the workers sharing the directory
+    directory.mkdir(parents=True, exist_ok=True)
+    fd = os.open(directory / ".lock", os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+_store: MatrixStore | None = None
+_build_lock = asyncio.Lock()
+
+
+async def current_store(db: AsyncSession) -> MatrixStore:
+    # The store of the current data version, built by the first worker that
+    # needs it after a write bumps the version
+    from api.crud import get_data_version
+
+    global _store
+    assert DIRECTORY is not None
+    version = await get_data_version(db)
+    if _store is not None and _store.version == version:
+        return _store
+    directory = Path(DIRECTORY)
+    path = directory / f"v{version}"
+    if not path.exists():
+        async with _build_lock:
+            fd = await asyncio.to_thread(_lock, directory)
+            try:
+                path = await build_store(directory)
+            finally:
+                os.close(fd)
+    _store = open_store(str(path))
+    return _store
+
+
+@lru_cache(maxsize=2)
+def open_store(path: str) -> MatrixStore:
+    return MatrixStore.open(Path(path))
+
+
+@dataclass
+class CohortSelection:
+    # The samples of a cohort in the store, small enough to send to the
+    # api.executor processes, which open the store themselves
+    path: str
+    sample_types: list[str] | None
+    time_points: list[int] | None
+    # Subjects with a matching treatment, and the response of each
+    subject_ids: np.ndarray
+    responses: np.ndarray
+
+    def arrays(self) -> tuple[np.ndarray, ...]:
+        # Subject codes, time points, response and counts as float with NaN
+        # for NULL, one row per selected sample. The cohort's rows are masked
+        # block by block and copied out of the mapping once, into the
+        # contiguous arrays the trajectories are built from.
+        store = open_store(self.path)
+        slices = store.block_slices(self.sample_types, self.time_points)
+        in_cohort = np.zeros(len(store.subjects), dtype=bool)
+        response = np.full(len(store.subjects), np.nan)
+        codes = np.searchsorted(store.subjects, self.subject_ids)
+        known = codes < len(store.subjects)
+        known[known] = store.subjects[codes[known]] == self.subject_ids[known]
+        in_cohort[codes[known]] = True
+        response[codes[known]] = self.responses[known]
+
+        keeps = [in_cohort[store.subject_codes[s]] for s in slices]
+        subject_codes = _gather(store.subject_codes, slices, keeps)
+        # NULL time points (-1) index the NaN appended after the dictionary
+        times = np.append(store.times.astype(float), np.nan)[
+            _gather(store.time_codes, slices, keeps)
+        ]
+        counts = _gather(store.counts, slices, keeps).astype(float)
+        counts[counts == MISSING] = np.nan
+        return subject_codes, times, response[subject_codes], counts
+
+
+def _gather(
+    array: np.ndarray, slices: list[slice], keeps: list[np.ndarray]
+) -> np.ndarray:
+    # Only the kept rows of each block are read from the mapping
+    parts = [array[s][keep] for s, keep in zip(slices, keeps)]
+    return np.concatenate(parts) if parts else np.array(array[:0])
+
+
+async def _main(directory: Path) -> None:
+    from api.database import engine
+
+    fd = _lock(directory)
+    try:
+        path = await build_store(directory)
+    finally:
+        os.close(fd)
+    await engine.dispose()
+    print(f"{path}: {len(MatrixStore.open(path).counts)} samples")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build the shared cell-count matrix for the current data version"
+    )
+    parser.add_argument("--dir", type=Path, default=DIRECTORY)
+    args = parser.parse_args()
+    if args.dir is None:
+        parser.error("set TEIKO_MATRIX_DIR or pass --dir")
+    asyncio.run(_main(args.dir))
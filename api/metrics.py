@@ -0,0 +1,345 @@
+import os
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+@dataclass
+class ResponseSizeStats:
+    responses: int = 0
+    not_modified: int = 0
+    compressed: int = 0
+    body_bytes: int = 0
+    sent_bytes: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.body_bytes / self.sent_bytes if self.sent_bytes else 1.0
+
+
+class ResponseSizeMetrics:
+    # Response counts and sizes per route, before and after compression
+
+    def __init__(self) -> None:
+        self.routes: dict[str, ResponseSizeStats] = {}
+
+    def observe(
+        self,
+        route: str,
+        status: int,
+        body_bytes: int,
+        sent_bytes: int,
+        compressed: bool,
+    ) -> None:
+        stats = self.routes.setdefault(route, ResponseSizeStats())
+        stats.responses += 1
+        stats.not_modified += status == 304
+        stats.compressed += compressed
+        stats.body_bytes += body_bytes
+        stats.sent_bytes += sent_bytes
+
+    def report(self) -> dict[str, dict]:
+        return {
+            route: {
+                **stats.__dict__,
+                "compression_ratio": round(stats.compression_ratio, 2),
+            }
+            for route, stats in sorted(self.routes.items())
+        }
+
+
+response_sizes = ResponseSizeMetrics()
+
+# Seconds spent in each startup phase, e.g. the lifespan warm-up in api.main
+startup_times: dict[str, float] = {}
+
+
+class CompressionMiddleware:
+    # Gzip-compresses responses over minimum_size bytes and records each
+    # response's size as the app produced it and as it was sent. Wrapping the
+    # gzip middleware lets one object see the body on both sides of it.
+
+    def __init__(
+        self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = 6
+    ) -> None:
+        self.app = app
+        self.gzip = GZipMiddleware(
+            self._measure_body, minimum_size=minimum_size, compresslevel=compresslevel
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sizes = scope["response_sizes"] = {"body": 0, "sent": 0}
+        status = 200
+        compressed = False
+
+        async def send_measured(message: Message) -> None:
+            nonlocal status, compressed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                compressed = any(
+                    name.lower() == b"content-encoding"
+                    for name, _ in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                sizes["sent"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # Route templates keep the number of series bounded
+                    route = getattr(scope.get("route"), "path", "unmatched")
+                    response_sizes.observe(
+                        route, status, sizes["body"], sizes["sent"], compressed
+                    )
+            await send(message)
+
+        await self.gzip(scope, receive, send_measured)
+
+    async def _measure_body(self, scope: Scope, receive: Receive, send: Send) -> None:
+        sizes = scope["response_sizes"]
+
+        async def send_measured(message: Message) -> None:
+            if message["type"] == "http.response.body":
+                sizes["body"] += len(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_measured)
+
+
+T = TypeVar("T")
+
+# Adds a Server-Timing header with the stages of each response, e.g. for the
+# browser's network panel. Stages of a streamed body that run after the
+# headers are sent are only recorded in the histograms.
+SERVER_TIMING = os.environ.get("TEIKO_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 60)
+ROW_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BYTE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+        # Buckets count the values up to and including their bound
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    # Histograms of one metric by label values, in the Prometheus text format
+
+    def __init__(
+        self, name: str, help: str, labels: tuple[str, ...], buckets: tuple
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series: dict[tuple[str, ...], Histogram] = {}
+
+    def observe(self, values: tuple[str, ...], value: float) -> None:
+        histogram = self.series.get(values)
+        if histogram is None:
+            histogram = self.series[values] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def exposition(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, histogram in sorted(self.series.items()):
+            labels = ",".join(
+                f'{name}="{_escape_label(value)}"'
+                for name, value in zip(self.labels, values)
+            )
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{self.name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@dataclass
+class StageTiming:
+    name: str
+    seconds: float = 0.0
+    rows: int | None = None
+
+
+# The stages recorded by the current request or job, None outside of them
+_stages: ContextVar[list[StageTiming] | None] = ContextVar("stages", default=None)
+
+
+def record_stage(timing: StageTiming) -> None:
+    stages = _stages.get()
+    if stages is not None:
+        stages.append(timing)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[StageTiming]:
+    # Times the block as one stage; set rows on the yielded timing to record
+    # how many rows the stage produced
+    timing = StageTiming(name)
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.seconds = time.perf_counter() - start
+        record_stage(timing)
+
+
+class StageClock:
+    # Times consecutive stages of a function without nesting it in blocks:
+    # each lap is one stage, lasting from the previous lap
+
+    def __init__(self) -> None:
+        self._last = time.perf_counter()
+
+    def lap(self, name: str, rows: int | None = None) -> None:
+        now = time.perf_counter()
+        record_stage(StageTiming(name, now - self._last, rows))
+        self._last = now
+
+
+@contextmanager
+def collecting_stages() -> Iterator[list[StageTiming]]:
+    stages: list[StageTiming] = []
+    token = _stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _stages.reset(token)
+
+
+def call_collecting_stages(fn: Callable[..., T], *args) -> tuple[T, list[StageTiming]]:
+    # Runs fn in another process and returns the stages it recorded, which the
+    # caller records in its own context with record_stage
+    with collecting_stages() as stages:
+        return fn(*args), stages
+
+
+class RequestMetrics:
+    # Latency, payload size and per-stage histograms by endpoint, where the
+    # endpoint is a route template (or "job:<analysis>"), so the number of
+    # series stays bounded
+
+    def __init__(self) -> None:
+        self.requests = HistogramFamily(
+            "teiko_request_duration_seconds",
+            "Time from receiving a request to sending the last body chunk.",
+            ("endpoint", "method", "status"),
+            LATENCY_BUCKETS,
+        )
+        self.payloads = HistogramFamily(
+            "teiko_response_body_bytes",
+            "Response body size before compression.",
+            ("endpoint",),
+            BYTE_BUCKETS,
+        )
+        self.stages = HistogramFamily(
+            "teiko_stage_duration_seconds",
+            "Time spent in each stage of a request: query, frame, stats, plot or html.",
+            ("endpoint", "stage"),
+            LATENCY_BUCKETS,
+        )
+        self.rows = HistogramFamily(
+            "teiko_stage_rows",
+            "Rows produced by a stage, e.g. read by a query.",
+            ("endpoint", "stage"),
+            ROW_BUCKETS,
+        )
+
+    def observe_stages(self, endpoint: str, stages: list[StageTiming]) -> None:
+        for timing in stages:
+            self.stages.observe((endpoint, timing.name), timing.seconds)
+            if timing.rows is not None:
+                self.rows.observe((endpoint, timing.name), timing.rows)
+
+    def exposition(self) -> str:
+        families = [self.requests, self.payloads, self.stages, self.rows]
+        return "\n".join(line for f in families for line in f.exposition()) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+def server_timing(stages: list[StageTiming], total_s: float) -> str:
+    # Stages of the same name are summed, e.g. the queries of one dashboard
+    durations: dict[str, float] = {}
+    for timing in stages:
+        durations[timing.name] = durations.get(timing.name, 0.0) + timing.seconds
+    durations["total"] = total_s
+    return ", ".join(f"{name};dur={s * 1000:.1f}" for name, s in durations.items())
+
+
+class StageMetricsMiddleware:
+    # Collects the stages of each request, records them with the request's
+    # latency and body size once the response is sent, and optionally reports
+    # them in a Server-Timing header. Added outside CompressionMiddleware so
+    # it can read the body size that one measured.
+
+    def __init__(self, app: ASGIApp, server_timing: bool = SERVER_TIMING) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 200
+        body_bytes = 0
+
+        with collecting_stages() as stages:
+
+            async def send_timed(message: Message) -> None:
+                nonlocal status, body_bytes
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    if self.server_timing:
+                        value = server_timing(stages, time.perf_counter() - start)
+                        message["headers"] = [
+                            *message.get("headers", []),
+                            (b"server-timing", value.encode()),
+                        ]
+                elif message["type"] == "http.response.body":
+                    body_bytes += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        route = getattr(scope.get("route"), "path", "unmatched")
+                        sizes = scope.get("response_sizes")
+                        request_metrics.requests.observe(
+                            (route, scope["method"], str(status)),
+                            time.perf_counter() - start,
+                        )
+                        request_metrics.payloads.observe(
+                            (route,), sizes["body"] if sizes else body_bytes
+                        )
+                        request_metrics.observe_stages(route, stages)
+                await send(message)
+
+            await self.app(scope, receive, send_timed)
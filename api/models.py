@@ -1,15 +1,29 @@
+import uuid
+from datetime import datetime
 from typing import Optional
 
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
     CheckConstraint,
+    DateTime,
+    Float,
     ForeignKey,
     ForeignKeyConstraint,
     String,
     Integer,
+    Text,
+    Uuid,
+    func,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
+# Immune cell populations counted per sample, in column order
+POPULATIONS = ["b_cell", "cd8_t_cell", "cd4_t_cell", "nk_cell", "monocyte"]
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -110,3 +124,71 @@ class ProjectSubject(Base):
             ["subject_id"], ["subject.subject_id"], ondelete="CASCADE"
         ),
     )
+
+
+class SampleFrequency(Base):
+    __tablename__ = "sample_frequency"
+    sample_id: Mapped[str] = mapped_column(
+        ForeignKey("sample.sample_id", ondelete="CASCADE"), primary_key=True
+    )
+    population: Mapped[str] = mapped_column(String(100), primary_key=True)
+    count: Mapped[Optional[int]]
+    total_count: Mapped[Optional[int]]
+    percentage: Mapped[Optional[float]] = mapped_column(Float)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, default=1)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class PercentageAggregate(Base):
+    # Groups are unique with NULLS NOT DISTINCT, so the mapper's key may hold
+    # nulls; rows are only ever read as columns
+    __tablename__ = "percentage_aggregate"
+    condition_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    treatment_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    sample_type: Mapped[Optional[str]] = mapped_column(String(100))
+    time_from_treatment_start: Mapped[Optional[int]] = mapped_column(Integer)
+    response: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    population: Mapped[str] = mapped_column(String(100), nullable=False)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sum: Mapped[float] = mapped_column(Float, nullable=False)
+    mean: Mapped[float] = mapped_column(Float, nullable=False)
+    m2: Mapped[float] = mapped_column(Float, nullable=False)
+
+    __mapper_args__ = {
+        "primary_key": [
+            condition_name,
+            treatment_name,
+            sample_type,
+            time_from_treatment_start,
+            response,
+            population,
+        ]
+    }
+
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_job"
+    job_id: Mapped[uuid.UUID] = mapped_column(
+        Uuid, primary_key=True, server_default=func.gen_random_uuid()
+    )
+    analysis: Mapped[str] = mapped_column(String(100), nullable=False)
+    params: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    data_version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(20), nullable=False, server_default="queued"
+    )
+    media_type: Mapped[Optional[str]] = mapped_column(String(100))
+    result: Mapped[Optional[str]] = mapped_column(Text)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
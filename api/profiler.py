@@ -0,0 +1,315 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from types import FrameType
+from typing import Any
+
+import greenlet  # type: ignore
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, ExecutionContext
+from sqlalchemy.engine.interfaces import ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Every statement is timed through engine events and aggregated by its
+# normalized text, which costs a few microseconds per statement, so it stays on
+# in production. Statements slower than SLOW_QUERY_MS are logged, and one run
+# REPEAT_THRESHOLD times or more by a single request or job is reported as a
+# repeat, usually a loop that should be one statement.
+ENABLED = os.environ.get("TEIKO_QUERY_PROFILE", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("TEIKO_SLOW_QUERY_MS", 500))
+REPEAT_THRESHOLD = int(os.environ.get("TEIKO_QUERY_REPEAT_THRESHOLD", 5))
+# Entries kept in each ring buffer of /debug/queries
+LOG_SIZE = int(os.environ.get("TEIKO_QUERY_LOG_SIZE", 200))
+# Distinct statements aggregated; later ones are only counted as dropped
+MAX_STATEMENTS = 1000
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+    # Literals and placeholders become ?, and runs of them, as rendered for
+    # IN lists and multi-row VALUES, collapse to one, so a statement has the
+    # same text whatever its parameters. Compiled statements are cached by
+    # SQLAlchemy, so the same strings come back and the cache hits.
+    sql = " ".join(statement.split())
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\$\d+|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\?(?:::[\w ]+)?(?:, \?(?:::[\w ]+)?)+", "?, ...", sql)
+    return re.sub(r"(\([^()]*\))(?:, \1)+", r"\1", sql)
+
+
+def _caller(frame: FrameType | None) -> str | None:
+    # The innermost public api.crud function on the stack, else the innermost
+    # api function. The async API runs statements in a greenlet, whose stack
+    # ends at SQLAlchemy; the awaiting coroutines are on its parent's.
+    crud = private = other = None
+    current = greenlet.getcurrent()
+    while frame is not None or current.parent is not None:
+        if frame is None:
+            current = current.parent
+            frame = current.gr_frame
+            continue
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if module == "api.crud":
+            if not name.startswith("_"):
+                crud = f"{module}.{name}"
+                break
+            private = private or f"{module}.{name}"
+        elif module.startswith("api.") and module != "api.profiler":
+            other = other or f"{module}.{name}"
+        frame = frame.f_back
+    return crud or private or other
+
+
+@dataclass
+class StatementStats:
+    statement: str
+    caller: str | None
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    slow: int = 0
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    caller: str | None
+    duration_ms: float
+    rows: int | None
+    endpoint: str | None
+    at: float
+
+
+@dataclass
+class RepeatRecord:
+    endpoint: str
+    statement: str
+    caller: str | None
+    calls: int
+    total_ms: float
+    at: float
+
+
+@dataclass
+class RequestQueries:
+    # Statements run by one request or job, by normalized text
+    calls: dict[str, int] = field(default_factory=dict)
+    total_ms: dict[str, float] = field(default_factory=dict)
+    callers: dict[str, str | None] = field(default_factory=dict)
+    endpoint: str | None = None
+    # The ASGI scope of a request, whose route is set once it is matched
+    scope: Scope | None = None
+
+    def current_endpoint(self) -> str | None:
+        if self.endpoint is None and self.scope is not None:
+            return getattr(self.scope.get("route"), "path", None)
+        return self.endpoint
+
+
+_request: ContextVar[RequestQueries | None] = ContextVar("queries", default=None)
+
+
+def _timestamp(at: float) -> str:
+    return datetime.fromtimestamp(at, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _entry(record: "QueryRecord | RepeatRecord") -> dict[str, Any]:
+    # Timestamps are kept as floats and only formatted when reported
+    return {**asdict(record), "at": _timestamp(record.at)}
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        slow_query_ms: float,
+        repeat_threshold: int,
+        log_size: int,
+        max_statements: int,
+    ) -> None:
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self.max_statements = max_statements
+        self.statements: dict[str, StatementStats] = {}
+        self.dropped = 0
+        self.recent: deque[QueryRecord] = deque(maxlen=log_size)
+        self.slow: deque[QueryRecord] = deque(maxlen=log_size)
+        self.repeats: deque[RepeatRecord] = deque(maxlen=log_size)
+
+    def record(
+        self,
+        statement: str,
+        seconds: float,
+        rows: int | None,
+        caller: str | None,
+    ) -> None:
+        sql = normalize(statement)
+        ms = seconds * 1000
+        stats = self.statements.get(sql)
+        if stats is None:
+            if len(self.statements) >= self.max_statements:
+                self.dropped += 1
+            else:
+                stats = self.statements[sql] = StatementStats(sql, caller)
+        if stats is not None:
+            stats.calls += 1
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.rows += rows or 0
+        request = _request.get()
+        endpoint = request.current_endpoint() if request is not None else None
+        record = QueryRecord(sql, caller, round(ms, 3), rows, endpoint, time.time())
+        self.recent.append(record)
+        if ms >= self.slow_query_ms:
+            if stats is not None:
+                stats.slow += 1
+            self.slow.append(record)
+            logger.warning(
+                "Slow query: %.1f ms, %s rows, from %s: %s",
+                ms,
+                rows,
+                caller,
+                sql,
+                extra={"query": _entry(record)},
+            )
+        if request is not None:
+            request.calls[sql] = request.calls.get(sql, 0) + 1
+            request.total_ms[sql] = request.total_ms.get(sql, 0.0) + ms
+            request.callers.setdefault(sql, caller)
+
+    def finish(self, endpoint: str, request: RequestQueries) -> None:
+        for sql, calls in request.calls.items():
+            if calls >= self.repeat_threshold:
+                self.repeats.append(
+                    RepeatRecord(
+                        endpoint,
+                        sql,
+                        request.callers[sql],
+                        calls,
+                        round(request.total_ms[sql], 3),
+                        time.time(),
+                    )
+                )
+
+    def report(self, limit: int = 50) -> dict[str, Any]:
+        top = sorted(self.statements.values(), key=lambda s: -s.total_ms)[:limit]
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "repeat_threshold": self.repeat_threshold,
+            "statements": [
+                {
+                    **asdict(stats),
+                    "total_ms": round(stats.total_ms, 3),
+                    "max_ms": round(stats.max_ms, 3),
+                    "mean_ms": round(stats.mean_ms, 3),
+                }
+                for stats in top
+            ],
+            "dropped_statements": self.dropped,
+            "repeats": [_entry(r) for r in reversed(self.repeats)],
+            "slow": [_entry(r) for r in reversed(self.slow)],
+            "recent": [_entry(r) for r in list(reversed(self.recent))[:limit]],
+        }
+
+    def reset(self) -> None:
+        self.statements.clear()
+        self.dropped = 0
+        self.recent.clear()
+        self.slow.clear()
+        self.repeats.clear()
+
+    def install(self, engine: AsyncEngine) -> None:
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def before(
+            conn: Connection,
+            cursor: Any,
+            statement: str,
+            parameters: Any,
+            context: ExecutionContext,
+            executemany: bool,
+        ) -> None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def after(
+            conn: Connection,
+            cursor: Any,
+            statement: str,
+            parameters: Any,
+            context: ExecutionContext,
+            executemany: bool,
+        ) -> None:
+            seconds = time.perf_counter() - conn.info["query_start"].pop()
+            # -1 where the driver does not know, e.g. for some DDL
+            rows = cursor.rowcount if cursor.rowcount >= 0 else None
+            self.record(statement, seconds, rows, _caller(sys._getframe()))
+
+        @event.listens_for(sync_engine, "handle_error")
+        def error(context: ExceptionContext) -> None:
+            if context.connection is not None:
+                starts = context.connection.info.get("query_start")
+                if starts:
+                    starts.pop()
+
+
+query_profiler = QueryProfiler(
+    SLOW_QUERY_MS, REPEAT_THRESHOLD, LOG_SIZE, MAX_STATEMENTS
+)
+
+
+def record_query(statement: str, seconds: float, rows: int | None) -> None:
+    # For statements that bypass the engine's cursors, e.g. COPY through the
+    # driver connection
+    if ENABLED:
+        query_profiler.record(statement, seconds, rows, _caller(sys._getframe()))
+
+
+@contextmanager
+def profiling(endpoint: str | None = None) -> Iterator[RequestQueries]:
+    # Groups the statements run in the block, to find repeats; the endpoint
+    # can also be set on the yielded value once it is known
+    request = RequestQueries(endpoint=endpoint)
+    token = _request.set(request)
+    try:
+        yield request
+    finally:
+        _request.reset(token)
+        if request.endpoint is not None:
+            query_profiler.finish(request.endpoint, request)
+
+
+class QueryProfileMiddleware:
+    # Groups the statements of each request under its route template
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        with profiling() as request:
+            request.scope = scope
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                request.endpoint = getattr(scope.get("route"), "path", "unmatched")
@@ -1,14 +1,64 @@
-from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
+import hashlib
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import asdict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Literal
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.services import (
-    get_projects,
-    data_overview,
-    statistical_analysis,
-    data_subset_analysis,
-)  # type: ignore
-# from schemas import PydProject, PydSubject, PydSample, PydTreatment
+
+from api import analytics
+from api.crud import (
+    cancel_analysis_job,
+    delete_project_subjects,
+    delete_projects_by_project_id,
+    delete_samples_by_sample_id,
+    delete_subject_conditions,
+    delete_subjects_by_subject_id,
+    delete_treatments,
+    get_analysis_job,
+    get_data_version_info,
+    list_analysis_jobs,
+    upsert_project_subjects,
+    upsert_projects,
+    upsert_samples,
+    upsert_subject_conditions,
+    upsert_subjects,
+    upsert_treatments,
+)
+from api.database import get_db
+from api.export import MEDIA_TYPES, ExportFormat, export_cohort, export_samples
+from api.ingest import IngestError, ingest_csv
+from api.jobs import JobStatus, job_summary, job_workers, submit_job
+from api.cache import result_cache
+from api.metrics import response_sizes, startup_times
+from api.profiler import query_profiler
+from api.schemas import (
+    PydJobSubmission,
+    PydProject,
+    PydProjectSubjects,
+    PydSample,
+    PydSubject,
+    PydSubjectCondition,
+    PydTreatment,
+    PydTreatmentKey,
+)
+
+# api.services loads pandas, scipy and plotly, so its functions are imported in
+# the handlers that need them. That import happens once, during warm-up in the
+# app's lifespan or on the first such request, and keeps startup fast.
 
 
 projects_router = APIRouter()
@@ -16,24 +66,488 @@ projects_router = APIRouter()
 # samples_router = APIRouter()
 # treatments_router = APIRouter()
 user_stories_router = APIRouter()
+debug_router = APIRouter()
+static_router = APIRouter()
+ingest_router = APIRouter()
+data_router = APIRouter()
+bulk_router = APIRouter()
+jobs_router = APIRouter()
+
+
+async def conditional_request(
+    request: Request, db: AsyncSession = Depends(get_db)
+) -> dict[str, str]:
+    # Dashboards only change when the data version or the analytics snapshot
+    # does, so validators are derived from them and the query string, and a
+    # matching revalidation is answered with 304 before any analysis runs
+    version, updated_at = await get_data_version_info(db)
+    tag = str(version)
+    if snapshot := analytics.current_snapshot():
+        tag = f"{version}-{snapshot[0]}"
+        updated_at = max(updated_at, snapshot[1])
+    digest = hashlib.blake2b(
+        f"{request.url.path}?{sorted(request.query_params.multi_items())}".encode(),
+        digest_size=8,
+    ).hexdigest()
+    headers = {
+        "ETag": f'W/"{tag}-{digest}"',
+        "Last-Modified": format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True
+        ),
+        "Cache-Control": "no-cache",
+    }
+    matched = False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        matched = "*" in tags or headers["ETag"] in tags
+    elif if_modified_since := request.headers.get("if-modified-since"):
+        try:
+            matched = updated_at.replace(microsecond=0) <= parsedate_to_datetime(
+                if_modified_since
+            )
+        except (TypeError, ValueError):
+            matched = False
+    if matched:
+        raise HTTPException(status_code=304, headers=headers)
+    return headers
 
 
 @projects_router.get("/")
-def read_projects(proj_id: str | None = None):
-    projects = get_projects([proj_id] if proj_id else None)
+async def read_projects(proj_id: str | None = None, db: AsyncSession = Depends(get_db)):
+    from api.services import get_projects
+
+    projects = await get_projects(db, [proj_id] if proj_id else None)
     return projects
 
 
-@user_stories_router.get("/data-overview", response_class=HTMLResponse)
-def read_data_overview() -> str:
-    return data_overview()
+@user_stories_router.get("/data-overview", response_class=StreamingResponse)
+async def read_data_overview(
+    after_sample_id: str | None = None,
+    page_size: int = Query(1000, ge=1, le=10000),
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    from api.services import data_overview
+
+    # The session dependency stays open until the streamed body has been sent
+    return StreamingResponse(
+        data_overview(db, after_sample_id, page_size),
+        media_type="text/html",
+        headers=validators,
+    )
 
 
 @user_stories_router.get("/statistical-analysis", response_class=HTMLResponse)
-def read_statistical_analysis() -> str:
-    return statistical_analysis()
+async def read_statistical_analysis(
+    sample_type: list[str] = Query(["PBMC"]),
+    condition: list[str] = Query(["melanoma"]),
+    treatment: list[str] = Query(["miraclib"]),
+    time: list[int] | None = Query(None),
+    samples: bool = False,
+    outliers: bool = False,
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> HTMLResponse:
+    from api.services import statistical_analysis
+
+    out = await statistical_analysis(
+        db, sample_type, condition, treatment, time, samples, outliers
+    )
+    return HTMLResponse(out, headers=validators)
+
+
+@static_router.get("/plotly-{version}.min.js")
+async def read_plotly_js(version: str) -> FileResponse:
+    from api.services import PLOTLY_JS_PATH, PLOTLY_JS_URL
+
+    # The URL carries the plotly version, so the file never changes under it
+    if PLOTLY_JS_URL != f"/client/plotly-{version}.min.js":
+        raise HTTPException(status_code=404)
+    return FileResponse(
+        PLOTLY_JS_PATH,
+        media_type="text/javascript",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@static_router.get("/style-{digest}.css")
+async def read_style(digest: str) -> FileResponse:
+    from api.templates import STYLE_DIGEST, STYLE_PATH
+
+    # The URL carries a digest of the stylesheet, as plotly.js carries its
+    # version
+    if digest != STYLE_DIGEST:
+        raise HTTPException(status_code=404)
+    return FileResponse(
+        STYLE_PATH,
+        media_type="text/css",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@user_stories_router.get("/statistical-analysis/batch")
+async def read_statistical_screen(
+    sample_type: list[str] | None = Query(None),
+    condition: list[str] | None = Query(None),
+    treatment: list[str] | None = Query(None),
+    time: list[int] | None = Query(None),
+    format: Literal["html", "json"] = "html",
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    from api.services import statistical_screen
+
+    out = await statistical_screen(db, sample_type, condition, treatment, time, format)
+    media_type = "application/json" if format == "json" else "text/html"
+    return Response(out, media_type=media_type, headers=validators)
+
+
+@user_stories_router.get("/longitudinal-analysis")
+async def read_longitudinal_analysis(
+    sample_type: list[str] = Query(["PBMC"]),
+    condition: list[str] | None = Query(None),
+    treatment: list[str] | None = Query(None),
+    time: list[int] | None = Query(None),
+    format: Literal["html", "json"] = "html",
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    from api.services import longitudinal_analysis
+
+    out = await longitudinal_analysis(
+        db, sample_type, condition, treatment, time, format
+    )
+    media_type = "application/json" if format == "json" else "text/html"
+    return Response(out, media_type=media_type, headers=validators)
 
 
 @user_stories_router.get("/data-subset-analysis", response_class=HTMLResponse)
-def read_data_subset_analysis() -> str:
-    return data_subset_analysis()
+async def read_data_subset_analysis(
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> HTMLResponse:
+    from api.services import data_subset_analysis
+
+    return HTMLResponse(await data_subset_analysis(db), headers=validators)
+
+
+@user_stories_router.get(
+    "/data-subset-analysis/samples", response_class=StreamingResponse
+)
+async def read_data_subset_samples(
+    after_sample_id: str | None = None,
+    page_size: int = Query(1000, ge=1, le=10000),
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    from api.services import data_subset_samples
+
+    return StreamingResponse(
+        data_subset_samples(db, after_sample_id, page_size),
+        media_type="text/html",
+        headers=validators,
+    )
+
+
+def _export_response(
+    export: Callable[[], AsyncIterator[bytes]],
+    output_format: ExportFormat,
+    validators: dict[str, str],
+) -> StreamingResponse:
+    try:
+        body = export()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        raise HTTPException(
+            status_code=501, detail="Arrow output requires the pyarrow package"
+        )
+    return StreamingResponse(
+        body, media_type=MEDIA_TYPES[output_format], headers=validators
+    )
+
+
+@data_router.get("/samples", response_class=StreamingResponse)
+async def read_samples(
+    sample_type: list[str] | None = Query(None),
+    condition: list[str] | None = Query(None),
+    treatment: list[str] | None = Query(None),
+    time: list[int] | None = Query(None),
+    column: list[str] | None = Query(None),
+    format: ExportFormat = "ndjson",
+    batch_size: int = Query(10000, ge=1, le=100000),
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    filters = dict(
+        sample_types=sample_type,
+        conditions=condition,
+        treatment_types=treatment,
+        time_points=time,
+    )
+    return _export_response(
+        lambda: export_samples(db, column, filters, format, batch_size),
+        format,
+        validators,
+    )
+
+
+@data_router.get("/cohort", response_class=StreamingResponse)
+async def read_cohort(
+    sample_type: list[str] | None = Query(None),
+    condition: list[str] | None = Query(None),
+    treatment: list[str] | None = Query(None),
+    time: list[int] | None = Query(None),
+    population: list[str] | None = Query(None),
+    column: list[str] | None = Query(None),
+    format: ExportFormat = "ndjson",
+    batch_size: int = Query(10000, ge=1, le=100000),
+    validators: dict[str, str] = Depends(conditional_request),
+    db: AsyncSession = Depends(get_db),
+) -> StreamingResponse:
+    filters = dict(
+        sample_types=sample_type,
+        conditions=condition,
+        treatment_types=treatment,
+        time_points=time,
+    )
+    return _export_response(
+        lambda: export_cohort(db, column, filters, population, format, batch_size),
+        format,
+        validators,
+    )
+
+
+def _rejection_status(e: Exception) -> int | None:
+    # The status of a statement the database rejected because of the rows sent:
+    # 409 for constraint violations, 400 for invalid values and keys repeated
+    # within the request, and None for anything else, e.g. a lost connection.
+    # Errors are classed by SQLSTATE, from SQLAlchemy's or the driver's errors.
+    sqlstate = getattr(getattr(e, "orig", e), "sqlstate", None) or ""
+    if sqlstate.startswith("23"):
+        return 409
+    if sqlstate.startswith(("21", "22")):
+        return 400
+    return None
+
+
+async def _bulk(operation: Awaitable[int], result: str) -> dict:
+    # Each request is one transaction, so a rejected row rejects the batch
+    try:
+        return {result: await operation}
+    except DBAPIError as e:
+        status = _rejection_status(e)
+        if status is None:
+            raise
+        raise HTTPException(status_code=status, detail=str(e.orig))
+
+
+@bulk_router.put("/projects")
+async def put_projects(
+    projects: list[PydProject], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(
+        upsert_projects(db, [p.model_dump() for p in projects]), "written"
+    )
+
+
+@bulk_router.post("/projects/delete")
+async def post_projects_delete(
+    project_ids: list[str], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(delete_projects_by_project_id(db, project_ids), "deleted")
+
+
+@bulk_router.put("/subjects")
+async def put_subjects(
+    subjects: list[PydSubject], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(
+        upsert_subjects(db, [s.model_dump() for s in subjects]), "written"
+    )
+
+
+@bulk_router.post("/subjects/delete")
+async def post_subjects_delete(
+    subject_ids: list[str], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(delete_subjects_by_subject_id(db, subject_ids), "deleted")
+
+
+@bulk_router.put("/samples")
+async def put_samples(
+    samples: list[PydSample], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(upsert_samples(db, [s.model_dump() for s in samples]), "written")
+
+
+@bulk_router.post("/samples/delete")
+async def post_samples_delete(
+    sample_ids: list[str], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(delete_samples_by_sample_id(db, sample_ids), "deleted")
+
+
+@bulk_router.put("/subject-conditions")
+async def put_subject_conditions(
+    subject_conditions: list[PydSubjectCondition], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(
+        upsert_subject_conditions(db, [c.model_dump() for c in subject_conditions]),
+        "written",
+    )
+
+
+@bulk_router.post("/subject-conditions/delete")
+async def post_subject_conditions_delete(
+    subject_conditions: list[PydSubjectCondition], db: AsyncSession = Depends(get_db)
+) -> dict:
+    keys = [(c.subject_id, c.condition_name) for c in subject_conditions]
+    return await _bulk(delete_subject_conditions(db, keys), "deleted")
+
+
+@bulk_router.put("/treatments")
+async def put_treatments(
+    treatments: list[PydTreatment], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(
+        upsert_treatments(db, [t.model_dump() for t in treatments]), "written"
+    )
+
+
+@bulk_router.post("/treatments/delete")
+async def post_treatments_delete(
+    treatments: list[PydTreatmentKey], db: AsyncSession = Depends(get_db)
+) -> dict:
+    keys = [
+        (t.subject_id, t.subject_condition_name, t.treatment_name) for t in treatments
+    ]
+    return await _bulk(delete_treatments(db, keys), "deleted")
+
+
+@bulk_router.put("/project-subjects")
+async def put_project_subjects(
+    project_subjects: list[PydProjectSubjects], db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _bulk(
+        upsert_project_subjects(db, [p.model_dump() for p in project_subjects]),
+        "written",
+    )
+
+
+@bulk_router.post("/project-subjects/delete")
+async def post_project_subjects_delete(
+    project_subjects: list[PydProjectSubjects], db: AsyncSession = Depends(get_db)
+) -> dict:
+    keys = [(p.project_id, p.subject_id) for p in project_subjects]
+    return await _bulk(delete_project_subjects(db, keys), "deleted")
+
+
+@jobs_router.post("/")
+async def create_job(
+    submission: PydJobSubmission, db: AsyncSession = Depends(get_db)
+) -> JSONResponse:
+    # 202 for a new job, 200 when an identical job is already queued, running
+    # or done, in which case that job is returned
+    try:
+        job, created = await submit_job(db, submission.analysis, submission.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(
+        jsonable_encoder({**job_summary(job), "deduplicated": not created}),
+        status_code=202 if created else 200,
+        headers={"Location": f"/jobs/{job.job_id}"},
+    )
+
+
+@jobs_router.get("/")
+async def read_jobs(
+    status: JobStatus | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+) -> list[dict]:
+    return [job_summary(job) for job in await list_analysis_jobs(db, status, limit)]
+
+
+@jobs_router.get("/{job_id}")
+async def read_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)) -> dict:
+    job = await get_analysis_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_summary(job)
+
+
+@jobs_router.get("/{job_id}/result")
+async def read_job_result(
+    job_id: uuid.UUID, db: AsyncSession = Depends(get_db)
+) -> Response:
+    job = await get_analysis_job(db, job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    # A finished job never changes, so its result can be cached for good
+    return Response(
+        job.result,
+        media_type=job.media_type,
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+
+@jobs_router.post("/{job_id}/cancel")
+async def cancel_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)) -> dict:
+    # Finished jobs are returned unchanged
+    job = await cancel_analysis_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job_workers.cancel(job_id)
+    return job_summary(job)
+
+
+@ingest_router.post("/")
+async def create_ingest(
+    request: Request,
+    batch_rows: int = Query(50000, ge=1, le=1000000),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    # The request body is a cell-count CSV, consumed as it arrives. A rejected
+    # batch reports the rows committed by the batches before it.
+    try:
+        report = await ingest_csv(db, request.stream(), batch_rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IngestError as e:
+        status = _rejection_status(e.error)
+        if status is None:
+            raise
+        raise HTTPException(
+            status_code=status,
+            detail={"error": str(e), "committed": asdict(e.report)},
+        )
+    return asdict(report)
+
+
+@debug_router.get("/cache")
+async def read_cache_stats() -> dict:
+    return asdict(result_cache.stats)
+
+
+@debug_router.get("/responses")
+async def read_response_sizes() -> dict:
+    return response_sizes.report()
+
+
+@debug_router.get("/queries")
+async def read_query_profile(limit: int = Query(50, ge=1, le=1000)) -> dict:
+    return query_profiler.report(limit)
+
+
+@debug_router.delete("/queries", status_code=204)
+async def reset_query_profile() -> None:
+    query_profiler.reset()
+
+
+@debug_router.get("/startup")
+async def read_startup_times() -> dict:
+    return startup_times
@@ -53,6 +53,17 @@ class PydTreatment(BaseModel):
     response: bool | None = None
 
 
+class PydTreatmentKey(BaseModel):
+    subject_id: str
+    subject_condition_name: str
+    treatment_name: str
+
+
 class PydProjectSubjects(BaseModel):
     project_id: str
     subject_id: str
+
+
+class PydJobSubmission(BaseModel):
+    analysis: str
+    params: dict = {}
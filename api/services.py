@@ -1,17 +1,91 @@
+import json
+from collections.abc import AsyncIterator, Awaitable, Callable
+from html import escape
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+import numpy as np
 import pandas as pd  # type: ignore
 from scipy import stats  # type: ignore
+import plotly  # type: ignore
 import plotly.graph_objects as go  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from api import analytics, matrix
+from api.cache import result_cache
 from api.crud import (
+    get_data_version,
     get_project_by_project_id,
-    get_samples_by_sample_id,
-    get_samples_by_sample_condition_treatment_timeline,
-    get_for_subset_analysis,
+    get_percentage_moments,
+    get_percentage_outliers,
+    get_sample_frame,
+    get_subject_responses,
+    get_subset_counts,
+)
+from api.executor import run_cpu
+from api.metrics import StageClock, stage
+from api.longitudinal import (
+    build_trajectories,
+    mean_trajectories,
+    paired_tests,
+    repeated_measures,
 )
+from api.models import POPULATIONS
+from api.templates import PAGE, nav_html, section_html
+
+
+# plotly.js as shipped with the plotly package, served once at a versioned URL
+# so browsers can cache it indefinitely instead of receiving it in every page
+PLOTLY_JS_PATH = Path(plotly.__file__).parent / "package_data" / "plotly.min.js"
+PLOTLY_JS_URL = f"/client/plotly-{plotly.__version__}.min.js"
+
+
+def warm_up() -> None:
+    # Importing this module loads pandas, scipy and plotly. Rendering a
+    # throwaway box plot also loads plotly's trace validators, which would
+    # otherwise happen during the first dashboard request.
+    go.Figure(
+        go.Box(q1=[1], median=[2], q3=[3], lowerfence=[0], upperfence=[4])
+    ).to_html(full_html=False, include_plotlyjs=False)
+
+
+async def cached_analysis(
+    db: AsyncSession,
+    analysis: str,
+    params: dict,
+    compute: Callable[[], Awaitable[str]],
+) -> str:
+    # Writes through api.crud bump the data version, which retires every key
+    # computed against older data
+    version = await get_data_version(db)
+    snapshot = analytics.current_snapshot()
+    key = (
+        analysis,
+        tuple(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in sorted(params.items())
+        ),
+        version,
+        snapshot,
+    )
+    out = result_cache.get(key)
+    if out is None:
+        out = await compute()
+        # A write committed while computing may have been read by some of the
+        # analysis' queries, and bumps the version with the data, so such a
+        # result is returned but not stored under the older version
+        if (
+            await get_data_version(db) == version
+            and analytics.current_snapshot() == snapshot
+        ):
+            result_cache.put(key, out)
+    return out
 
 
-def get_projects(project_ids: list[str] | None = None) -> list[str]:
-    projects = get_project_by_project_id(project_ids if project_ids else None)
+async def get_projects(
+    db: AsyncSession, project_ids: list[str] | None = None
+) -> list[str]:
+    projects = await get_project_by_project_id(db, project_ids if project_ids else None)
     out = [proj._mapping["Project"].project_id for proj in projects]
     return out
 
@@ -31,173 +105,378 @@ def basic_html() -> str:
     return out
 
 
-def data_overview() -> str:
-    samples = get_samples_by_sample_id(None)
-    data = [
-        {
-            "subject_id": sample._mapping["Sample"].subject_id,
-            "sample_id": sample._mapping["Sample"].sample_id,
-            "sample_type": sample._mapping["Sample"].sample_type,
-            # "time_from_treatment_start": sample._mapping["Sample"].time_from_treatment_start,
-            "b_cell": sample._mapping["Sample"].b_cell,
-            "cd8_t_cell": sample._mapping["Sample"].cd8_t_cell,
-            "cd4_t_cell": sample._mapping["Sample"].cd4_t_cell,
-            "nk_cell": sample._mapping["Sample"].nk_cell,
-            "monocyte": sample._mapping["Sample"].monocyte,
-        }
-        for sample in samples
-    ]
-    df = pd.DataFrame(data)
-    df = df.sort_values(by=["sample_id"])
+async def _timed_query(query: Awaitable[pd.DataFrame]) -> pd.DataFrame:
+    with stage("query") as timing:
+        df = await query
+        timing.rows = len(df)
+    return df
 
-    cell_types = ["b_cell", "cd8_t_cell", "cd4_t_cell", "nk_cell", "monocyte"]
-    df["total_cells"] = df[cell_types].sum(axis=1)
-    for ctype in cell_types:
-        df[f"{ctype} (%)"] = ((df[ctype] / df["total_cells"]) * 100).round(2)
 
-    df_html = df.to_html()
-    out = f"""
-    <!doctype html>
-    <html>
+def _rows_html(df: pd.DataFrame) -> str:
+    # Build the <tr> markup column by column with vectorized string ops.
+    # Missing values are left empty rather than rendered as "nan".
+    cells = df.astype(object).where(df.notna(), "").astype(str).map(escape)
+    rows = "<tr><td>" + cells.iloc[:, 0]
+    for column in cells.columns[1:]:
+        rows = rows + "</td><td>" + cells[column]
+    return "\n".join(rows + "</td></tr>")
 
-      <head>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>Teiko Demo - Data Overview</title>
-        <style>
-          html, body {{
-              width: 100%;
-              margin: 0;
-              padding: 0;
-              background: #222;          /* dark background */
-              color: #eee;               /* light text */
-              font-size: 12px;          /* base font size */
-          }}
-
-          header {{
-            text-align: center;
-            font-family: Arial, Helvetica, sans-serif;
-            font-size: 1.5rem;
-            margin: 20px 0;
-            color: #eee;
-            border-bottom: 2px solid #e0e0e0;
-            padding-bottom: 10px;
-          }}
-
-          table {{
-              margin: 2rem auto;          /* center the table */
-              border-collapse: collapse;  /* cleaner borders */
-              background: #222;           /* dark background */
-              color: #fff;                /* white text */
-              font-family: sans-serif;
-              min-width: 300px;
-          }}
-
-          th, td {{
-              padding: 0.75rem 1rem;
-              border: 1px solid #444;     /* subtle borders */
-              text-align: left;
-          }}
-
-          th {{
-              background: #333;           /* slightly lighter header */
-              font-weight: 600;
-          }}
-
-          tr:nth-child(even) td {{
-              background: #2a2a2a;        /* alternating dark rows */
-          }}
-
-          tr:hover td {{
-              background: #383838;        /* highlight on hover */
-          }}
-        </style>
-      </head>
-      <body>
-          <header>
-            <h1>Teiko Demo - Data Overview</h1>
-          </header>
-          <main>
-            <section>
-              {df_html}
-            </section>
-          </main>
-      </body>
-    </html>
-    """
 
-    return out
+SUBSET: dict = dict(
+    sample_types=["PBMC"],
+    conditions=["melanoma"],
+    treatment_types=["miraclib"],
+    time_points=[0],
+)
+SUBSET_COLUMNS = [
+    "project_id",
+    "subject_id",
+    "sample_id",
+    "condition",
+    "age",
+    "sex",
+    "treatment",
+    "response",
+    "sample_type",
+    "time",
+    *POPULATIONS,
+]
+
+
+def data_overview(
+    db: AsyncSession,
+    after_sample_id: str | None = None,
+    page_size: int = 1000,
+    chunk_size: int = 250,
+) -> AsyncIterator[str]:
+    cell_types = POPULATIONS
+    columns = [
+        "subject_id",
+        "sample_id",
+        "sample_type",
+        *cell_types,
+        "total_cells",
+        *[f"{ctype} (%)" for ctype in cell_types],
+    ]
+    return _sample_listing(
+        db, "Data Overview", columns, {}, after_sample_id, page_size, chunk_size
+    )
 
 
-def statistical_analysis() -> str:
-    # Get samples of type PBMC with treatment type miraclib
-    samples = get_samples_by_sample_condition_treatment_timeline(
-        sample_types=["PBMC"],
-        conditions=["melanoma"],
-        treatment_types=["miraclib"],
-        time_points=None,
+def data_subset_samples(
+    db: AsyncSession,
+    after_sample_id: str | None = None,
+    page_size: int = 1000,
+    chunk_size: int = 250,
+) -> AsyncIterator[str]:
+    return _sample_listing(
+        db,
+        "Data Subset Samples (PBMC/Melanoma/Miraclib/Baseline)",
+        SUBSET_COLUMNS,
+        SUBSET,
+        after_sample_id,
+        page_size,
+        chunk_size,
+        headers={"sex": "F/M"},
     )
-    data = [
-        {
-            "subject_id": sample._mapping["Sample"].subject_id,
-            "sample_id": sample._mapping["Sample"].sample_id,
-            "condition": sample._mapping["Treatment"].subject_condition_name,
-            "treatment": sample._mapping["Treatment"].treatment_name,
-            "response": sample._mapping["Treatment"].response,
-            "sample_type": sample._mapping["Sample"].sample_type,
-            "time": sample._mapping["Sample"].time_from_treatment_start,
-            "b_cell": sample._mapping["Sample"].b_cell,
-            "cd8_t_cell": sample._mapping["Sample"].cd8_t_cell,
-            "cd4_t_cell": sample._mapping["Sample"].cd4_t_cell,
-            "nk_cell": sample._mapping["Sample"].nk_cell,
-            "monocyte": sample._mapping["Sample"].monocyte,
-        }
-        for sample in samples
-    ]
-    df = pd.DataFrame(data)
-    df = df.sort_values(by=["sample_id"])
 
-    # Calculate cell type percentages by response status
-    cell_types = ["b_cell", "cd8_t_cell", "cd4_t_cell", "nk_cell", "monocyte"]
-    df["total_cells"] = df[cell_types].sum(axis=1)
-    for ctype in cell_types:
-        df[f"{ctype} (%)"] = (df[ctype] / df["total_cells"]) * 100
 
-    responders_df = df[df["response"]]
-    non_responders_df = df[~df["response"]]
+async def _sample_listing(
+    db: AsyncSession,
+    title: str,
+    columns: list[str],
+    filters: dict,
+    after_sample_id: str | None,
+    page_size: int,
+    chunk_size: int,
+    headers: dict[str, str] | None = None,
+) -> AsyncIterator[str]:
+    header_html = "".join(
+        f"<th>{escape((headers or {}).get(column, column))}</th>" for column in columns
+    )
+    head, tail = PAGE.split("main", title=escape(title), nav="")
+    yield (
+        head + '<section>\n<table border="1" class="dataframe">\n'
+        f"<thead><tr>{header_html}</tr></thead>\n<tbody>\n"
+    )
 
-    # Perform t-tests
-    stats_dict: dict = {
-        "Cell Type": [],
-        "Responders Mean (%)": [],
-        "Non-Responders Mean (%)": [],
-        "p-value": [],
-    }
-    for ctype in cell_types:
-        _, p, *_ = stats.ttest_ind(
-            responders_df[f"{ctype} (%)"],
-            non_responders_df[f"{ctype} (%)"],
-            equal_var=False,
+    # Each chunk is its own keyset query, so memory is bounded by chunk_size no
+    # matter how large the sample table grows. Pages and chunks count samples,
+    # each with its rows for every project and treatment. One extra sample is
+    # fetched per chunk to tell whether another page follows.
+    remaining = page_size
+    has_more = False
+    while remaining > 0:
+        n_samples = min(chunk_size, remaining)
+        df = await _timed_query(
+            get_sample_frame(
+                db,
+                columns,
+                after_sample_id=after_sample_id,
+                limit=n_samples + 1,
+                **filters,
+            )
         )
-        stats_dict["Cell Type"].append(ctype)
-        stats_dict["Responders Mean (%)"].append(
-            round(responders_df[f"{ctype} (%)"].mean(), 2)
+        sample_ids = df["sample_id"].unique()
+        has_more = len(sample_ids) > n_samples
+        if has_more:
+            df = df[df["sample_id"].isin(sample_ids[:n_samples])]
+        if df.empty:
+            break
+
+        for column in columns:
+            if column.endswith(" (%)"):
+                df[column] = df[column].round(2)
+        with stage("html") as timing:
+            rows_html = _rows_html(df[columns])
+            timing.rows = len(df)
+        yield rows_html
+
+        after_sample_id = df["sample_id"].iloc[-1]
+        remaining -= n_samples
+        if not has_more:
+            break
+
+    next_link = (
+        f'<a href="?after_sample_id={quote(after_sample_id)}&page_size={page_size}">Next page</a>'
+        if has_more and after_sample_id is not None
+        else ""
+    )
+    pager = (
+        f'<nav>\n<a href="?page_size={page_size}">First page</a>\n{next_link}\n</nav>'
+    )
+    yield "</tbody>\n</table>\n</section>\n" + tail.render(footer=pager)
+
+
+def cohort_label(
+    sample_types: list[str] | None = None,
+    conditions: list[str] | None = None,
+    treatment_types: list[str] | None = None,
+    time_points: list[int] | None = None,
+) -> str:
+    parts = [
+        "/".join(sample_types or []),
+        "/".join(c.capitalize() for c in conditions or []),
+        "/".join(t.capitalize() for t in treatment_types or []),
+        "/".join("Baseline" if t == 0 else f"Day {t}" for t in time_points or []),
+    ]
+    return escape("/".join(part for part in parts if part) or "All Samples")
+
+
+def welch_pvalues(
+    n1: np.ndarray,
+    mean1: np.ndarray,
+    var1: np.ndarray,
+    n2: np.ndarray,
+    mean2: np.ndarray,
+    var2: np.ndarray,
+) -> np.ndarray:
+    # Welch's t-test from sufficient statistics, evaluated elementwise over
+    # arrays of any shape. Groups with fewer than two samples give NaN.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        _, p = stats.ttest_ind_from_stats(
+            mean1, np.sqrt(var1), n1, mean2, np.sqrt(var2), n2, equal_var=False
         )
-        stats_dict["Non-Responders Mean (%)"].append(
-            round(non_responders_df[f"{ctype} (%)"].mean(), 2)
+    return np.asarray(p, dtype=float)
+
+
+def _response_moments(
+    moments: pd.DataFrame, keys: list[str]
+) -> tuple[pd.Index, dict[str, np.ndarray]]:
+    # Reshape the long (group, response, population) aggregates from
+    # get_percentage_moments into per-response (n_groups, n_populations) arrays
+    wide = (
+        moments.set_index([*keys, "response", "population"])[["count", "mean", "var"]]
+        .unstack(["response", "population"])
+        .sort_index()
+    )
+    out = {}
+    for stat in ["count", "mean", "var"]:
+        for response, prefix in [(True, "r"), (False, "nr")]:
+            columns = pd.MultiIndex.from_product([[stat], [response], POPULATIONS])
+            out[f"{prefix}_{stat}"] = wide.reindex(columns=columns).to_numpy(
+                dtype=float
+            )
+    return wide.index, out
+
+
+async def statistical_analysis(
+    db: AsyncSession,
+    sample_types: list[str] | None = None,
+    conditions: list[str] | None = None,
+    treatment_types: list[str] | None = None,
+    time_points: list[int] | None = None,
+    include_samples: bool = False,
+    include_outliers: bool = False,
+) -> str:
+    return await cached_analysis(
+        db,
+        "statistical_analysis",
+        dict(
+            sample_types=sample_types,
+            conditions=conditions,
+            treatment_types=treatment_types,
+            time_points=time_points,
+            include_samples=include_samples,
+            include_outliers=include_outliers,
+        ),
+        lambda: _statistical_analysis(
+            db,
+            sample_types,
+            conditions,
+            treatment_types,
+            time_points,
+            include_samples,
+            include_outliers,
+        ),
+    )
+
+
+async def _statistical_analysis(
+    db: AsyncSession,
+    sample_types: list[str] | None,
+    conditions: list[str] | None,
+    treatment_types: list[str] | None,
+    time_points: list[int] | None,
+    include_samples: bool,
+    include_outliers: bool,
+) -> str:
+    filters: dict = dict(
+        sample_types=sample_types,
+        conditions=conditions,
+        treatment_types=treatment_types,
+        time_points=time_points,
+    )
+    # One row per response and cell type, however large the cohort is
+    moments_df = await _timed_query(
+        get_percentage_moments(db, [], **filters, box_stats=True)
+    )
+    outliers_df = (
+        await _timed_query(get_percentage_outliers(db, [], **filters))
+        if include_outliers
+        else None
+    )
+    samples_df = (
+        await _timed_query(
+            get_sample_frame(
+                db,
+                [
+                    "subject_id",
+                    "sample_id",
+                    "condition",
+                    "treatment",
+                    "response",
+                    "sample_type",
+                    "time",
+                    *POPULATIONS,
+                    "total_cells",
+                    *[f"{ctype} (%)" for ctype in POPULATIONS],
+                ],
+                **filters,
+            )
         )
-        stats_dict["p-value"].append(round(float(p), 4))  # type: ignore
-    stats_df = pd.DataFrame(stats_dict)
+        if include_samples
+        else None
+    )
+    return await run_cpu(
+        _render_statistical_analysis,
+        filters,
+        moments_df,
+        outliers_df,
+        samples_df,
+    )
+
 
-    # Create box plots
+def _render_statistical_analysis(
+    filters: dict,
+    moments_df: pd.DataFrame,
+    outliers_df: pd.DataFrame | None,
+    samples_df: pd.DataFrame | None,
+) -> str:
+    sample_types = filters["sample_types"]
+    conditions = filters["conditions"]
+    treatment_types = filters["treatment_types"]
+    time_points = filters["time_points"]
+    include_outliers = outliers_df is not None
+    label = cohort_label(sample_types, conditions, treatment_types, time_points)
+    cell_types = POPULATIONS
+    clock = StageClock()
+
+    # Perform Welch t-tests for every cell type in one vectorized call
+    cohorts, moments = _response_moments(moments_df.assign(cohort=0), ["cohort"])
+    if cohorts.empty:
+        moments = {k: np.full((1, len(cell_types)), np.nan) for k in moments}
+    p_values = welch_pvalues(
+        moments["r_count"],
+        moments["r_mean"],
+        moments["r_var"],
+        moments["nr_count"],
+        moments["nr_mean"],
+        moments["nr_var"],
+    )
+    clock.lap("stats")
+    stats_df = pd.DataFrame(
+        {
+            "Cell Type": cell_types,
+            "Responders Mean (%)": moments["r_mean"][0].round(2),
+            "Non-Responders Mean (%)": moments["nr_mean"][0].round(2),
+            "p-value": p_values[0].round(4),
+        }
+    )
+    significant = stats_df[stats_df["p-value"] < 0.05]
+    if significant.empty:
+        summary_html = f"""
+                No cell population shows a statistically significant difference in
+                relative frequencies between responders and non-responders
+                (p &lt; 0.05) for {label}.
+        """
+    else:
+        findings = ", ".join(
+            f"{row['Cell Type']} (Responders: {row['Responders Mean (%)']}%, "
+            f"Non-Responders: {row['Non-Responders Mean (%)']}%, p = {row['p-value']})"
+            for _, row in significant.iterrows()
+        )
+        summary_html = f"""
+                The following cell populations show a statistically significant
+                difference in relative frequencies between responders and
+                non-responders (p &lt; 0.05): {findings}. Compare the means to judge
+                whether the effect size is clinically significant.
+        """
+
+    clock.lap("frame")
+
+    # Create box plots from the aggregated quartiles, with whiskers at the Tukey
+    # fences. Each trace carries a handful of numbers (and the outliers, when
+    # asked for) instead of every sample's percentage.
+    box_stats = moments_df.set_index(["population", "response"])
+    outliers = (
+        outliers_df.groupby(["population", "response"])["percentage"].agg(list)
+        if outliers_df is not None
+        else pd.Series(dtype=object)
+    )
     fig = go.Figure()
     for ctype in cell_types:
-        for grp, grp_df in [
-            ("Responders", responders_df),
-            ("Non-Responders", non_responders_df),
-        ]:
+        for grp, response in [("Responders", True), ("Non-Responders", False)]:
+            if (ctype, response) not in box_stats.index:
+                continue
+            box = box_stats.loc[(ctype, response)]
+            points = outliers.get((ctype, response), []) if include_outliers else None
             fig.add_trace(
-                go.Box(y=grp_df[f"{ctype} (%)"], name=f"{ctype} - {grp}", boxmean="sd")
+                go.Box(
+                    x=[f"{ctype} - {grp}"],
+                    name=f"{ctype} - {grp}",
+                    q1=[box["q1"]],
+                    median=[box["median"]],
+                    q3=[box["q3"]],
+                    lowerfence=[box["lowerfence"]],
+                    upperfence=[box["upperfence"]],
+                    mean=[box["mean"]],
+                    sd=[box["sd"]],
+                    boxmean="sd",
+                    # Sample points of precomputed boxes are one list per box
+                    y=None if points is None else [points],
+                    boxpoints="outliers" if include_outliers else False,
+                )
             )
     fig.update_layout(
         yaxis_title="Percentage (%)",
@@ -211,386 +490,551 @@ def statistical_analysis() -> str:
     config_options = {
         "displaylogo": False,
     }
+    clock.lap("plot")
 
-    fig_html = fig.to_html(full_html=False, config=config_options)  # give a div only
-    responders_df_html = responders_df.to_html()
-    non_responders_df_html = non_responders_df.to_html()
+    # give a div only, loading plotly.js from the shared long-lived static copy
+    fig_html = fig.to_html(
+        full_html=False, include_plotlyjs=PLOTLY_JS_URL, config=config_options
+    )
+    if samples_df is not None:
+        df = samples_df
+        responders_df_html = df[df["response"].eq(True)].to_html()
+        non_responders_df_html = df[df["response"].eq(False)].to_html()
+    else:
+        query = urlencode(
+            dict(
+                sample_type=sample_types or [],
+                condition=conditions or [],
+                treatment=treatment_types or [],
+                time=time_points or [],
+                outliers=["true"] if include_outliers else [],
+                samples="true",
+            ),
+            doseq=True,
+        )
+        responders_df_html = non_responders_df_html = (
+            f'<p><a href="?{escape(query)}">Show the per-sample tables</a></p>'
+        )
     stats_df_html = stats_df.to_html()
 
-    out = f"""
-    <!doctype html>
-    <html>
-
-      <head>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>Teiko Demo - Statistical Analysis (PBMC/Melanoma/Miraclib)</title>
-        <style>
-          html, body {{
-              width: 100%;
-              margin: 0;
-              padding: 0;
-              background: #222;          /* dark background */
-              color: #eee;               /* light text */
-              font-size: 12px;          /* base font size */
-          }}
-
-          header {{
-            text-align: center;
-            font-family: Arial, Helvetica, sans-serif;
-            font-size: 1.5rem;
-            margin: 20px 0;
-            color: #eee;
-            border-bottom: 2px solid #e0e0e0;
-            padding-bottom: 10px;
-          }}
-
-          h2 {{
-            text-align: center;
-            font-family: Arial, Helvetica, sans-serif;
-            font-size: 18px;            /* Smaller font size for h2 */
-            margin: 15px 0;
-            color: #eee;
-            border-bottom: 1px solid #e0e0e0; /* Subtle underline */
-            padding-bottom: 5px;
-          }}
-
-          p {{
-            max-width: 500px;
-            margin: 2rem auto;
-            font-size: 14px;
-            line-height: 1.5;
-          }}
-
-          nav {{
-            text-align: center;
-            margin: 20px 0;
-            padding-top: 10px;
-            padding-bottom: 20px;
-          }}
-
-          nav ul {{
-            list-style: none;           /* Remove bullet points */
-            padding: 0;
-            margin: 0;
-            display: inline-flex;       /* Horizontal layout */
-            gap: 15px;                  /* Space between links */
-          }}
-
-          nav ul li {{
-            display: inline;            /* Ensure list items are inline */
-          }}
-
-          nav ul li a {{
-            color: #1a73e8;             /* Blue links */
-            text-decoration: none;
-            font-size: 1.5rem;
-            padding: 10px 15px;
-            border: 1px solid #1a73e8;  /* Add a border for buttons */
-            border-radius: 5px;         /* Rounded corners */
-            transition: all 0.3s ease;  /* Smooth hover effect */
-          }}
-
-          nav ul li a:hover {{
-            background-color: #1a73e8;  /* Blue background on hover */
-            color: #fff;                /* White text on hover */
-          }}
-
-          table {{
-              margin: 2rem auto;          /* center the table */
-              border-collapse: collapse;  /* cleaner borders */
-              background: #222;           /* dark background */
-              color: #fff;                /* white text */
-              font-family: sans-serif;
-              min-width: 300px;
-          }}
-
-          th, td {{
-              padding: 0.75rem 1rem;
-              border: 1px solid #444;     /* subtle borders */
-              text-align: left;
-          }}
-
-          th {{
-              background: #333;           /* slightly lighter header */
-              font-weight: 600;
-          }}
-
-          tr:nth-child(even) td {{
-              background: #2a2a2a;        /* alternating dark rows */
-          }}
-
-          tr:hover td {{
-              background: #383838;        /* highlight on hover */
-          }}
-
-          .plotly-graph-div.js-plotly-plot {{
-            margin: 2rem auto;
-            min-height: 600px;
-            max-width: 1400px;
-
-          }}
-
-        </style>
-      </head>
-      <body>
-          <header>
-            <h1>Teiko Demo - Statistical Analysis (PBMC/Melanoma/Miraclib)</h1>
-          </header>
-          <nav>
-            <ul>
-              <li><a href="#cell-type-percentages">Cell Type Percentages by Response Status</a></li>
-              <li><a href="#t-test-comparison">T-test Comparison</a></li>
-              <li><a href="#responders-data">Responders Data</a></li>
-              <li><a href="#non-responders-data">Non-Responders Data</a></li>
-            </ul>
-          </nav>
-          <main>
-            <section id="cell-type-percentages"">
-              <h2>Cell Type Percentages by Response Status (PBMC/Melanoma/Miraclib)</h2>
-              {fig_html}
-            </section>
-            <section id="t-test-comparison">
-              <h2>T-test Comparison (PBMC/Melanoma/Miraclib)</h2>
-              {stats_df_html}
-              <p>
-                CD4 T-cells show a statistically significant difference in relative
-                frequencies between responders and non-responders (p &lt; 0.05),
-                however, the means are quite close (Responders: {stats_df.loc[stats_df["Cell Type"] == "cd4_t_cell", "Responders Mean (%)"].values[0]}%,
-                Non-Responders: {stats_df.loc[stats_df["Cell Type"] == "cd4_t_cell", "Non-Responders Mean (%)"].values[0]}%), suggesting
-                that the effect size may not be clinically significant.
-              </p>
-            </section>
-            <section id="responders-data">
-              <h2>Responders Data (PBMC/Melanoma/Miraclib)</h2>
-              {responders_df_html}
-            </section>
-            <section id="non-responders-data">
-              <h2>Non-Responders Data (PBMC/Melanoma/Miraclib)</h2>
-              {non_responders_df_html}
-            </section>
-          </main>
-      </body>
-    </html>
-    """
+    out = PAGE.render(
+        title=f"Statistical Analysis ({label})",
+        nav=nav_html(
+            [
+                ("cell-type-percentages", "Cell Type Percentages by Response Status"),
+                ("t-test-comparison", "T-test Comparison"),
+                ("responders-data", "Responders Data"),
+                ("non-responders-data", "Non-Responders Data"),
+            ]
+        ),
+        main=section_html(
+            "cell-type-percentages",
+            f"Cell Type Percentages by Response Status ({label})",
+            fig_html,
+        )
+        + section_html(
+            "t-test-comparison",
+            f"T-test Comparison ({label})",
+            f"{stats_df_html}\n<p>{summary_html}</p>",
+        )
+        + section_html(
+            "responders-data", f"Responders Data ({label})", responders_df_html
+        )
+        + section_html(
+            "non-responders-data",
+            f"Non-Responders Data ({label})",
+            non_responders_df_html,
+        ),
+        footer="",
+    )
+    clock.lap("html")
 
     return out
 
 
-def data_subset_analysis() -> str:
-    # Get samples of type PBMC with treatment type miraclib
-    samples = get_for_subset_analysis(
-        sample_types=["PBMC"],
-        conditions=["melanoma"],
-        treatment_types=["miraclib"],
-        time_points=[0],
+COHORT_KEYS = ["condition", "treatment", "sample_type", "time"]
+
+
+async def cohort_screen(
+    db: AsyncSession,
+    sample_types: list[str] | None = None,
+    conditions: list[str] | None = None,
+    treatment_types: list[str] | None = None,
+    time_points: list[int] | None = None,
+) -> pd.DataFrame:
+    # Responder vs non-responder Welch t-tests for every cohort and population
+    # from one aggregate query: grouped sufficient statistics feed a single
+    # array-wise scipy call instead of a Python loop over cohorts and cell types
+    moments_df = await _timed_query(
+        get_percentage_moments(
+            db,
+            COHORT_KEYS,
+            sample_types=sample_types,
+            conditions=conditions,
+            treatment_types=treatment_types,
+            time_points=time_points,
+        )
     )
-    data = [
+    return await run_cpu(_screen_frame, moments_df)
+
+
+def _screen_frame(moments_df: pd.DataFrame) -> pd.DataFrame:
+    clock = StageClock()
+    cohorts, moments = _response_moments(moments_df, COHORT_KEYS)
+    p_values = welch_pvalues(
+        moments["r_count"],
+        moments["r_mean"],
+        moments["r_var"],
+        moments["nr_count"],
+        moments["nr_mean"],
+        moments["nr_var"],
+    )
+    clock.lap("stats")
+
+    n_cohorts, n_populations = p_values.shape
+    screen = pd.DataFrame(
+        np.repeat(cohorts.to_frame(index=False).to_numpy(), n_populations, axis=0),
+        columns=COHORT_KEYS,
+    )
+    screen["population"] = np.tile(POPULATIONS, n_cohorts)
+    screen["responders_n"] = pd.array(moments["r_count"].ravel()).astype("Int64")
+    screen["responders_mean"] = moments["r_mean"].ravel()
+    screen["non_responders_n"] = pd.array(moments["nr_count"].ravel()).astype("Int64")
+    screen["non_responders_mean"] = moments["nr_mean"].ravel()
+    screen["difference"] = screen["responders_mean"] - screen["non_responders_mean"]
+    screen["p_value"] = p_values.ravel()
+    # Benjamini-Hochberg adjustment across every test in the screen
+    tested = screen["p_value"].notna().to_numpy()
+    screen["q_value"] = np.nan
+    if tested.any():
+        screen.loc[tested, "q_value"] = stats.false_discovery_control(
+            screen.loc[tested, "p_value"].to_numpy()
+        )
+    screen = screen.sort_values(["p_value", *COHORT_KEYS], na_position="last")
+    clock.lap("frame", len(screen))
+    return screen
+
+
+async def statistical_screen(
+    db: AsyncSession,
+    sample_types: list[str] | None = None,
+    conditions: list[str] | None = None,
+    treatment_types: list[str] | None = None,
+    time_points: list[int] | None = None,
+    output_format: str = "html",
+) -> str:
+    return await cached_analysis(
+        db,
+        "statistical_screen",
+        dict(
+            sample_types=sample_types,
+            conditions=conditions,
+            treatment_types=treatment_types,
+            time_points=time_points,
+            output_format=output_format,
+        ),
+        lambda: _statistical_screen(
+            db, sample_types, conditions, treatment_types, time_points, output_format
+        ),
+    )
+
+
+async def _statistical_screen(
+    db: AsyncSession,
+    sample_types: list[str] | None,
+    conditions: list[str] | None,
+    treatment_types: list[str] | None,
+    time_points: list[int] | None,
+    output_format: str,
+) -> str:
+    filters: dict = dict(
+        sample_types=sample_types,
+        conditions=conditions,
+        treatment_types=treatment_types,
+        time_points=time_points,
+    )
+    moments_df = await _timed_query(get_percentage_moments(db, COHORT_KEYS, **filters))
+    return await run_cpu(_render_statistical_screen, filters, moments_df, output_format)
+
+
+def _render_statistical_screen(
+    filters: dict, moments_df: pd.DataFrame, output_format: str
+) -> str:
+    sample_types = filters["sample_types"]
+    conditions = filters["conditions"]
+    treatment_types = filters["treatment_types"]
+    time_points = filters["time_points"]
+    screen = _screen_frame(moments_df)
+    clock = StageClock()
+    if output_format == "json":
+        out = screen.to_json(orient="records")
+        clock.lap("json")
+        return out
+
+    label = cohort_label(sample_types, conditions, treatment_types, time_points)
+    screen_html = screen.round(
         {
-            "project_id": sample._mapping["ProjectSubject"].project_id,
-            "subject_id": sample._mapping["Sample"].subject_id,
-            "sample_id": sample._mapping["Sample"].sample_id,
-            "condition": sample._mapping["Treatment"].subject_condition_name,
-            "age": sample._mapping["Subject"].age,
-            "F/M": sample._mapping["Subject"].sex,
-            "treatment": sample._mapping["Treatment"].treatment_name,
-            "response": sample._mapping["Treatment"].response,
-            "sample_type": sample._mapping["Sample"].sample_type,
-            "time": sample._mapping["Sample"].time_from_treatment_start,
-            "b_cell": sample._mapping["Sample"].b_cell,
-            "cd8_t_cell": sample._mapping["Sample"].cd8_t_cell,
-            "cd4_t_cell": sample._mapping["Sample"].cd4_t_cell,
-            "nk_cell": sample._mapping["Sample"].nk_cell,
-            "monocyte": sample._mapping["Sample"].monocyte,
+            "responders_mean": 2,
+            "non_responders_mean": 2,
+            "difference": 2,
+            "p_value": 4,
+            "q_value": 4,
         }
-        for sample in samples
-    ]
-    df = pd.DataFrame(data)
-    df = df.sort_values(by=["sample_id"])
-
-    samples_per_proj_pivot = df.pivot_table(
-        values=["sample_id"],
-        index=["project_id"],
-        aggfunc={"sample_id": pd.Series.nunique},  # type: ignore
-    )
-    subjects_responders_pivot = df.pivot_table(
-        values=["subject_id"],
-        index=["response"],
-        aggfunc={"subject_id": pd.Series.nunique},  # type: ignore
-    )
-    subjects_sex_pivot = df.pivot_table(
-        values=["subject_id"],
-        index=["F/M"],
-        aggfunc={"subject_id": pd.Series.nunique},  # type: ignore
-    )
-    big_pivot = df.pivot_table(
-        values=["sample_id", "subject_id"],
-        index=["project_id", "F/M", "response"],
-        aggfunc={
-            "sample_id": pd.Series.nunique,  # type: ignore
-            "subject_id": pd.Series.nunique,  # type: ignore
-        },
-    )
-
-    df_html = df.to_html()
+    ).to_html(index=False)
+    out = PAGE.render(
+        title=f"Cohort Screen ({label})",
+        nav="",
+        main=f"""<section>
+<p>
+  Welch t-tests of responders vs. non-responders for every
+  condition/treatment/sample type/time point cohort and cell
+  population, sorted by p-value. q-values are Benjamini-Hochberg
+  adjusted across the whole screen.
+</p>
+{screen_html}
+</section>""",
+        footer="",
+    )
+    clock.lap("html")
+
+    return out
+
+
+async def data_subset_analysis(db: AsyncSession) -> str:
+    return await cached_analysis(
+        db, "data_subset_analysis", {}, lambda: _data_subset_analysis(db)
+    )
+
+
+def _grouping_set(counts: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # The grand total set has an empty "grouped_by", which is read back as NaN
+    in_set = (
+        counts["grouped_by"]
+        .fillna("")
+        .map(lambda g: set(filter(None, g.split(","))) == set(keys))
+    )
+    rows = counts[in_set]
+    return rows.dropna(subset=keys).set_index(keys).sort_index() if keys else rows
+
+
+async def _data_subset_analysis(db: AsyncSession) -> str:
+    # Get counts of PBMC baseline samples from melanoma patients on miraclib.
+    # Only the aggregates are read here; the samples are listed page by page at
+    # /data-subset-analysis/samples.
+    counts = await _timed_query(
+        get_subset_counts(
+            db,
+            [
+                [],
+                ["project_id"],
+                ["response"],
+                ["sex"],
+                ["project_id", "sex", "response"],
+            ],
+            **SUBSET,
+        )
+    )
+    return await run_cpu(_render_data_subset_analysis, counts)
+
+
+def _render_data_subset_analysis(counts: pd.DataFrame) -> str:
+    clock = StageClock()
+    counts = counts.rename(columns={"samples": "sample_id", "subjects": "subject_id"})
+
+    samples_per_proj_pivot = _grouping_set(counts, ["project_id"])[["sample_id"]]
+    subjects_responders_pivot = _grouping_set(counts, ["response"])[["subject_id"]]
+    subjects_sex_pivot = _grouping_set(counts, ["sex"])[["subject_id"]].rename_axis(
+        ["F/M"]
+    )
+    big_pivot = (
+        _grouping_set(counts, ["project_id", "sex", "response"])[
+            ["sample_id", "subject_id"]
+        ]
+    ).rename_axis(["project_id", "F/M", "response"])
+    n_samples = int(_grouping_set(counts, [])["sample_id"].sum())
+    clock.lap("frame")
+
     samples_per_proj_html = samples_per_proj_pivot.to_html()
     subjects_responders_html = subjects_responders_pivot.to_html()
     subjects_sex_html = subjects_sex_pivot.to_html()
     big_pivot_html = big_pivot.to_html()
 
-    out = f"""
-    <!doctype html>
-    <html>
+    subset = "(PBMC/Melanoma/Miraclib/Baseline)"
+    out = PAGE.render(
+        title=f"Data Subset Analysis {subset}",
+        nav=nav_html(
+            [
+                ("samples-per-project", "Samples Per Project"),
+                (
+                    "responders-vs-non-responders",
+                    "Responders (True) vs. Non-Responders (False)",
+                ),
+                ("patient-sex-distribution", "Patient Sex Distribution"),
+                ("subset-analysis-summary", "Subset Analysis Summary"),
+                ("all-patient-samples", "All Patient Samples"),
+            ]
+        ),
+        main=section_html(
+            "samples-per-project",
+            f"Samples Per Project {subset}",
+            samples_per_proj_html,
+        )
+        + section_html(
+            "responders-vs-non-responders",
+            f"Responders (True) vs. Non-Responders (False) {subset}",
+            subjects_responders_html,
+        )
+        + section_html(
+            "patient-sex-distribution",
+            f"Patient Sex Distribution {subset}",
+            subjects_sex_html,
+        )
+        + section_html(
+            "subset-analysis-summary",
+            f"Subset Analysis Summary {subset}",
+            big_pivot_html,
+        )
+        + section_html(
+            "all-patient-samples",
+            f"All Patient Samples {subset}",
+            f"""<p>
+  {n_samples} samples match this subset.
+  <a href="/data-subset-analysis/samples">Browse them page by page</a>.
+</p>""",
+        ),
+        footer="",
+    )
 
-      <head>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>Teiko Demo - Data Subset Analysis (PBMC/Melanoma/Miraclib/Baseline)</title>
-        <style>
-          html, body {{
-              width: 100%;
-              margin: 0;
-              padding: 0;
-              background: #222;          /* dark background */
-              color: #eee;               /* light text */
-              font-size: 12px;          /* base font size */
-          }}
-
-          header {{
-            text-align: center;
-            font-family: Arial, Helvetica, sans-serif;
-            font-size: 1.5rem;
-            margin: 20px 0;
-            color: #eee;
-            border-bottom: 2px solid #e0e0e0;
-            padding-bottom: 10px;
-          }}
-
-          h2 {{
-            text-align: center;
-            font-family: Arial, Helvetica, sans-serif;
-            font-size: 18px;            /* Smaller font size for h2 */
-            margin: 15px 0;
-            color: #eee;
-            border-bottom: 1px solid #e0e0e0; /* Subtle underline */
-            padding-bottom: 5px;
-          }}
-
-          p {{
-            max-width: 500px;
-            margin: 2rem auto;
-            font-size: 14px;
-            line-height: 1.5;
-          }}
-
-          nav {{
-            text-align: center;
-            margin: 20px 0;
-            padding-top: 10px;
-            padding-bottom: 20px;
-          }}
-
-          nav ul {{
-            list-style: none;           /* Remove bullet points */
-            padding: 0;
-            margin: 0;
-            display: inline-flex;       /* Horizontal layout */
-            gap: 15px;                  /* Space between links */
-          }}
-
-          nav ul li {{
-            display: inline;            /* Ensure list items are inline */
-          }}
-
-          nav ul li a {{
-            color: #1a73e8;             /* Blue links */
-            text-decoration: none;
-            font-size: 1.5rem;
-            padding: 10px 15px;
-            border: 1px solid #1a73e8;  /* Add a border for buttons */
-            border-radius: 5px;         /* Rounded corners */
-            transition: all 0.3s ease;  /* Smooth hover effect */
-          }}
-
-          nav ul li a:hover {{
-            background-color: #1a73e8;  /* Blue background on hover */
-            color: #fff;                /* White text on hover */
-          }}
-
-          table {{
-              margin: 2rem auto;          /* center the table */
-              border-collapse: collapse;  /* cleaner borders */
-              background: #222;           /* dark background */
-              color: #fff;                /* white text */
-              font-family: sans-serif;
-              min-width: 300px;
-          }}
-
-          th, td {{
-              padding: 0.75rem 1rem;
-              border: 1px solid #444;     /* subtle borders */
-              text-align: left;
-          }}
-
-          th {{
-              background: #333;           /* slightly lighter header */
-              font-weight: 600;
-          }}
-
-          tr:nth-child(even) td {{
-              background: #2a2a2a;        /* alternating dark rows */
-          }}
-
-          tr:hover td {{
-              background: #383838;        /* highlight on hover */
-          }}
-
-          .plotly-graph-div.js-plotly-plot {{
-            margin: 2rem auto;
-            min-height: 600px;
-            max-width: 1400px;
-
-          }}
-
-        </style>
-      </head>
-      <body>
-          <header>
-            <h1>Teiko Demo - Data Subset Analysis (PBMC/Melanoma/Miraclib/Baseline)</h1>
-          </header>
-          <nav>
-            <ul>
-              <li><a href="#samples-per-project">Samples Per Project</a></li>
-              <li><a href="#responders-vs-non-responders">Responders (True) vs. Non-Responders (False)</a></li>
-              <li><a href="#patient-sex-distribution">Patient Sex Distribution</a></li>
-              <li><a href="#subset-analysis-summary">Subset Analysis Summary</a></li>
-              <li><a href="#all-patient-samples">All Patient Samples</a></li>
-            </ul>
-          </nav>
-          <main>
-            <section id="samples-per-project">
-              <h2>Samples Per Project (PBMC/Melanoma/Miraclib/Baseline)</h2>
-              {samples_per_proj_html}
-            </section>
-            <section id="responders-vs-non-responders">
-              <h2>Responders (True) vs. Non-Responders (False) (PBMC/Melanoma/Miraclib/Baseline)</h2>
-              {subjects_responders_html}
-            </section>
-            <section id="patient-sex-distribution">
-              <h2>Patient Sex Distribution (PBMC/Melanoma/Miraclib/Baseline)</h2>
-              {subjects_sex_html}
-            </section>
-            <section id="subset-analysis-summary">
-              <h2>Subset Analysis Summary (PBMC/Melanoma/Miraclib/Baseline)</h2>
-              {big_pivot_html}
-            </section>
-            <section id="all-patient-samples">
-              <h2>All Patient Samples (PBMC/Melanoma/Miraclib/Baseline)</h2>
-              {df_html}
-            </section>
-          </main>
-      </body>
-    </html>
-    """
+    clock.lap("html")
+
+    return out
+
+
+async def longitudinal_analysis(
+    db: AsyncSession,
+    sample_types: list[str] | None = None,
+    conditions: list[str] | None = None,
+    treatment_types: list[str] | None = None,
+    time_points: list[int] | None = None,
+    output_format: str = "html",
+) -> str:
+    return await cached_analysis(
+        db,
+        "longitudinal_analysis",
+        dict(
+            sample_types=sample_types,
+            conditions=conditions,
+            treatment_types=treatment_types,
+            time_points=time_points,
+            output_format=output_format,
+        ),
+        lambda: _longitudinal_analysis(
+            db, sample_types, conditions, treatment_types, time_points, output_format
+        ),
+    )
+
+
+async def _longitudinal_analysis(
+    db: AsyncSession,
+    sample_types: list[str] | None,
+    conditions: list[str] | None,
+    treatment_types: list[str] | None,
+    time_points: list[int] | None,
+    output_format: str,
+) -> str:
+    filters: dict = dict(
+        sample_types=sample_types,
+        conditions=conditions,
+        treatment_types=treatment_types,
+        time_points=time_points,
+    )
+    samples: pd.DataFrame | matrix.CohortSelection
+    if matrix.DIRECTORY is not None:
+        # Only the cohort's subjects and responses are read from the database,
+        # the counts are sliced from the shared matrix
+        with stage("matrix"):
+            store = await matrix.current_store(db)
+        responses_df = await _timed_query(
+            get_subject_responses(db, conditions, treatment_types)
+        )
+        samples = matrix.CohortSelection(
+            str(store.path),
+            sample_types,
+            time_points,
+            responses_df["subject_id"].to_numpy(dtype=str),
+            responses_df["response"].astype(float).to_numpy(),
+        )
+    else:
+        # One row per sample with its raw counts, read column-wise from sample
+        # alone; the percentages are derived from them as in sample_frequency,
+        # which saves a join per population on large cohorts
+        samples = await _timed_query(
+            get_sample_frame(
+                db, ["subject_id", "response", "time", *POPULATIONS], **filters
+            )
+        )
+    return await run_cpu(_render_longitudinal_analysis, filters, samples, output_format)
+
+
+def _longitudinal_frames(
+    samples: pd.DataFrame | matrix.CohortSelection,
+) -> tuple[int, np.ndarray, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    clock = StageClock()
+    if isinstance(samples, pd.DataFrame):
+        subject_ids = samples["subject_id"].to_numpy()
+        time_points = samples["time"].to_numpy()
+        response = samples["response"].astype(float).to_numpy()
+        counts = samples[POPULATIONS].to_numpy(dtype=float)
+    else:
+        subject_ids, time_points, response, counts = samples.arrays()
+    total = np.nansum(counts, axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percentages = np.where(total > 0, counts / total * 100, np.nan)
+    trajectories = build_trajectories(subject_ids, time_points, response, percentages)
+    clock.lap("frame", len(subject_ids))
+    times = trajectories.time_points
+    n_populations = len(POPULATIONS)
+
+    paired = paired_tests(trajectories)
+    paired_df = pd.DataFrame(
+        {
+            "time": np.repeat(times[1:], n_populations),
+            "population": np.tile(POPULATIONS, max(len(times) - 1, 0)),
+            **{name: values.ravel() for name, values in paired.items()},
+        }
+    )
+    # Benjamini-Hochberg adjustment across the paired tests
+    tested = paired_df["p_value"].notna().to_numpy()
+    paired_df["q_value"] = np.nan
+    if tested.any():
+        paired_df.loc[tested, "q_value"] = stats.false_discovery_control(
+            paired_df.loc[tested, "p_value"].to_numpy()
+        )
+
+    anova_df = pd.DataFrame(
+        {"population": POPULATIONS, **repeated_measures(trajectories)}
+    ).rename(columns={"n": "complete_subjects"})
+    means = mean_trajectories(trajectories)
+    means_df = pd.DataFrame(
+        {
+            "time": np.repeat(times, n_populations),
+            "population": np.tile(POPULATIONS, len(times)),
+            **{name: values.ravel() for name, values in means.items()},
+        }
+    )
+    clock.lap("stats")
+    return len(trajectories.subject_ids), times, paired_df, anova_df, means_df
+
+
+def _render_longitudinal_analysis(
+    filters: dict,
+    samples: pd.DataFrame | matrix.CohortSelection,
+    output_format: str,
+) -> str:
+    n_subjects, times, paired_df, anova_df, means_df = _longitudinal_frames(samples)
+    clock = StageClock()
+    if output_format == "json":
+        out = json.dumps(
+            {
+                "subjects": n_subjects,
+                "time_points": times.tolist(),
+                "paired": json.loads(paired_df.to_json(orient="records")),
+                "repeated_measures": json.loads(anova_df.to_json(orient="records")),
+                "trajectories": json.loads(means_df.to_json(orient="records")),
+            }
+        )
+        clock.lap("json")
+        return out
+
+    label = cohort_label(
+        filters["sample_types"],
+        filters["conditions"],
+        filters["treatment_types"],
+        filters["time_points"],
+    )
+    # Mean trajectories with standard errors: a handful of points per line
+    # however many subjects there are
+    fig = go.Figure()
+    for ctype in POPULATIONS:
+        rows = means_df[means_df["population"] == ctype]
+        for grp, prefix, dash in [
+            ("Responders", "responders", "solid"),
+            ("Non-Responders", "non_responders", "dash"),
+        ]:
+            fig.add_trace(
+                go.Scatter(
+                    x=rows["time"],
+                    y=rows[f"{prefix}_mean"],
+                    error_y=dict(type="data", array=rows[f"{prefix}_sem"]),
+                    name=f"{ctype} - {grp}",
+                    legendgroup=ctype,
+                    mode="lines+markers",
+                    line=dict(dash=dash),
+                )
+            )
+    fig.update_layout(
+        xaxis_title="Days from treatment start",
+        yaxis_title="Mean percentage (%)",
+        dragmode="pan",
+        plot_bgcolor="rgb(50, 50, 50)",
+        paper_bgcolor="rgb(50, 50, 50)",
+        xaxis=dict(color="white", gridcolor="gray", tickvals=times.tolist()),
+        yaxis=dict(color="white", gridcolor="gray"),
+        font=dict(color="white"),
+    )
+    clock.lap("plot")
+    fig_html = fig.to_html(
+        full_html=False, include_plotlyjs=PLOTLY_JS_URL, config={"displaylogo": False}
+    )
+    paired_html = paired_df.round(
+        {
+            "mean_delta": 2,
+            "sd_delta": 2,
+            "t": 2,
+            "p_value": 4,
+            "q_value": 4,
+            "responders_mean_delta": 2,
+            "non_responders_mean_delta": 2,
+            "response_p_value": 4,
+        }
+    ).to_html(index=False)
+    anova_html = anova_df.round({"f": 2, "p_value": 4}).to_html(index=False)
+    baseline = "baseline" if not len(times) or times[0] == 0 else f"day {times[0]}"
+
+    out = PAGE.render(
+        title=f"Longitudinal Analysis ({label})",
+        nav="",
+        main=section_html(
+            "trajectories",
+            f"Mean Cell Type Percentages Over Time ({label})",
+            f"""<p>
+  {n_subjects} subjects. Error bars are standard errors of the mean.
+</p>
+{fig_html}""",
+        )
+        + section_html(
+            "paired-tests",
+            f"Change From {baseline.title()} ({label})",
+            f"""<p>
+  Paired t-tests of each time point against {baseline}
+  over the subjects sampled at both, with Benjamini-Hochberg
+  q-values, and Welch t-tests of the change in responders vs.
+  non-responders.
+</p>
+{paired_html}""",
+        )
+        + section_html(
+            "repeated-measures",
+            f"Repeated-Measures ANOVA ({label})",
+            f"""<p>
+  One-way repeated-measures ANOVA of time over the subjects
+  sampled at every time point.
+</p>
+{anova_html}""",
+        ),
+        footer="",
+    )
+
+    clock.lap("html")
 
     return out
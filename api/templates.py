@@ -0,0 +1,85 @@
+import hashlib
+import re
+from html import escape
+from pathlib import Path
+
+# The dashboards' stylesheet, shared with the landing page. Pages link it at a
+# URL carrying a digest of its content, so browsers cache it indefinitely and
+# still pick up edits.
+STYLE_PATH = Path(__file__).resolve().parent.parent / "client" / "style.css"
+STYLE_DIGEST = hashlib.blake2b(STYLE_PATH.read_bytes(), digest_size=8).hexdigest()
+STYLE_URL = f"/client/style-{STYLE_DIGEST}.css"
+
+
+class Layout:
+    # A page shell with {name} slots, split once at its slots so rendering a
+    # page is a single join. Slot values are inserted as is, so they must
+    # already be escaped HTML.
+
+    def __init__(self, source: str, **fixed: str):
+        self._parts = _fold(re.split(r"\{(\w+)\}", source), fixed)
+
+    def render(self, **slots: str) -> str:
+        out = self._parts[:]
+        out[1::2] = [slots[name] for name in self._parts[1::2]]
+        return "".join(out)
+
+    def split(self, slot: str, **slots: str) -> tuple[str, "Layout"]:
+        # The page before one slot, and the rest of the shell, for responses
+        # that stream the slot's content and fill the remaining slots last
+        i = self._parts.index(slot)
+        head = Layout("")
+        head._parts = _fold(self._parts[:i], slots)
+        tail = Layout("")
+        tail._parts = _fold(self._parts[i + 1 :], slots)
+        return head.render(), tail
+
+
+def _fold(parts: list[str], slots: dict[str, str]) -> list[str]:
+    # parts holds literal text at even indices and slot names at odd ones.
+    # The given slots are merged into the text around them.
+    folded = [parts[0]]
+    for name, text in zip(parts[1::2], parts[2::2]):
+        if name in slots:
+            folded[-1] += slots[name] + text
+        else:
+            folded += [name, text]
+    return folded
+
+
+PAGE = Layout(
+    """<!doctype html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1" />
+    <title>Teiko Demo - {title}</title>
+    <link rel="stylesheet" href="{style_url}" />
+  </head>
+  <body>
+    <header>
+      <h1>Teiko Demo - {title}</h1>
+    </header>
+    {nav}
+    <main>
+{main}
+    </main>
+    {footer}
+  </body>
+</html>
+""",
+    style_url=STYLE_URL,
+)
+
+
+def nav_html(links: list[tuple[str, str]]) -> str:
+    # In-page links to the sections with the given ids
+    items = "".join(
+        f'<li><a href="#{section_id}">{escape(text)}</a></li>'
+        for section_id, text in links
+    )
+    return f"<nav><ul>{items}</ul></nav>"
+
+
+def section_html(section_id: str, heading: str, body: str) -> str:
+    return f'<section id="{section_id}">\n<h2>{heading}</h2>\n{body}\n</section>\n'
@@ -0,0 +1,113 @@
+# Compare the ORM row path with the columnar COPY path in api.crud.
+# Run against a seeded database with `python -m bench.columnar_read`.
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+import pandas as pd  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import crud
+from api.database import SessionLocal, engine
+from api.models import POPULATIONS
+from bench.common import COHORT
+
+
+async def orm_overview(db: AsyncSession) -> pd.DataFrame:
+    samples = await crud.get_samples_by_sample_id(db, None)
+    data = [
+        {
+            "subject_id": sample._mapping["Sample"].subject_id,
+            "sample_id": sample._mapping["Sample"].sample_id,
+            "sample_type": sample._mapping["Sample"].sample_type,
+            **{p: getattr(sample._mapping["Sample"], p) for p in POPULATIONS},
+        }
+        for sample in samples
+    ]
+    return pd.DataFrame(data).sort_values(by=["sample_id"])
+
+
+async def columnar_overview(db: AsyncSession) -> pd.DataFrame:
+    return await crud.get_sample_frame(
+        db, ["subject_id", "sample_id", "sample_type", *POPULATIONS]
+    )
+
+
+async def orm_cohort(db: AsyncSession) -> pd.DataFrame:
+    samples = await crud.get_samples_by_sample_condition_treatment_timeline(
+        db, time_points=None, **COHORT
+    )
+    data = [
+        {
+            "subject_id": sample._mapping["Sample"].subject_id,
+            "sample_id": sample._mapping["Sample"].sample_id,
+            "condition": sample._mapping["Treatment"].subject_condition_name,
+            "treatment": sample._mapping["Treatment"].treatment_name,
+            "response": sample._mapping["Treatment"].response,
+            "sample_type": sample._mapping["Sample"].sample_type,
+            "time": sample._mapping["Sample"].time_from_treatment_start,
+            **{p: getattr(sample._mapping["Sample"], p) for p in POPULATIONS},
+        }
+        for sample in samples
+    ]
+    return pd.DataFrame(data).sort_values(by=["sample_id"])
+
+
+async def columnar_cohort(db: AsyncSession) -> pd.DataFrame:
+    return await crud.get_sample_frame(
+        db,
+        [
+            "subject_id",
+            "sample_id",
+            "condition",
+            "treatment",
+            "response",
+            "sample_type",
+            "time",
+            *POPULATIONS,
+        ],
+        time_points=None,
+        **COHORT,
+    )
+
+
+async def best_of(
+    func: Callable[[AsyncSession], Awaitable[pd.DataFrame]], repeat: int
+) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        async with SessionLocal() as db:
+            start = time.perf_counter()
+            df = await func(db)
+            timings.append(time.perf_counter() - start)
+    return min(timings), len(df)
+
+
+async def run(repeat: int) -> None:
+    engine.echo = False
+    print(
+        f"{'workload':<10} {'rows':>9} {'orm (s)':>9} {'columnar (s)':>13} {'speedup':>8}"
+    )
+    for name, orm, columnar in [
+        ("overview", orm_overview, columnar_overview),
+        ("cohort", orm_cohort, columnar_cohort),
+    ]:
+        orm_time, rows = await best_of(orm, repeat)
+        columnar_time, _ = await best_of(columnar, repeat)
+        print(
+            f"{name:<10} {rows:>9} {orm_time:>9.4f} {columnar_time:>13.4f} "
+            f"{orm_time / columnar_time:>7.1f}x"
+        )
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
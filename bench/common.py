@@ -0,0 +1,52 @@
+# Filters and ids shared by the bench scripts. Ids are read from the database,
+# so the scripts run against the seed data as well as generated datasets.
+from dataclasses import dataclass
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import Project, Sample
+
+
+COHORT: dict = dict(
+    sample_types=["PBMC"], conditions=["melanoma"], treatment_types=["miraclib"]
+)
+BASELINE: dict = dict(
+    sample_types=["WB"],
+    conditions=["melanoma"],
+    treatment_types=["miraclib"],
+    time_points=[0],
+)
+
+
+@dataclass
+class Ids:
+    project_ids: list[str]
+    subject_ids: list[str]
+    sample_ids: list[str]
+    # A sample_id about halfway through the table, to start keyset pages from
+    middle_sample_id: str
+
+
+async def lookup_ids(db: AsyncSession) -> Ids:
+    project_ids = (await db.scalars(select(Project.project_id).limit(1))).all()
+    samples = (
+        await db.execute(
+            select(Sample.sample_id, Sample.subject_id)
+            .order_by(Sample.sample_id)
+            .limit(2)
+        )
+    ).all()
+    n_samples = await db.scalar(select(func.count()).select_from(Sample))
+    middle_sample_id = await db.scalar(
+        select(Sample.sample_id)
+        .order_by(Sample.sample_id)
+        .offset((n_samples or 0) // 2)
+        .limit(1)
+    )
+    return Ids(
+        list(project_ids),
+        [sample.subject_id for sample in samples],
+        [sample.sample_id for sample in samples[:1]],
+        middle_sample_id or "",
+    )
@@ -0,0 +1,187 @@
+# Capture EXPLAIN (ANALYZE, BUFFERS) for the cohort queries in api.crud and fail
+# when a plan falls back to a sequential scan of a large table. Run against a
+# seeded (ideally large) database with `python -m bench.explain_plans`.
+import argparse
+import asyncio
+import json
+import sys
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import crud
+from api.database import SessionLocal, compile_positional, engine
+from api.models import POPULATIONS
+from bench.common import BASELINE, COHORT, Ids, lookup_ids
+
+
+@dataclass
+class Case:
+    name: str
+    # Either a crud call whose statements are captured as they execute, or the
+    # keyword arguments of a get_sample_frame call, which is compiled directly
+    # because it runs through COPY instead of a cursor
+    call: Callable[[AsyncSession], Awaitable[Any]] | None = None
+    frame: dict | None = None
+    # Tables that may be scanned because the filter selects most of their rows
+    allow_seq_scan: set[str] = field(default_factory=set)
+
+
+def cases(ids: Ids) -> list[Case]:
+    return [
+        Case(
+            "timeline_cohort",
+            call=lambda db: crud.get_samples_by_sample_condition_treatment_timeline(
+                db, time_points=None, **COHORT
+            ),
+            allow_seq_scan={"sample"},
+        ),
+        Case(
+            "timeline_baseline",
+            call=lambda db: crud.get_samples_by_sample_condition_treatment_timeline(
+                db, **BASELINE
+            ),
+        ),
+        Case(
+            "subset_baseline",
+            call=lambda db: crud.get_for_subset_analysis(db, **BASELINE),
+        ),
+        Case(
+            "subject_samples",
+            call=lambda db: crud.get_subject_projects(db, ids.subject_ids),
+        ),
+        Case(
+            "project_subjects",
+            call=lambda db: crud.get_project_subjects(db, ids.project_ids),
+        ),
+        Case(
+            "imports_by_sample",
+            call=lambda db: crud.get_imports_by_sample_id(db, ids.sample_ids),
+        ),
+        Case(
+            "percentage_threshold",
+            call=lambda db: crud.get_sample_ids_by_percentage(db, "b_cell", 20.0),
+        ),
+        Case(
+            "overview_page",
+            frame=dict(
+                columns=[
+                    "subject_id",
+                    "sample_id",
+                    "sample_type",
+                    *POPULATIONS,
+                    "total_cells",
+                    *[f"{p} (%)" for p in POPULATIONS],
+                ],
+                after_sample_id=ids.middle_sample_id,
+                limit=1001,
+            ),
+        ),
+        Case(
+            "frame_baseline",
+            frame=dict(
+                columns=["sample_id", "response", *[f"{p} (%)" for p in POPULATIONS]],
+                **BASELINE,
+            ),
+        ),
+    ]
+
+
+def walk(node: dict) -> list[dict]:
+    return [node, *[n for child in node.get("Plans", []) for n in walk(child)]]
+
+
+async def table_rows(db: AsyncSession) -> dict[str, int]:
+    result = await db.execute(
+        text(
+            "SELECT relname, GREATEST(reltuples, 0)::BIGINT FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        )
+    )
+    return {name: rows for name, rows in result.all()}
+
+
+async def capture(db: AsyncSession, case: Case) -> list[tuple[str, tuple]]:
+    if case.frame is not None:
+        return [compile_positional(crud._sample_columns_stmt(**case.frame))]
+
+    statements: list[tuple[str, tuple]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, tuple(parameters or ())))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        assert case.call is not None
+        await case.call(db)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+    return statements
+
+
+async def explain(db: AsyncSession, sql: str, parameters: tuple) -> dict:
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    plan = await raw_connection.driver_connection.fetchval(  # type: ignore
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *parameters
+    )
+    # The dialect registers a json codec on its connections, so this is decoded
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+async def run(min_rows: int, output: Path | None) -> int:
+    engine.echo = False
+    failures = 0
+    print(
+        f"{'case':<22} {'ms':>9} {'hit':>8} {'read':>8}  seq scans over {min_rows} rows"
+    )
+    async with SessionLocal() as db:
+        await db.execute(text("ANALYZE"))
+        rows = await table_rows(db)
+        for case in cases(await lookup_ids(db)):
+            for i, (sql, parameters) in enumerate(await capture(db, case)):
+                plan = await explain(db, sql, parameters)
+                nodes = walk(plan["Plan"])
+                seq_scans = sorted(
+                    {
+                        node["Relation Name"]
+                        for node in nodes
+                        if node["Node Type"] == "Seq Scan"
+                        and rows.get(node["Relation Name"], 0) > min_rows
+                    }
+                )
+                failed = set(seq_scans) - case.allow_seq_scan
+                failures += bool(failed)
+                name = case.name if i == 0 else f"{case.name}[{i}]"
+                print(
+                    f"{name:<22} {plan['Execution Time']:>9.2f} "
+                    f"{plan['Plan'].get('Shared Hit Blocks', 0):>8} "
+                    f"{plan['Plan'].get('Shared Read Blocks', 0):>8}  "
+                    f"{', '.join(seq_scans) or '-'}"
+                    f"{'  FAIL' if failed else ''}"
+                )
+                if output is not None:
+                    output.mkdir(parents=True, exist_ok=True)
+                    (output / f"{name}.json").write_text(
+                        json.dumps({"sql": sql, "plan": plan}, indent=2)
+                    )
+        await db.rollback()
+    await engine.dispose()
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    # Smaller tables fit in a few pages and are legitimately cheaper to scan
+    parser.add_argument("--min-rows", type=int, default=10000)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(run(args.min_rows, args.output)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Write a synthetic cell-count CSV shaped like db/init/cell-count.csv, for loading
+# a large database with `python -m api.ingest`. For example
+# `python -m bench.generate_data /tmp/cell-count-1m.csv --rows 1m`.
+import argparse
+import math
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from api.ingest import CSV_COLUMNS
+from api.models import POPULATIONS
+
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Per-population (mean, standard deviation), close to those of cell-count.csv
+COUNT_MOMENTS = {
+    "b_cell": (9900, 3200),
+    "cd8_t_cell": (25000, 4700),
+    "cd4_t_cell": (30400, 5300),
+    "nk_cell": (15000, 3800),
+    "monocyte": (20100, 4400),
+}
+# Responders get slightly more cd4 T cells, so the analyses have an effect to find
+RESPONDER_EFFECT = {"cd4_t_cell": 1.03}
+
+
+def names(prefix: str, known: list[str], n: int) -> list[str]:
+    return [*known, *[f"{prefix}{i}" for i in range(len(known) + 1, n + 1)]][:n]
+
+
+def subject_chunks(
+    rows: int,
+    projects: int,
+    subjects_per_project: int,
+    conditions: list[str],
+    treatments: list[str],
+    time_points: list[int],
+    seed: int,
+    chunk_subjects: int,
+) -> Iterator[pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    n_subjects = projects * subjects_per_project
+    subject_width = max(3, len(str(n_subjects - 1)))
+    sample_width = max(5, len(str(n_subjects * len(time_points) - 1)))
+    written = 0
+    for start in range(0, n_subjects, chunk_subjects):
+        subject = np.arange(start, min(start + chunk_subjects, n_subjects))
+        n = len(subject)
+        condition = rng.choice(conditions, n)
+        healthy = condition == "healthy"
+        treatment = np.where(healthy, "none", rng.choice(treatments, n))
+        responder = rng.random(n) < 0.5
+        response = np.where(healthy, "", np.where(responder, "yes", "no"))
+        subjects = pd.DataFrame(
+            {
+                "project": "prj"
+                + pd.Series(subject // subjects_per_project + 1).astype(str),
+                "subject": "sbj"
+                + pd.Series(subject).astype(str).str.zfill(subject_width),
+                "condition": condition,
+                "age": rng.integers(50, 80, n),
+                "sex": rng.choice(["M", "F"], n),
+                "treatment": treatment,
+                "response": response,
+                "sample_type": rng.choice(["PBMC", "WB"], n, p=[0.7, 0.3]),
+            }
+        )
+
+        # One sample per subject and time point, numbered subject-major
+        df = subjects.loc[subjects.index.repeat(len(time_points))].reset_index(
+            drop=True
+        )
+        df["sample"] = "sample" + pd.Series(
+            np.repeat(subject, len(time_points)) * len(time_points)
+            + np.tile(np.arange(len(time_points)), n)
+        ).astype(str).str.zfill(sample_width)
+        df["time_from_treatment_start"] = np.tile(time_points, n)
+        effect = np.repeat(responder & ~healthy, len(time_points))
+        for population in POPULATIONS:
+            mean, std = COUNT_MOMENTS[population]
+            counts = rng.normal(mean, std, len(df))
+            counts *= np.where(effect, RESPONDER_EFFECT.get(population, 1.0), 1.0)
+            df[population] = np.clip(counts, 0, None).round().astype(np.int64)
+
+        df = df[CSV_COLUMNS].iloc[: rows - written]
+        written += len(df)
+        yield df
+        if written >= rows:
+            break
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic cell-count CSV")
+    parser.add_argument("path")
+    parser.add_argument(
+        "--rows",
+        default="10k",
+        help=f"row count, or one of {', '.join(SIZES)}",
+    )
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument(
+        "--subjects-per-project",
+        type=int,
+        default=None,
+        help="defaults to just enough subjects for --rows",
+    )
+    parser.add_argument("--conditions", type=int, default=3)
+    parser.add_argument("--treatments", type=int, default=2)
+    parser.add_argument("--time-points", type=int, nargs="+", default=[0, 7, 14])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-subjects", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rows = SIZES.get(args.rows.lower()) or int(args.rows)
+    subjects_per_project = args.subjects_per_project or math.ceil(
+        rows / (args.projects * len(args.time_points))
+    )
+    rows = min(rows, args.projects * subjects_per_project * len(args.time_points))
+    conditions = names(
+        "condition", ["melanoma", "carcinoma", "healthy"], args.conditions
+    )
+    treatments = names("treatment", ["miraclib", "phauximab"], args.treatments)
+
+    with open(args.path, "w", newline="") as f:
+        for i, df in enumerate(
+            subject_chunks(
+                rows,
+                args.projects,
+                subjects_per_project,
+                conditions,
+                treatments,
+                args.time_points,
+                args.seed,
+                args.chunk_subjects,
+            )
+        ):
+            df.to_csv(f, header=i == 0, index=False)
+    print(f"Wrote {rows} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Measure how well the api keeps answering light requests while it renders
+# heavy dashboards, for one TEIKO_ANALYSIS_EXECUTOR mode. Starts uvicorn against
+# the configured database, sends --concurrency statistical analysis requests
+# (each with different parameters, so none is served from the cache) and pings
+# `/` until they are done, e.g.
+# `python -m bench.responsiveness --executor process --concurrency 4`.
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.startup import free_port
+
+
+DASHBOARD = "/statistical-analysis"
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout_s: float) -> None:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout_s:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"api not ready within {timeout_s}s")
+
+
+async def measure(port: int, concurrency: int, timeout_s: float) -> None:
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", timeout=timeout_s
+    ) as client:
+        await wait_ready(client, timeout_s)
+        # Per-sample tables make the render heavy, and the filters differ
+        # between requests so each is a separate cache entry
+        params: list[dict] = []
+        for i in range(concurrency):
+            params.append(
+                {"samples": "true", "outliers": "true", "time": [0, 7, 14][: i % 3 + 1]}
+            )
+            if i >= 3:
+                params[-1]["sample_type"] = ["PBMC", "WB"]
+        start = time.perf_counter()
+        dashboards = [
+            asyncio.create_task(client.get(DASHBOARD, params=p)) for p in params
+        ]
+        pings = []
+        while not all(task.done() for task in dashboards):
+            ping_start = time.perf_counter()
+            await client.get("/")
+            pings.append((time.perf_counter() - ping_start) * 1000)
+            await asyncio.sleep(0.01)
+        responses = await asyncio.gather(*dashboards)
+        elapsed = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in responses)
+    print(f"dashboards: {concurrency} in {elapsed:.2f}s")
+    print(
+        f"/ during render: n={len(pings)} "
+        f"median={statistics.median(pings):.1f}ms max={max(pings):.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--executor", choices=["inline", "thread", "process"], default="process"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout-s", type=float, default=300)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "api.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env={
+            **os.environ,
+            "TEIKO_DB_ECHO": "0",
+            "TEIKO_WARM_UP": "startup",
+            "TEIKO_ANALYSIS_EXECUTOR": args.executor,
+            "TEIKO_ANALYSIS_WORKERS": str(args.workers),
+        },
+    )
+    try:
+        asyncio.run(measure(port, args.concurrency, args.timeout_s))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Report how long the api takes to start: the import time of api.main and the
+# top-level modules it pulls in (from `python -X importtime`), and the time from
+# launching uvicorn to the first successful response. With budgets given, exit
+# non-zero when either is exceeded, e.g. in CI:
+# `python -m bench.startup --import-budget-ms 2000 --first-request-budget-ms 4000`.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+def import_times(module: str) -> dict[str, float]:
+    # Cumulative milliseconds for the module, each import it makes directly and
+    # every api module. Children are printed before their parent, so the
+    # module's imports are the lines since the previous top-level import.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Nesting is shown by indentation, two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                times[name] = int(cumulative) / 1000
+                return times
+            times = {}
+        elif depth == 1 or name.startswith("api."):
+            times[name] = int(cumulative) / 1000
+    raise RuntimeError(f"{module} not found in the import time output")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_request(path: str, timeout_s: float) -> float:
+    # Milliseconds from launching the server to the first 200 response on path
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "api.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, "TEIKO_DB_ECHO": os.environ.get("TEIKO_DB_ECHO", "0")},
+    )
+    try:
+        while time.perf_counter() - start < timeout_s:
+            try:
+                with urllib.request.urlopen(
+                    f"http://127.0.0.1:{port}{path}", timeout=timeout_s
+                ) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before serving a request")
+                time.sleep(0.01)
+        raise TimeoutError(f"no response on {path} within {timeout_s}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="api.main")
+    parser.add_argument("--path", default="/", help="path of the first request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--timeout-s", type=float, default=60)
+    parser.add_argument("--import-budget-ms", type=float, default=None)
+    parser.add_argument("--first-request-budget-ms", type=float, default=None)
+    parser.add_argument("--save", type=Path, default=None)
+    args = parser.parse_args()
+
+    # Startup times are noisy, so each is the best of --repeat runs
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    imports = {name: min(run.get(name, 0.0) for run in runs) for name in runs[0]}
+    total_ms = imports.pop(args.module)
+    first_request_ms = min(
+        first_request(args.path, args.timeout_s) for _ in range(args.repeat)
+    )
+
+    print(f"{'module':<40} {'import (ms)':>12}")
+    for name, ms in sorted(imports.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{name:<40} {ms:>12.1f}")
+    print(f"{args.module:<40} {total_ms:>12.1f}")
+    print(f"{'first request ' + args.path:<40} {first_request_ms:>12.1f}")
+
+    if args.save is not None:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "imports_ms": imports,
+                    "import_ms": total_ms,
+                    "first_request_ms": first_request_ms,
+                },
+                indent=2,
+            )
+        )
+    over = []
+    if args.import_budget_ms is not None and total_ms > args.import_budget_ms:
+        over.append(f"import {total_ms:.0f}ms > {args.import_budget_ms:.0f}ms")
+    if (
+        args.first_request_budget_ms is not None
+        and first_request_ms > args.first_request_budget_ms
+    ):
+        over.append(
+            f"first request {first_request_ms:.0f}ms"
+            f" > {args.first_request_budget_ms:.0f}ms"
+        )
+    for line in over:
+        print(f"OVER BUDGET {line}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
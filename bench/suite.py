@@ -0,0 +1,191 @@
+# Time each api.crud query and api.services function against the running
+# database, e.g. one loaded from `python -m bench.generate_data` output.
+# `--save` writes the timings as JSON, and `--compare` exits non-zero when a
+# workload's median is slower than a saved run by more than `--tolerance`.
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import crud, export, services
+from api.database import SessionLocal, engine
+from api.models import POPULATIONS
+from api.templates import PAGE, nav_html, section_html
+from bench.common import BASELINE, COHORT, Ids, lookup_ids
+
+
+Workload = Callable[[AsyncSession, Ids], Awaitable[Any]]
+
+
+async def overview_page(db: AsyncSession, ids: Ids) -> str:
+    return "".join(
+        [chunk async for chunk in services.data_overview(db, ids.middle_sample_id)]
+    )
+
+
+async def subset_samples_page(db: AsyncSession, ids: Ids) -> str:
+    return "".join([chunk async for chunk in services.data_subset_samples(db)])
+
+
+async def export_samples(db: AsyncSession, ids: Ids, output_format: str) -> int:
+    stream = export.export_samples(db, None, COHORT, output_format)  # type: ignore
+    return sum([len(chunk) async for chunk in stream])
+
+
+async def export_cohort(db: AsyncSession, ids: Ids, output_format: str) -> int:
+    stream = export.export_cohort(db, None, COHORT, None, output_format)  # type: ignore
+    return sum([len(chunk) async for chunk in stream])
+
+
+FRAGMENT = "<table>" + "<tr><td>1</td><td>2.50</td></tr>" * 2000 + "</table>"
+
+
+async def render_page(db: AsyncSession, ids: Ids) -> str:
+    # The shared shell alone, around a dashboard-sized fragment
+    return PAGE.render(
+        title="Benchmark",
+        nav=nav_html([(f"s{i}", f"Section {i}") for i in range(4)]),
+        main="".join(section_html(f"s{i}", f"Section {i}", FRAGMENT) for i in range(4)),
+        footer="",
+    )
+
+
+WORKLOADS: dict[str, Workload] = {
+    "crud.get_data_version": lambda db, ids: crud.get_data_version(db),
+    "crud.get_project_by_project_id": lambda db, ids: crud.get_project_by_project_id(
+        db, None
+    ),
+    "crud.get_subjects_by_subject_id": lambda db, ids: crud.get_subjects_by_subject_id(
+        db, ids.subject_ids
+    ),
+    "crud.get_samples_by_sample_id": lambda db, ids: crud.get_samples_by_sample_id(
+        db, ids.sample_ids
+    ),
+    "crud.get_treatments_by_subject_id": lambda db, ids: (
+        crud.get_treatments_by_subject_id(db, ids.subject_ids)
+    ),
+    "crud.get_project_subjects": lambda db, ids: crud.get_project_subjects(
+        db, ids.project_ids
+    ),
+    "crud.get_subject_projects": lambda db, ids: crud.get_subject_projects(
+        db, ids.subject_ids
+    ),
+    "crud.get_samples_by_sample_condition_treatment_timeline": lambda db, ids: (
+        crud.get_samples_by_sample_condition_treatment_timeline(db, **BASELINE)
+    ),
+    "crud.get_for_subset_analysis": lambda db, ids: crud.get_for_subset_analysis(
+        db, **BASELINE
+    ),
+    "crud.get_subset_counts": lambda db, ids: crud.get_subset_counts(
+        db, [[], ["project_id"], ["project_id", "sex", "response"]], **BASELINE
+    ),
+    "crud.get_sample_ids_by_percentage": lambda db, ids: (
+        crud.get_sample_ids_by_percentage(db, "b_cell", 20.0)
+    ),
+    "crud.get_sample_frame[page]": lambda db, ids: crud.get_sample_frame(
+        db,
+        ["subject_id", "sample_id", "sample_type", *POPULATIONS, "total_cells"],
+        after_sample_id=ids.middle_sample_id,
+        limit=1000,
+    ),
+    "crud.get_sample_frame[cohort]": lambda db, ids: crud.get_sample_frame(
+        db,
+        ["sample_id", "response", *[f"{p} (%)" for p in POPULATIONS]],
+        time_points=None,
+        **COHORT,
+    ),
+    "crud.get_percentage_moments": lambda db, ids: crud.get_percentage_moments(
+        db, ["condition", "treatment", "sample_type", "time"]
+    ),
+    "services.get_projects": lambda db, ids: services.get_projects(db),
+    "services.data_overview": overview_page,
+    "services.statistical_analysis": lambda db, ids: services.statistical_analysis(
+        db, **COHORT
+    ),
+    "services.cohort_screen": lambda db, ids: services.cohort_screen(db),
+    "services.statistical_screen": lambda db, ids: services.statistical_screen(
+        db, output_format="json"
+    ),
+    "services.longitudinal_analysis": lambda db, ids: services.longitudinal_analysis(
+        db, sample_types=["PBMC"], output_format="json"
+    ),
+    "services.data_subset_analysis": lambda db, ids: services.data_subset_analysis(db),
+    "services.data_subset_samples": subset_samples_page,
+    "templates.render_page": render_page,
+    "export.export_samples[ndjson]": lambda db, ids: export_samples(db, ids, "ndjson"),
+    "export.export_samples[arrow]": lambda db, ids: export_samples(db, ids, "arrow"),
+    "export.export_cohort[ndjson]": lambda db, ids: export_cohort(db, ids, "ndjson"),
+    "export.export_cohort[arrow]": lambda db, ids: export_cohort(db, ids, "arrow"),
+}
+
+
+async def time_workload(workload: Workload, ids: Ids, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        # Every run is a cache miss, so the timings reflect the computation
+        services.result_cache.clear()
+        async with SessionLocal() as db:
+            start = time.perf_counter()
+            await workload(db, ids)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run(repeat: int, only: str | None) -> dict[str, dict[str, float]]:
+    engine.echo = False
+    async with SessionLocal() as db:
+        ids = await lookup_ids(db)
+    results = {}
+    print(f"{'workload':<56} {'min (s)':>9} {'median (s)':>11}")
+    for name, workload in WORKLOADS.items():
+        if only and only not in name:
+            continue
+        timings = await time_workload(workload, ids, repeat)
+        results[name] = {"min": min(timings), "median": statistics.median(timings)}
+        print(f"{name:<56} {min(timings):>9.4f} {statistics.median(timings):>11.4f}")
+    await engine.dispose()
+    return results
+
+
+def regressions(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    return [
+        f"{name}: {timing['median']:.4f}s vs {baseline[name]['median']:.4f}s"
+        for name, timing in results.items()
+        if name in baseline and timing["median"] > baseline[name]["median"] * tolerance
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-k", dest="only", default=None, help="run matching names")
+    parser.add_argument("--save", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat, args.only))
+    if args.save is not None:
+        args.save.write_text(json.dumps(results, indent=2))
+    if args.compare is not None:
+        slower = regressions(
+            results, json.loads(args.compare.read_text()), args.tolerance
+        )
+        for line in slower:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
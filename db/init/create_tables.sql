@@ -89,6 +89,118 @@ CREATE TABLE IF NOT EXISTS project_subjects (
         ON DELETE CASCADE
 );
 
+-- Secondary indexes for the cohort queries in api.crud. Samples are always
+-- joined to treatments, subjects and projects through subject_id, and cohorts
+-- are filtered on sample type, time point, condition and treatment.
+CREATE INDEX IF NOT EXISTS sample_subject_id_idx
+    ON sample (subject_id);
+
+CREATE INDEX IF NOT EXISTS project_subjects_subject_id_idx
+    ON project_subjects (subject_id) INCLUDE (project_id);
+
+-- Ordered by sample_id within a cohort, so keyset pages can stop early
+CREATE INDEX IF NOT EXISTS sample_type_time_sample_id_idx
+    ON sample (sample_type, time_from_treatment_start, sample_id)
+    INCLUDE (subject_id);
+
+-- Baseline samples are the most common subset analysed
+CREATE INDEX IF NOT EXISTS sample_baseline_idx
+    ON sample (sample_type, sample_id)
+    INCLUDE (subject_id)
+    WHERE time_from_treatment_start = 0;
+
+-- Covers the treatment side of a cohort join without visiting the heap
+CREATE INDEX IF NOT EXISTS treatment_name_condition_subject_idx
+    ON treatment (treatment_name, subject_condition_name, subject_id)
+    INCLUDE (response);
+
+CREATE INDEX IF NOT EXISTS imported_sample_idx
+    ON imported (sample);
+
+-- Long-format relative frequencies, one row per sample and population.
+-- Maintained by api.crud and api.ingest whenever samples are written.
+CREATE TABLE IF NOT EXISTS sample_frequency (
+    sample_id VARCHAR(100) NOT NULL,
+    population VARCHAR(100) NOT NULL,
+    count INT,
+    total_count INT,
+    percentage DOUBLE PRECISION,
+
+    PRIMARY KEY (sample_id, population),
+
+    FOREIGN KEY (sample_id)
+        REFERENCES sample(sample_id)
+        ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS sample_frequency_population_percentage_idx
+    ON sample_frequency (population, percentage);
+
+-- A single-row counter bumped by every write through api.crud, used to key caches
+CREATE TABLE IF NOT EXISTS data_version (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Running count, sum, mean and sum of squared deviations (M2) of the
+-- population percentages of samples with a known response, per cohort group.
+-- Maintained by api.crud and api.ingest in the transaction of every write to
+-- samples or treatments, by merging the changed samples' contributions in and
+-- out, so comparison statistics are read per group rather than per sample.
+-- `python -m api.aggregates verify` checks it against a full recompute.
+CREATE TABLE IF NOT EXISTS percentage_aggregate (
+    condition_name VARCHAR(100) NOT NULL,
+    treatment_name VARCHAR(100) NOT NULL,
+    sample_type VARCHAR(100),
+    time_from_treatment_start INT,
+    response BOOLEAN NOT NULL,
+    population VARCHAR(100) NOT NULL,
+    count BIGINT NOT NULL,
+    sum DOUBLE PRECISION NOT NULL,
+    mean DOUBLE PRECISION NOT NULL,
+    m2 DOUBLE PRECISION NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS percentage_aggregate_group_idx
+    ON percentage_aggregate (
+        condition_name,
+        treatment_name,
+        sample_type,
+        time_from_treatment_start,
+        response,
+        population
+    ) NULLS NOT DISTINCT;
+
+-- Background analysis jobs and their persisted results. Identical submissions
+-- (same analysis, parameters and data version) share one job unless it failed
+-- or was cancelled. Maintained by api.jobs.
+CREATE TABLE IF NOT EXISTS analysis_job (
+    job_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    analysis VARCHAR(100) NOT NULL,
+    params JSONB NOT NULL,
+    data_version BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    media_type VARCHAR(100),
+    result TEXT,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS analysis_job_dedup_idx
+    ON analysis_job (analysis, params, data_version)
+    WHERE status IN ('queued', 'running', 'succeeded');
+
+-- Workers claim the oldest queued job
+CREATE INDEX IF NOT EXISTS analysis_job_queued_idx
+    ON analysis_job (created_at)
+    WHERE status = 'queued';
+
 -- Handle ownership
 ALTER TABLE imported OWNER TO demo_user;
 ALTER TABLE project OWNER TO demo_user;
@@ -97,3 +209,7 @@ ALTER TABLE sample OWNER TO demo_user;
 ALTER TABLE subject_condition OWNER TO demo_user;
 ALTER TABLE treatment OWNER TO demo_user;
 ALTER TABLE project_subjects OWNER TO demo_user;
+ALTER TABLE sample_frequency OWNER TO demo_user;
+ALTER TABLE data_version OWNER TO demo_user;
+ALTER TABLE percentage_aggregate OWNER TO demo_user;
+ALTER TABLE analysis_job OWNER TO demo_user;
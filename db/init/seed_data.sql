@@ -61,6 +61,36 @@ WHERE sample IS NOT NULL
 AND subject IS NOT NULL
 ON CONFLICT (sample_id) DO NOTHING;
 
+-- Populate sample_frequency
+INSERT INTO sample_frequency (
+    sample_id,
+    population,
+    count,
+    total_count,
+    percentage
+)
+SELECT
+    s.sample_id,
+    p.population,
+    p.count,
+    t.total_count,
+    p.count::DOUBLE PRECISION / NULLIF(t.total_count, 0) * 100
+FROM sample s
+CROSS JOIN LATERAL (
+    SELECT COALESCE(s.b_cell, 0) + COALESCE(s.cd8_t_cell, 0)
+        + COALESCE(s.cd4_t_cell, 0) + COALESCE(s.nk_cell, 0)
+        + COALESCE(s.monocyte, 0) AS total_count
+) t
+CROSS JOIN LATERAL (
+    VALUES
+        ('b_cell', s.b_cell),
+        ('cd8_t_cell', s.cd8_t_cell),
+        ('cd4_t_cell', s.cd4_t_cell),
+        ('nk_cell', s.nk_cell),
+        ('monocyte', s.monocyte)
+) p (population, count)
+ON CONFLICT (sample_id, population) DO NOTHING;
+
 -- Populate subject_condition
 INSERT INTO subject_condition (subject_id, condition_name)
 SELECT DISTINCT subject, condition
@@ -102,3 +132,34 @@ FROM imported
 WHERE project IS NOT NULL
 AND subject IS NOT NULL
 ON CONFLICT (project_id, subject_id) DO NOTHING;
+
+-- Populate percentage_aggregate
+INSERT INTO percentage_aggregate (
+    condition_name,
+    treatment_name,
+    sample_type,
+    time_from_treatment_start,
+    response,
+    population,
+    count,
+    sum,
+    mean,
+    m2
+)
+SELECT
+    t.subject_condition_name,
+    t.treatment_name,
+    s.sample_type,
+    s.time_from_treatment_start,
+    t.response,
+    f.population,
+    COUNT(*),
+    SUM(f.percentage),
+    AVG(f.percentage),
+    VAR_POP(f.percentage) * COUNT(*)
+FROM sample s
+JOIN treatment t ON t.subject_id = s.subject_id
+JOIN sample_frequency f ON f.sample_id = s.sample_id
+WHERE t.response IS NOT NULL
+AND f.percentage IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5, 6;
@@ -0,0 +1,39 @@
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import text
+
+from api.database import engine, settings
+
+# Tests that read the database run against TEIKO_DB_URL, e.g. the seeded
+# demo_db, and are skipped when it cannot be reached. They are marked "db", so
+# `-m "not db"` deselects them.
+
+
+def pytest_collection_modifyitems(items: list[pytest.Item]) -> None:
+    for item in items:
+        if "database" in getattr(item, "fixturenames", ()):
+            item.add_marker(pytest.mark.db)
+
+
+@pytest.fixture(scope="session")
+def runner() -> Iterator[asyncio.Runner]:
+    # One event loop for the session, since the engine's pooled connections
+    # belong to the loop that opened them
+    with asyncio.Runner() as runner:
+        yield runner
+        runner.run(engine.dispose())
+
+
+@pytest.fixture(scope="session")
+def database(runner: asyncio.Runner) -> asyncio.Runner:
+    async def ping() -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    try:
+        runner.run(asyncio.wait_for(ping(), timeout=5))
+    except Exception as e:
+        pytest.skip(f"no database at {settings.url}: {e!r}")
+    return runner
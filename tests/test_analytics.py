@@ -0,0 +1,42 @@
+import asyncio
+from pathlib import Path
+
+import pandas as pd  # type: ignore
+import pytest
+
+from api import analytics, crud
+from api.database import SessionLocal
+from api.models import POPULATIONS
+
+pytest.importorskip("duckdb")
+
+COLUMNS = ["sample_id", "response", *[f"{p} (%)" for p in POPULATIONS]]
+
+
+def test_snapshot_reads_match_postgres(
+    database: asyncio.Runner, tmp_path: Path
+) -> None:
+    engine = analytics.AnalyticsEngine(tmp_path, threads=1)
+
+    async def read(sample_types: list[str]) -> tuple:
+        stmt = crud._sample_columns_stmt(
+            COLUMNS,
+            sample_types=sample_types,
+            conditions=["melanoma"],
+            treatment_types=["miraclib"],
+        )
+        async with SessionLocal() as db:
+            await analytics.export_snapshot(db, tmp_path)
+        async with SessionLocal() as db:
+            expected = await crud._copy_to_frame(db, stmt)
+        return expected, await engine.read_frame(stmt)
+
+    expected, frame = database.run(read(["PBMC"]))
+    assert len(frame) > 0
+    pd.testing.assert_frame_equal(
+        frame.sort_values("sample_id").reset_index(drop=True),
+        expected.sort_values("sample_id").reset_index(drop=True),
+    )
+    # Filter values are bound, so a quote only fails to match
+    expected, frame = database.run(read(["PBMC' OR '1'='1"]))
+    assert len(expected) == len(frame) == 0
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from api.database import SessionLocal
+from api.services import result_cache
+from bench.common import Ids, lookup_ids
+from bench.suite import WORKLOADS, Workload
+
+# The bench.suite workloads as pytest-benchmark timings, e.g.
+# `pytest tests/test_benchmarks.py --benchmark-save=base` on a generated
+# dataset, then `--benchmark-compare=0001 --benchmark-compare-fail=median:25%`
+# after a change. `--benchmark-skip` leaves them out of a plain test run.
+ROUNDS = 3
+
+
+@pytest.fixture(scope="module")
+def ids(database: asyncio.Runner) -> Ids:
+    async def read() -> Ids:
+        async with SessionLocal() as db:
+            return await lookup_ids(db)
+
+    return database.run(read())
+
+
+@pytest.mark.parametrize("name", list(WORKLOADS))
+def test_workload(benchmark, database: asyncio.Runner, ids: Ids, name: str) -> None:
+    workload: Workload = WORKLOADS[name]
+
+    async def run() -> None:
+        async with SessionLocal() as db:
+            await workload(db, ids)
+
+    def setup() -> None:
+        # Every round is a cache miss, so the timings reflect the computation
+        result_cache.clear()
+
+    benchmark.group = name.split(".")[0]
+    benchmark.pedantic(
+        lambda: database.run(run()), setup=setup, rounds=ROUNDS, iterations=1
+    )
@@ -0,0 +1,170 @@
+import asyncio
+import uuid
+from collections.abc import Iterator
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from api import crud, routers
+from api.database import SessionLocal
+from api.models import Sample, Subject
+from api.schemas import (
+    PydProject,
+    PydProjectSubjects,
+    PydSample,
+    PydSubject,
+    PydTreatment,
+    PydTreatmentKey,
+)
+
+# Throwaway subjects written through the bulk endpoints and removed afterwards
+RUN = uuid.uuid4().hex[:8]
+PROJECT = f"test-project-{RUN}"
+
+
+def subject(i: int, age: int | None = 50, sex: str | None = "F") -> PydSubject:
+    return PydSubject(subject_id=f"test-subject-{RUN}-{i}", age=age, sex=sex)
+
+
+def sample(i: int, subject_id: str) -> PydSample:
+    return PydSample(
+        sample_id=f"test-sample-{RUN}-{i}",
+        sample_type="PBMC",
+        time_from_treatment_start=0,
+        b_cell=100,
+        subject_id=subject_id,
+    )
+
+
+async def stored_ages() -> dict[str, int | None]:
+    stmt = select(Subject.subject_id, Subject.age).where(
+        Subject.subject_id.startswith(f"test-subject-{RUN}-")
+    )
+    async with SessionLocal() as db:
+        return {subject_id: age for subject_id, age in await db.execute(stmt)}
+
+
+async def rejected(operation) -> tuple[int, str]:
+    with pytest.raises(HTTPException) as raised:
+        await operation
+    return raised.value.status_code, raised.value.detail
+
+
+@pytest.fixture
+def cleanup(database: asyncio.Runner) -> Iterator[None]:
+    async def remove() -> None:
+        async with SessionLocal() as db:
+            sample_ids = await db.scalars(
+                select(Sample.sample_id).where(
+                    Sample.sample_id.startswith(f"test-sample-{RUN}-")
+                )
+            )
+            await crud.delete_samples_by_sample_id(db, list(sample_ids))
+            await crud.delete_subjects_by_subject_id(db, list(await stored_ages()))
+            await crud.delete_projects_by_project_id(db, [PROJECT])
+
+    try:
+        yield
+    finally:
+        database.run(remove())
+
+
+def test_insert_update_and_unchanged_rows(
+    database: asyncio.Runner, cleanup: None
+) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            subjects = [subject(1), subject(2)]
+            assert await routers.put_subjects(subjects, db) == {"written": 2}
+            assert await routers.put_subjects(subjects, db) == {"written": 0}
+            changed = [subject(1), subject(2, age=60)]
+            assert await routers.put_subjects(changed, db) == {"written": 1}
+        assert await stored_ages() == {
+            f"test-subject-{RUN}-1": 50,
+            f"test-subject-{RUN}-2": 60,
+        }
+
+    database.run(run())
+
+
+def test_repeated_keys_keep_the_last_row(
+    database: asyncio.Runner, cleanup: None
+) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            repeated = [subject(1, age=30), subject(2), subject(1, age=40)]
+            assert await routers.put_subjects(repeated, db) == {"written": 2}
+            assert await routers.put_subjects(repeated[1:], db) == {"written": 0}
+        assert await stored_ages() == {
+            f"test-subject-{RUN}-1": 40,
+            f"test-subject-{RUN}-2": 50,
+        }
+
+    database.run(run())
+
+
+def test_delete_by_keys(database: asyncio.Runner, cleanup: None) -> None:
+    async def run() -> None:
+        subject_id = f"test-subject-{RUN}-1"
+        treatments = [
+            PydTreatment(
+                subject_id=subject_id,
+                subject_condition_name="test",
+                treatment_name=name,
+                response=True,
+            )
+            for name in ["a", "b"]
+        ]
+        link = [PydProjectSubjects(project_id=PROJECT, subject_id=subject_id)]
+        async with SessionLocal() as db:
+            await routers.put_projects([PydProject(project_id=PROJECT)], db)
+            await routers.put_subjects([subject(1)], db)
+            await routers.put_project_subjects(link, db)
+            await crud.upsert_subject_conditions(
+                db, [{"subject_id": subject_id, "condition_name": "test"}]
+            )
+            assert await routers.put_treatments(treatments, db) == {"written": 2}
+
+            keys = [
+                PydTreatmentKey(**t.model_dump(exclude={"response"}))
+                for t in treatments[:1]
+            ]
+            assert await routers.post_treatments_delete(keys, db) == {"deleted": 1}
+            assert await routers.post_treatments_delete(keys, db) == {"deleted": 0}
+            assert await routers.post_project_subjects_delete(link, db) == {
+                "deleted": 1
+            }
+            assert await routers.post_subjects_delete([subject_id], db) == {
+                "deleted": 1
+            }
+        assert await stored_ages() == {}
+
+    database.run(run())
+
+
+def test_rejected_rows(database: asyncio.Runner, cleanup: None) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            # Constraint violations are conflicts with the stored data
+            status, detail = await rejected(
+                routers.put_samples([sample(1, f"test-subject-{RUN}-9")], db)
+            )
+            assert status == 409 and "foreign key" in detail
+            await db.rollback()
+            status, detail = await rejected(
+                routers.put_subjects([subject(1), subject(2, sex="X")], db)
+            )
+            assert status == 409 and "sex" in detail
+            await db.rollback()
+
+            # Values the columns can't hold are bad requests
+            status, detail = await rejected(
+                routers.put_subjects([PydSubject(subject_id="x" * 101)], db)
+            )
+            assert status == 400 and "too long" in detail
+            await db.rollback()
+        # Each request is one transaction, so none of its rows are written
+        assert await stored_ages() == {}
+
+    database.run(run())
@@ -0,0 +1,45 @@
+from api.cache import ResultCache
+
+
+def test_evicts_least_recently_used_entries() -> None:
+    cache = ResultCache(max_entries=2, max_bytes=1000)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert (cache.stats.entries, cache.stats.evictions) == (2, 1)
+    assert (cache.stats.hits, cache.stats.misses) == (3, 1)
+
+
+def test_evicts_by_size() -> None:
+    cache = ResultCache(max_entries=10, max_bytes=10)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.put("c", "zzzz")
+    assert cache.get("a") is None
+    assert cache.stats.size_bytes == 8
+
+    # Sizes are counted in encoded bytes, and a value over the limit is not kept
+    cache.put("d", "é" * 4)
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+    assert cache.stats.size_bytes == 8
+    cache.put("e", "x" * 11)
+    assert cache.get("e") is None
+    assert cache.get("d") == "é" * 4
+
+
+def test_replacing_an_entry_updates_its_size() -> None:
+    cache = ResultCache(max_entries=10, max_bytes=10)
+    cache.put("a", "xxxx")
+    cache.put("a", "xxxxxxxx")
+    assert (cache.stats.entries, cache.stats.size_bytes) == (1, 8)
+    assert cache.get("a") == "xxxxxxxx"
+
+    cache.clear()
+    assert cache.get("a") is None
+    assert (cache.stats.entries, cache.stats.size_bytes) == (0, 0)
@@ -0,0 +1,40 @@
+import asyncio
+
+from api import crud
+from api.database import SessionLocal, compile_positional
+from api.models import POPULATIONS
+
+COLUMNS = ["sample_id", "response", *[f"{p} (%)" for p in POPULATIONS]]
+
+
+def test_compile_positional_binds_filters() -> None:
+    stmt = crud._sample_columns_stmt(
+        COLUMNS,
+        sample_types=["PBMC", "WB"],
+        conditions=["it's"],
+        time_points=[0],
+        after_sample_id="s1",
+        limit=10,
+    )
+    sql, parameters = compile_positional(stmt)
+    assert "it's" not in sql and "PBMC" not in sql
+    assert "(%)" in sql
+    assert "it's" in parameters and 10 in parameters
+    assert sql.count("$") == len(parameters)
+    assert {"PBMC", "WB"} <= set(parameters)
+
+
+def test_sample_frame_quotes_filters(database: asyncio.Runner) -> None:
+    async def read(sample_type: str) -> int:
+        async with SessionLocal() as db:
+            frame = await crud.get_sample_frame(
+                db,
+                COLUMNS,
+                sample_types=[sample_type],
+                conditions=["melanoma"],
+                treatment_types=["miraclib"],
+            )
+        return len(frame)
+
+    assert database.run(read("PBMC")) > 0
+    assert database.run(read("PBMC' OR '1'='1")) == 0
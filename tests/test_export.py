@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+from collections.abc import AsyncIterator
+
+import pandas as pd  # type: ignore
+import pytest
+
+from api.crud import get_sample_frame
+from api.database import SessionLocal
+from api.export import (
+    DEFAULT_COHORT_COLUMNS,
+    DEFAULT_SAMPLE_COLUMNS,
+    ExportFormat,
+    export_cohort,
+    export_samples,
+)
+from api.models import POPULATIONS
+
+# Exports read back and compared with the same cohort read into a frame. The
+# small batch size sends the cohort as several batches.
+FILTERS: dict = dict(conditions=["melanoma"])
+BATCH_SIZE = 500
+KEYS = ["sample_id", "project_id", "treatment"]
+
+
+@pytest.fixture(params=["ndjson", "arrow"])
+def output_format(request: pytest.FixtureRequest) -> ExportFormat:
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+async def read_back(
+    body: AsyncIterator[bytes], output_format: ExportFormat
+) -> pd.DataFrame:
+    data = b"".join([chunk async for chunk in body])
+    if output_format == "arrow":
+        import pyarrow as pa  # type: ignore
+
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    return pd.DataFrame([json.loads(line) for line in io.BytesIO(data)])
+
+
+def compare(exported: pd.DataFrame, expected: pd.DataFrame, keys: list[str]) -> None:
+    assert list(exported.columns) == list(expected.columns)
+    assert len(exported) > BATCH_SIZE
+    pd.testing.assert_frame_equal(
+        exported.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True),
+        check_dtype=False,
+        rtol=1e-9,
+    )
+
+
+def test_samples_round_trip(
+    database: asyncio.Runner, output_format: ExportFormat
+) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            body = export_samples(db, None, FILTERS, output_format, BATCH_SIZE)
+            exported = await read_back(body, output_format)
+            expected = await get_sample_frame(db, DEFAULT_SAMPLE_COLUMNS, **FILTERS)
+        compare(exported, expected, KEYS)
+
+    database.run(run())
+
+
+def test_cohort_round_trip(
+    database: asyncio.Runner, output_format: ExportFormat
+) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            body = export_cohort(db, None, FILTERS, None, output_format, BATCH_SIZE)
+            exported = await read_back(body, output_format)
+            identity = DEFAULT_COHORT_COLUMNS[
+                : DEFAULT_COHORT_COLUMNS.index("time") + 1
+            ]
+            frame = await get_sample_frame(
+                db,
+                [*identity, "total_cells", *POPULATIONS]
+                + [f"{p} (%)" for p in POPULATIONS],
+                **FILTERS,
+            )
+        # One row per sample and population, from the sample's wide columns
+        expected = pd.concat(
+            [
+                frame[identity].assign(
+                    population=population,
+                    count=frame[population],
+                    total_count=frame["total_cells"],
+                    percentage=frame[f"{population} (%)"],
+                )
+                for population in POPULATIONS
+            ],
+            ignore_index=True,
+        )
+        compare(exported, expected, [*KEYS, "population"])
+
+    database.run(run())
+
+
+def test_selected_columns_and_no_rows(
+    database: asyncio.Runner, output_format: ExportFormat
+) -> None:
+    async def run() -> None:
+        columns = ["sample_id", "response", "b_cell (%)"]
+        async with SessionLocal() as db:
+            body = export_samples(
+                db, columns, dict(conditions=["none"]), output_format, BATCH_SIZE
+            )
+            exported = await read_back(body, output_format)
+        if output_format == "arrow":
+            # The schema is sent even without rows
+            assert list(exported.columns) == columns
+        assert len(exported) == 0
+
+    database.run(run())
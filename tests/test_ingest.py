@@ -0,0 +1,186 @@
+import asyncio
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import asdict
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from starlette.requests import Request
+
+from api import crud, routers
+from api.database import SessionLocal
+from api.ingest import CSV_COLUMNS, IngestReport, _read_lines, ingest_csv
+from api.models import Sample, Treatment
+
+
+async def chunks(*parts: bytes) -> AsyncIterator[bytes]:
+    for part in parts:
+        yield part
+
+
+def read_lines(*parts: bytes) -> list[bytes]:
+    async def collect() -> list[bytes]:
+        return [line async for line in _read_lines(chunks(*parts))]
+
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunks() -> None:
+    assert read_lines(b"a,b\n1,", b"2\n3", b",4\n") == [b"a,b\n", b"1,2\n", b"3,4\n"]
+
+
+def test_last_line_without_newline() -> None:
+    assert read_lines(b"a,b\n", b"1,2") == [b"a,b\n", b"1,2\n"]
+
+
+def test_blank_lines_are_skipped() -> None:
+    assert read_lines(b"a,b\n\n", b"\r\n1,2\n", b"\n", b"") == [b"a,b\n", b"1,2\n"]
+    assert read_lines() == []
+
+
+# Rows of throwaway subjects under a project and treatment of their own,
+# removed afterwards
+RUN = uuid.uuid4().hex[:8]
+PROJECT = f"test-project-{RUN}"
+HEADER = ",".join(CSV_COLUMNS)
+
+
+def row(subject: int, sample: int, b_cell: int = 100, **values: str) -> str:
+    fields = {
+        "project": PROJECT,
+        "subject": f"test-subject-{RUN}-{subject}",
+        "condition": "test",
+        "age": "50",
+        "sex": "F",
+        "treatment": f"test-treatment-{RUN}",
+        "response": "yes",
+        "sample": f"test-sample-{RUN}-{sample}",
+        "sample_type": "PBMC",
+        "time_from_treatment_start": "0",
+        "b_cell": str(b_cell),
+        "cd8_t_cell": "100",
+        "cd4_t_cell": "100",
+        "nk_cell": "100",
+        "monocyte": "100",
+        **values,
+    }
+    return ",".join(fields[column] for column in CSV_COLUMNS)
+
+
+def csv(*rows: str) -> bytes:
+    return "\n".join([HEADER, *rows]).encode()
+
+
+async def ingest(body: bytes, batch_rows: int) -> IngestReport:
+    async with SessionLocal() as db:
+        return await ingest_csv(db, chunks(body[:50], body[50:]), batch_rows)
+
+
+async def post(body: bytes, batch_rows: int) -> dict:
+    async def receive() -> dict:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    request = Request(
+        {"type": "http", "method": "POST", "path": "/ingest/", "headers": []},
+        receive,
+    )
+    async with SessionLocal() as db:
+        return await routers.create_ingest(request, batch_rows, db)
+
+
+async def stored_samples() -> dict[str, int | None]:
+    stmt = select(Sample.sample_id, Sample.b_cell).where(
+        Sample.sample_id.startswith(f"test-sample-{RUN}-")
+    )
+    async with SessionLocal() as db:
+        return {sample_id: b_cell for sample_id, b_cell in await db.execute(stmt)}
+
+
+def counts(report: IngestReport | dict) -> tuple:
+    values = report if isinstance(report, dict) else asdict(report)
+    return tuple(
+        values[name]
+        for name in [
+            "rows",
+            "batches",
+            "samples_inserted",
+            "samples_updated",
+            "other_rows_written",
+        ]
+    )
+
+
+@pytest.fixture
+def cleanup(database: asyncio.Runner) -> Iterator[None]:
+    async def remove() -> None:
+        async with SessionLocal() as db:
+            await crud.delete_samples_by_sample_id(db, list(await stored_samples()))
+            subject_ids = await db.scalars(
+                select(Treatment.subject_id).where(
+                    Treatment.treatment_name == f"test-treatment-{RUN}"
+                )
+            )
+            await crud.delete_subjects_by_subject_id(db, list(subject_ids))
+            await crud.delete_projects_by_project_id(db, [PROJECT])
+
+    try:
+        yield
+    finally:
+        database.run(remove())
+
+
+def test_new_changed_and_unchanged_rows(
+    database: asyncio.Runner, cleanup: None
+) -> None:
+    rows = [row(1, 1), row(1, 2), row(2, 3)]
+
+    async def run() -> None:
+        # A project, two subjects with a condition, treatment and project each
+        report = await ingest(csv(*rows), batch_rows=2)
+        assert counts(report) == (3, 2, 3, 0, 9)
+        assert await stored_samples() == {
+            f"test-sample-{RUN}-{i}": 100 for i in [1, 2, 3]
+        }
+
+        assert counts(await ingest(csv(*rows), batch_rows=2)) == (3, 2, 0, 0, 0)
+
+        changed = [row(1, 1), row(1, 2, b_cell=200), row(2, 3, response="no")]
+        assert counts(await ingest(csv(*changed), batch_rows=10)) == (3, 1, 0, 1, 1)
+        assert (await stored_samples())[f"test-sample-{RUN}-2"] == 200
+
+    database.run(run())
+
+
+def test_rejected_batch_reports_the_committed_rows(
+    database: asyncio.Runner, cleanup: None
+) -> None:
+    async def run() -> None:
+        body = csv(row(1, 1), row(1, 2), row(1, 3, sample_type="XX"))
+        with pytest.raises(HTTPException) as raised:
+            await post(body, batch_rows=2)
+        assert raised.value.status_code == 409
+        detail: dict = raised.value.detail  # type: ignore[assignment]
+        assert "sample_type" in detail["error"]
+        assert counts(detail["committed"]) == (2, 1, 2, 0, 5)
+        assert set(await stored_samples()) == {f"test-sample-{RUN}-{i}" for i in [1, 2]}
+
+    database.run(run())
+
+
+def test_invalid_values_are_bad_requests(
+    database: asyncio.Runner, cleanup: None
+) -> None:
+    async def run() -> None:
+        with pytest.raises(HTTPException) as raised:
+            await post(csv(row(1, 1), row(1, 2, age="old")), batch_rows=10)
+        assert raised.value.status_code == 400
+        detail: dict = raised.value.detail  # type: ignore[assignment]
+        assert "integer" in detail["error"]
+        assert counts(detail["committed"]) == (0, 0, 0, 0, 0)
+        assert await stored_samples() == {}
+
+        report = await post(csv(row(1, 1)), batch_rows=10)
+        assert counts(report) == (1, 1, 1, 0, 5)
+
+    database.run(run())
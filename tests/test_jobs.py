@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, update
+
+from api import jobs
+from api.crud import create_analysis_job, finish_analysis_job
+from api.database import SessionLocal
+from api.models import AnalysisJob
+
+
+def test_normalize_params_fills_in_defaults() -> None:
+    spelled_out = {
+        "sample_types": ["PBMC"],
+        "conditions": None,
+        "treatment_types": None,
+        "time_points": None,
+        "output_format": "html",
+    }
+    assert jobs.normalize_params("longitudinal_analysis", {}) == {
+        **spelled_out,
+        "sample_types": None,
+    }
+    assert (
+        jobs.normalize_params("longitudinal_analysis", {"sample_types": ["PBMC"]})
+        == jobs.normalize_params("longitudinal_analysis", spelled_out)
+        == spelled_out
+    )
+
+
+def test_normalize_params_rejects_unknown_analyses_and_parameters() -> None:
+    with pytest.raises(ValueError, match="Unknown analysis"):
+        jobs.normalize_params("get_projects", {})
+    with pytest.raises(ValueError, match="Invalid parameters"):
+        jobs.normalize_params("longitudinal_analysis", {"include_samples": True})
+    with pytest.raises(ValueError, match="Invalid parameters"):
+        jobs.normalize_params("statistical_analysis", {"db": None})
+
+
+def test_media_type() -> None:
+    assert jobs.media_type({"output_format": "json"}) == "application/json"
+    assert jobs.media_type({}) == "text/html"
+
+
+def test_job_that_outlives_the_timeout_fails(monkeypatch) -> None:
+    finished = []
+
+    async def compute(job: AnalysisJob) -> str:
+        await asyncio.sleep(10)
+        return "late"
+
+    async def finish(db, job_id, started_at, status, **values) -> bool:
+        finished.append((job_id, started_at, status, values))
+        return True
+
+    monkeypatch.setattr(jobs, "finish_analysis_job", finish)
+    workers = jobs.JobWorkers(workers=0, poll_interval_s=1, timeout_s=0.05)
+    monkeypatch.setattr(workers, "_compute", compute)
+    job = AnalysisJob(
+        job_id=uuid.uuid4(), started_at=datetime.now(timezone.utc), params={}
+    )
+
+    asyncio.run(workers._run(job))
+    assert finished == [
+        (job.job_id, job.started_at, "failed", {"error": "Timed out after 0.05s"})
+    ]
+
+
+def test_only_the_latest_claim_finishes_a_job(database: asyncio.Runner) -> None:
+    async def run() -> tuple[bool, bool, str]:
+        async with SessionLocal() as db:
+            job, _ = await create_analysis_job(
+                db, "statistical_analysis", {"test": str(uuid.uuid4())}, -1
+            )
+        first = datetime.now(timezone.utc) - timedelta(hours=2)
+        second = datetime.now(timezone.utc)
+        try:
+            # Claimed once, then taken over as stale by another worker
+            async with SessionLocal() as db:
+                for started_at in [first, second]:
+                    await db.execute(
+                        update(AnalysisJob)
+                        .where(AnalysisJob.job_id == job.job_id)
+                        .values(status="running", started_at=started_at)
+                    )
+                await db.commit()
+            async with SessionLocal() as db:
+                stale = await finish_analysis_job(
+                    db, job.job_id, first, "succeeded", result="stale"
+                )
+                latest = await finish_analysis_job(
+                    db, job.job_id, second, "succeeded", result="latest"
+                )
+                stored = await db.get(AnalysisJob, job.job_id)
+                assert stored is not None
+                return stale, latest, stored.result or ""
+        finally:
+            async with SessionLocal() as db:
+                await db.execute(
+                    delete(AnalysisJob).where(AnalysisJob.job_id == job.job_id)
+                )
+                await db.commit()
+
+    assert database.run(run()) == (False, True, "latest")
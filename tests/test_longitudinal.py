@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from scipy import stats  # type: ignore
+
+from api.longitudinal import (
+    build_trajectories,
+    mean_trajectories,
+    paired_tests,
+    repeated_measures,
+)
+
+
+@pytest.fixture
+def trajectories():
+    # 40 subjects at three time points with two populations, a few samples
+    # missing and a few values NULL
+    rng = np.random.default_rng(0)
+    subject_ids = np.repeat([f"s{i:02}" for i in range(40)], 3)
+    time_points = np.tile([0, 7, 14], 40)
+    response = np.repeat(rng.integers(0, 2, 40).astype(float), 3)
+    values = rng.normal(30, 5, (120, 2)) + time_points[:, None] * response[:, None]
+    values[[5, 50], 0] = np.nan
+    keep = np.ones(120, dtype=bool)
+    keep[[4, 61, 62]] = False
+    return build_trajectories(
+        subject_ids[keep], time_points[keep], response[keep], values[keep]
+    )
+
+
+def test_build_trajectories() -> None:
+    built = build_trajectories(
+        np.array(["b", "a", "a", "b", "a"]),
+        np.array([0, 0, 7, 0, 7]),
+        np.array([0.0, 1.0, 1.0, 0.0, 1.0]),
+        np.array([[1.0], [2.0], [3.0], [5.0], [np.nan]]),
+    )
+    assert built.subject_ids.tolist() == ["a", "b"]
+    assert built.time_points.tolist() == [0, 7]
+    assert built.response.tolist() == [1.0, 0.0]
+    # b's two baseline samples are averaged, a's NULL value is skipped, and b
+    # has no sample at day 7
+    np.testing.assert_array_equal(built.values[:, :, 0], [[2.0, 3.0], [3.0, np.nan]])
+
+
+def test_paired_tests_match_scipy(trajectories) -> None:
+    results = paired_tests(trajectories)
+    values = trajectories.values
+    response = trajectories.response
+    for t in range(1, len(trajectories.time_points)):
+        for i in range(values.shape[2]):
+            delta = values[:, t, i] - values[:, 0, i]
+            both = ~np.isnan(delta)
+            expected = stats.ttest_rel(values[both, t, i], values[both, 0, i])
+            assert results["n"][t - 1, i] == both.sum()
+            assert results["t"][t - 1, i] == pytest.approx(expected.statistic)
+            assert results["p_value"][t - 1, i] == pytest.approx(expected.pvalue)
+
+            welch = stats.ttest_ind(
+                delta[both & (response == 1)],
+                delta[both & (response == 0)],
+                equal_var=False,
+            )
+            assert results["response_p_value"][t - 1, i] == pytest.approx(welch.pvalue)
+
+
+def test_repeated_measures(trajectories) -> None:
+    results = repeated_measures(trajectories)
+    for i in range(trajectories.values.shape[2]):
+        x = trajectories.values[:, :, i]
+        x = x[~np.isnan(x).any(axis=1)]
+        n, k = x.shape
+        grand = x.mean()
+        ss_time = n * ((x.mean(axis=0) - grand) ** 2).sum()
+        ss_subjects = k * ((x.mean(axis=1) - grand) ** 2).sum()
+        ss_error = ((x - grand) ** 2).sum() - ss_time - ss_subjects
+        f = (ss_time / (k - 1)) / (ss_error / ((n - 1) * (k - 1)))
+        assert results["n"][i] == n
+        assert results["f"][i] == pytest.approx(f)
+        assert results["p_value"][i] == pytest.approx(
+            stats.f.sf(f, k - 1, (n - 1) * (k - 1))
+        )
+
+
+def test_repeated_measures_needs_two_time_points() -> None:
+    single = build_trajectories(
+        np.array(["a", "b"]), np.array([0, 0]), np.array([1.0, 0.0]), np.ones((2, 3))
+    )
+    results = repeated_measures(single)
+    assert results["n"].tolist() == [2, 2, 2]
+    assert np.isnan(results["f"]).all() and np.isnan(results["p_value"]).all()
+
+
+def test_mean_trajectories(trajectories) -> None:
+    results = mean_trajectories(trajectories)
+    values = trajectories.values
+    responders = values[trajectories.response == 1]
+    np.testing.assert_allclose(results["all_mean"], np.nanmean(values, axis=0))
+    np.testing.assert_allclose(
+        results["responders_sem"], stats.sem(responders, axis=0, nan_policy="omit")
+    )
+    np.testing.assert_array_equal(
+        results["non_responders_n"],
+        (~np.isnan(values[trajectories.response == 0])).sum(axis=0),
+    )
@@ -0,0 +1,102 @@
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd  # type: ignore
+import pytest
+
+from api import matrix
+from api.models import POPULATIONS
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    frame = pd.DataFrame(
+        {
+            "sample_id": ["s5", "s1", "s4", "s2", "s3", "s6"],
+            "subject_id": ["c", "a", "b", "a", "b", "c"],
+            "sample_type": ["WB", "PBMC", "PBMC", "PBMC", "PBMC", "PBMC"],
+            "time": [0, 7, 0, 0, 7, None],
+        }
+    )
+    for i, population in enumerate(POPULATIONS):
+        frame[population] = np.arange(len(frame)) * 10 + i
+    frame.loc[1, "nk_cell"] = None
+    return frame
+
+
+def test_store_round_trip(frame: pd.DataFrame, tmp_path: Path) -> None:
+    store = matrix.MatrixStore.open(matrix._write_store(frame, tmp_path, 3))
+    assert store.version == 3
+
+    rows = store.rows(["s1", "s6", "s5"])
+    expected = frame.set_index("sample_id").loc[["s1", "s6", "s5"], POPULATIONS]
+    counts = np.where(store.counts[rows] == matrix.MISSING, np.nan, store.counts[rows])
+    np.testing.assert_array_equal(counts, expected.to_numpy(dtype=float))
+    assert store.subjects[store.subject_codes[rows]].tolist() == ["a", "c", "c"]
+    with pytest.raises(KeyError):
+        store.rows(["s1", "missing"])
+
+    # One contiguous block per sample type and time point, in sample id order
+    pbmc = store.block_slices(["PBMC"])
+    assert len(pbmc) == 3
+    assert sum(s.stop - s.start for s in pbmc) == 5
+    (baseline,) = store.block_slices(["PBMC"], [0])
+    assert sorted(store.subject_codes[baseline].tolist()) == [0, 1]
+    assert store.block_slices(["WB"], [7]) == []
+
+
+def test_cohort_selection(frame: pd.DataFrame, tmp_path: Path) -> None:
+    path = matrix._write_store(frame, tmp_path, 1)
+    selection = matrix.CohortSelection(
+        str(path),
+        ["PBMC"],
+        None,
+        np.array(["a", "c", "unknown"]),
+        np.array([1.0, 0.0, 1.0]),
+    )
+    subject_codes, times, response, counts = selection.arrays()
+    store = matrix.open_store(str(path))
+    selected = pd.DataFrame(
+        {
+            "subject_id": store.subjects[subject_codes],
+            "time": times,
+            "response": response,
+        }
+    )
+    expected = frame.loc[
+        (frame["sample_type"] == "PBMC") & frame["subject_id"].isin(["a", "c"]),
+        ["subject_id", "time"],
+    ].assign(response=lambda df: (df["subject_id"] == "a").astype(float))
+    pd.testing.assert_frame_equal(
+        selected.sort_values(["subject_id", "time"], ignore_index=True),
+        expected.astype({"time": float}).sort_values(
+            ["subject_id", "time"], ignore_index=True
+        ),
+        check_dtype=False,
+    )
+    assert counts.dtype == float
+    assert np.isnan(counts).sum() == 1
+
+    empty = matrix.CohortSelection(
+        str(path), ["WB"], [7], np.array(["a"]), np.array([1.0])
+    ).arrays()
+    assert [len(array) for array in empty] == [0, 0, 0, 0]
+    assert empty[3].shape == (0, len(POPULATIONS))
+
+
+def test_superseded_versions_are_kept_for_the_grace_period(
+    frame: pd.DataFrame, tmp_path: Path
+) -> None:
+    matrix._write_store(frame, tmp_path, 1)
+    matrix._write_store(frame, tmp_path, 2)
+    matrix._write_store(frame, tmp_path, 3)
+    assert sorted(p.name for p in tmp_path.glob("v*")) == ["v1", "v2", "v3"]
+
+    # v2 replaced v1 longer ago than the grace period
+    past = time.time() - matrix.GRACE_S - 60
+    os.utime(tmp_path / "v1", (past - 60, past - 60))
+    os.utime(tmp_path / "v2", (past, past))
+    matrix._write_store(frame, tmp_path, 4)
+    assert sorted(p.name for p in tmp_path.glob("v*")) == ["v2", "v3", "v4"]
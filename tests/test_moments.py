@@ -0,0 +1,150 @@
+import asyncio
+
+import pandas as pd  # type: ignore
+import pytest
+from scipy import stats  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.crud import (
+    get_percentage_moments,
+    get_percentage_outliers,
+    get_sample_frame,
+)
+from api.database import SessionLocal
+from api.models import POPULATIONS
+from api.services import _response_moments, welch_pvalues
+
+# The statistics computed in the database, compared with pandas over the same
+# cohort read sample by sample
+FILTERS: dict = dict(conditions=["melanoma"])
+GROUPINGS = [[], ["sample_type", "time"], ["condition", "treatment", "sample_type"]]
+
+
+async def percentages(db: AsyncSession, group_by: list[str]) -> pd.DataFrame:
+    # One row per sample, treatment and population, as the database groups them
+    frame = await get_sample_frame(
+        db,
+        ["sample_id", *dict.fromkeys([*group_by, "response"])]
+        + [f"{p} (%)" for p in POPULATIONS],
+        **FILTERS,
+    )
+    frame = frame[frame["response"].notna()]
+    long = frame.melt(
+        id_vars=["sample_id", *group_by, "response"],
+        var_name="population",
+        value_name="percentage",
+    )
+    long["population"] = long["population"].str.removesuffix(" (%)")
+    long["response"] = long["response"].astype(bool)
+    return long.dropna(subset=["percentage"])
+
+
+def compare(stored: pd.DataFrame, expected: pd.DataFrame, keys: list[str]) -> None:
+    stored = stored[stored["count"] > 0].sort_values(keys, ignore_index=True)
+    expected = expected.sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(
+        stored[expected.columns], expected, check_dtype=False, rtol=1e-9
+    )
+
+
+@pytest.mark.parametrize("group_by", GROUPINGS)
+def test_moments_match_pandas(database: asyncio.Runner, group_by: list[str]) -> None:
+    async def run() -> None:
+        keys = [*group_by, "response", "population"]
+        async with SessionLocal() as db:
+            moments = await get_percentage_moments(db, group_by, **FILTERS)
+            long = await percentages(db, group_by)
+        expected = (
+            long.groupby(keys, dropna=False)["percentage"]
+            .agg(count="count", mean="mean", var="var")
+            .reset_index()
+        )
+        assert len(expected) > 0
+        compare(moments, expected, keys)
+
+    database.run(run())
+
+
+def test_welch_pvalues_from_moments_match_scipy(database: asyncio.Runner) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            moments = await get_percentage_moments(db, ["sample_type"], **FILTERS)
+            long = await percentages(db, ["sample_type"])
+        index, m = _response_moments(moments, ["sample_type"])
+        pvalues = welch_pvalues(
+            m["r_count"],
+            m["r_mean"],
+            m["r_var"],
+            m["nr_count"],
+            m["nr_mean"],
+            m["nr_var"],
+        )
+        for i, sample_type in enumerate(index):
+            for j, population in enumerate(POPULATIONS):
+                group = long[
+                    (long["sample_type"] == sample_type)
+                    & (long["population"] == population)
+                ]
+                expected = stats.ttest_ind(
+                    group.loc[group["response"], "percentage"],
+                    group.loc[~group["response"], "percentage"],
+                    equal_var=False,
+                )
+                assert pvalues[i, j] == pytest.approx(expected.pvalue, rel=1e-6)
+
+    database.run(run())
+
+
+def box_stats(percentage: pd.Series) -> pd.Series:
+    # pandas' linear quantiles are percentile_cont's
+    q1, median, q3 = percentage.quantile([0.25, 0.5, 0.75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inside = percentage[(percentage >= low) & (percentage <= high)]
+    return pd.Series(
+        {
+            "count": percentage.count(),
+            "mean": percentage.mean(),
+            "var": percentage.var(),
+            "sd": percentage.std(),
+            "min": percentage.min(),
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "max": percentage.max(),
+            "lowerfence": inside.min(),
+            "upperfence": inside.max(),
+            "outliers": len(percentage) - len(inside),
+        }
+    )
+
+
+@pytest.mark.parametrize("group_by", GROUPINGS[:2])
+def test_box_stats_and_outliers_match_pandas(
+    database: asyncio.Runner, group_by: list[str]
+) -> None:
+    async def run() -> None:
+        keys = [*group_by, "response", "population"]
+        async with SessionLocal() as db:
+            moments = await get_percentage_moments(
+                db, group_by, **FILTERS, box_stats=True
+            )
+            outliers = await get_percentage_outliers(db, group_by, **FILTERS)
+            long = await percentages(db, group_by)
+        groups = long.groupby(keys, dropna=False)["percentage"]
+        expected = groups.apply(box_stats).unstack().reset_index()
+        compare(moments, expected, keys)
+
+        fences = long.merge(expected[[*keys, "q1", "q3"]], on=keys)
+        iqr = fences["q3"] - fences["q1"]
+        outside = fences[
+            (fences["percentage"] < fences["q1"] - 1.5 * iqr)
+            | (fences["percentage"] > fences["q3"] + 1.5 * iqr)
+        ]
+        assert len(outside) == expected["outliers"].sum() > 0
+        compare(
+            outliers.assign(count=1),
+            outside[[*keys, "percentage"]],
+            [*keys, "percentage"],
+        )
+
+    database.run(run())
@@ -0,0 +1,149 @@
+import asyncio
+import uuid
+from collections.abc import Iterator
+
+import pandas as pd  # type: ignore
+import pytest
+from sqlalchemy import select
+
+from api import crud
+from api.database import SessionLocal
+from api.models import PercentageAggregate, Sample
+
+# Samples of a throwaway subject, with a treatment of its own so its groups are
+# apart from the seeded ones, written through api.crud and removed afterwards
+RUN = uuid.uuid4().hex[:8]
+SUBJECT = f"test-subject-{RUN}"
+TREATMENT = f"test-treatment-{RUN}"
+
+
+def sample(sample_id: str, b_cell: int, subject_id: str = SUBJECT) -> dict:
+    return {
+        "sample_id": sample_id,
+        "sample_type": "PBMC",
+        "time_from_treatment_start": 0,
+        "b_cell": b_cell,
+        "cd8_t_cell": 100,
+        "cd4_t_cell": 100,
+        "nk_cell": 100,
+        "monocyte": 100,
+        "subject_id": subject_id,
+    }
+
+
+async def drift() -> pd.DataFrame:
+    async with SessionLocal() as db:
+        differing = await crud.verify_percentage_aggregates(db)
+    return differing[differing["treatment_name"] == TREATMENT]
+
+
+async def stored_counts() -> dict[str, int]:
+    stmt = select(PercentageAggregate.population, PercentageAggregate.count).where(
+        PercentageAggregate.treatment_name == TREATMENT
+    )
+    async with SessionLocal() as db:
+        return {population: count for population, count in await db.execute(stmt)}
+
+
+@pytest.fixture
+def subjects(database: asyncio.Runner) -> Iterator[list[str]]:
+    subject_ids = [SUBJECT, f"{SUBJECT}-other"]
+
+    async def create() -> None:
+        async with SessionLocal() as db:
+            await crud.upsert_subjects(
+                db, [{"subject_id": s, "age": 50, "sex": "F"} for s in subject_ids]
+            )
+            await crud.upsert_subject_conditions(
+                db, [{"subject_id": s, "condition_name": "test"} for s in subject_ids]
+            )
+            await crud.upsert_treatments(
+                db,
+                [
+                    {
+                        "subject_id": s,
+                        "subject_condition_name": "test",
+                        "treatment_name": TREATMENT,
+                        "response": True,
+                    }
+                    for s in subject_ids
+                ],
+            )
+
+    async def remove() -> None:
+        async with SessionLocal() as db:
+            sample_ids = await db.scalars(
+                select(Sample.sample_id).where(Sample.subject_id.in_(subject_ids))
+            )
+            await crud.delete_samples_by_sample_id(db, list(sample_ids))
+            await crud.delete_subjects_by_subject_id(db, subject_ids)
+
+    database.run(create())
+    try:
+        yield subject_ids
+    finally:
+        database.run(remove())
+
+
+def test_writes_merge_and_take_out_contributions(
+    database: asyncio.Runner, subjects: list[str]
+) -> None:
+    async def run() -> None:
+        async with SessionLocal() as db:
+            await crud.upsert_samples(
+                db, [sample(f"{SUBJECT}-{i}", 100 * i) for i in range(1, 4)]
+            )
+        assert (await drift()).empty
+        assert set((await stored_counts()).values()) == {3}
+
+        async with SessionLocal() as db:
+            await crud.upsert_samples(db, [sample(f"{SUBJECT}-1", 900)])
+        assert (await drift()).empty
+
+        # Moved to the other subject, then deleted
+        async with SessionLocal() as db:
+            await crud.upsert_samples(db, [sample(f"{SUBJECT}-2", 200, subjects[1])])
+        assert (await drift()).empty
+        async with SessionLocal() as db:
+            await crud.delete_samples_by_sample_id(db, [f"{SUBJECT}-2"])
+        assert (await drift()).empty
+        assert set((await stored_counts()).values()) == {2}
+
+        async with SessionLocal() as db:
+            await crud.delete_treatments(db, [(SUBJECT, "test", TREATMENT)])
+        assert (await drift()).empty
+        assert await stored_counts() == {}
+
+    database.run(run())
+
+
+def test_concurrent_writes_to_a_sample(
+    database: asyncio.Runner, subjects: list[str]
+) -> None:
+    sample_id = f"{SUBJECT}-1"
+
+    async def run() -> None:
+        async with SessionLocal() as db:
+            await crud.upsert_samples(db, [sample(sample_id, 100)])
+
+        async with SessionLocal() as first, SessionLocal() as second:
+            # The first writer has updated the sample but not committed when the
+            # second starts, which has to wait for it and then take out the
+            # contribution it committed
+            async with crud.maintain_percentage_aggregates(
+                first, [SUBJECT], [sample_id]
+            ):
+                await crud._upsert(first, Sample, [sample(sample_id, 500)])
+                await crud.refresh_sample_frequencies(first, [sample_id])
+            later = asyncio.create_task(
+                crud.upsert_samples(second, [sample(sample_id, 900)])
+            )
+            await asyncio.sleep(0.5)
+            assert not later.done()
+            await first.commit()
+            assert await asyncio.wait_for(later, timeout=10) == 1
+
+        assert (await drift()).empty
+        assert set((await stored_counts()).values()) == {1}
+
+    database.run(run())
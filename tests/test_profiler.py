@@ -0,0 +1,47 @@
+from api.profiler import QueryProfiler, normalize, profiling
+
+
+def test_normalize_replaces_literals_and_placeholders() -> None:
+    assert (
+        normalize("SELECT *\n  FROM sample\n WHERE sample_id = 'it''s' AND n > 3.5")
+        == "SELECT * FROM sample WHERE sample_id = ? AND n > ?"
+    )
+    assert normalize("SELECT $1::VARCHAR, b_cell2 FROM t LIMIT $2") == (
+        "SELECT ?::VARCHAR, b_cell2 FROM t LIMIT ?"
+    )
+
+
+def test_normalize_collapses_lists_and_rows() -> None:
+    assert normalize("WHERE id IN ($1, $2, $3)") == "WHERE id IN (?, ...)"
+    assert normalize("WHERE id IN ($1::VARCHAR, $2::VARCHAR)") == (
+        "WHERE id IN (?, ...)"
+    )
+    one = normalize("INSERT INTO t (a, b) VALUES ($1, $2)")
+    many = normalize("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4), ($5, $6)")
+    assert one == many == "INSERT INTO t (a, b) VALUES (?, ...)"
+
+
+def test_statements_are_aggregated_and_repeats_reported() -> None:
+    profiler = QueryProfiler(
+        slow_query_ms=100, repeat_threshold=3, log_size=10, max_statements=2
+    )
+    with profiling("/samples") as request:
+        for i in range(3):
+            profiler.record(f"SELECT * FROM sample WHERE id = {i}", 0.01, 1, None)
+        profiler.record("SELECT 'slow'", 0.2, None, None)
+        profiler.record("SELECT * FROM subject", 0.001, 5, None)
+    profiler.finish("/samples", request)
+
+    report = profiler.report()
+    # Ordered by total time
+    slow, by_id = report["statements"]
+    assert (by_id["statement"], by_id["calls"], by_id["rows"]) == (
+        "SELECT * FROM sample WHERE id = ?",
+        3,
+        3,
+    )
+    assert (slow["statement"], slow["slow"]) == ("SELECT ?", 1)
+    assert report["dropped_statements"] == 1
+    assert [r["statement"] for r in report["repeats"]] == [by_id["statement"]]
+    assert [r["statement"] for r in report["slow"]] == ["SELECT ?"]
+    assert len(report["recent"]) == 5
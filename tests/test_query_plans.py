@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+
+from api.database import SessionLocal
+from bench.common import lookup_ids
+from bench.explain_plans import Case, capture, cases, explain, table_rows, walk
+
+# The plans of the cohort queries must not scan a large table sequentially.
+# Tables under MIN_ROWS fit in a few pages and are legitimately scanned, so
+# the check is meaningful on a large dataset, e.g. one from bench.generate_data.
+MIN_ROWS = int(os.environ.get("TEIKO_PLAN_MIN_ROWS", 10000))
+CASES = [
+    "timeline_cohort",
+    "timeline_baseline",
+    "subset_baseline",
+    "subject_samples",
+    "project_subjects",
+    "imports_by_sample",
+    "percentage_threshold",
+    "overview_page",
+    "frame_baseline",
+]
+
+
+@pytest.fixture(scope="module")
+def plan_cases(database: asyncio.Runner) -> dict[str, tuple[Case, dict[str, int]]]:
+    async def read() -> dict[str, tuple[Case, dict[str, int]]]:
+        async with SessionLocal() as db:
+            # Committed, since statistics are rolled back with the transaction
+            await db.execute(text("ANALYZE"))
+            await db.commit()
+            rows = await table_rows(db)
+            return {case.name: (case, rows) for case in cases(await lookup_ids(db))}
+
+    return database.run(read())
+
+
+def test_cases_are_listed(plan_cases: dict) -> None:
+    assert sorted(plan_cases) == sorted(CASES)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_no_sequential_scan(
+    database: asyncio.Runner, plan_cases: dict, name: str
+) -> None:
+    case, rows = plan_cases[name]
+
+    async def scanned() -> list[set[str]]:
+        async with SessionLocal() as db:
+            tables = []
+            for sql, parameters in await capture(db, case):
+                plan = await explain(db, sql, parameters)
+                tables.append(
+                    {
+                        node["Relation Name"]
+                        for node in walk(plan["Plan"])
+                        if node["Node Type"] == "Seq Scan"
+                        and rows.get(node["Relation Name"], 0) > MIN_ROWS
+                    }
+                    - case.allow_seq_scan
+                )
+            await db.rollback()
+            return tables
+
+    for i, tables in enumerate(database.run(scanned())):
+        assert not tables, f"statement {i} of {name} scans {sorted(tables)}"
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from api import analytics, routers
+
+UPDATED_AT = datetime(2026, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def data_version(monkeypatch) -> list[int]:
+    version = [7]
+
+    async def get_data_version_info(db) -> tuple[int, datetime]:
+        return version[0], UPDATED_AT
+
+    monkeypatch.setattr(routers, "get_data_version_info", get_data_version_info)
+    monkeypatch.setattr(analytics, "current_snapshot", lambda: None)
+    return version
+
+
+def validators(query: str = "a=1&b=2", **headers: str) -> dict[str, str]:
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/user-stories/data-overview",
+            "query_string": query.encode(),
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+    return asyncio.run(routers.conditional_request(request, db=None))  # type: ignore[arg-type]
+
+
+def not_modified(query: str = "a=1&b=2", **headers: str) -> bool:
+    try:
+        validators(query, **headers)
+    except HTTPException as e:
+        assert e.status_code == 304
+        assert e.headers is not None and "ETag" in e.headers
+        return True
+    return False
+
+
+def test_etag_follows_the_data_version_and_query(data_version: list[int]) -> None:
+    headers = validators()
+    assert headers["Last-Modified"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+    assert headers["Cache-Control"] == "no-cache"
+    assert validators("b=2&a=1")["ETag"] == headers["ETag"]
+    assert validators("a=2&b=2")["ETag"] != headers["ETag"]
+
+    data_version[0] += 1
+    assert validators()["ETag"] != headers["ETag"]
+
+
+def test_if_none_match(data_version: list[int]) -> None:
+    etag = validators()["ETag"]
+    assert not_modified(if_none_match=etag)
+    assert not_modified(if_none_match=f'W/"other", {etag}')
+    assert not_modified(if_none_match="*")
+    assert not not_modified(if_none_match='W/"other"')
+    # If-None-Match takes precedence over If-Modified-Since
+    assert not not_modified(
+        if_none_match='W/"other"', if_modified_since=validators()["Last-Modified"]
+    )
+
+    data_version[0] += 1
+    assert not not_modified(if_none_match=etag)
+
+
+def test_if_modified_since(data_version: list[int]) -> None:
+    last_modified = validators()["Last-Modified"]
+    assert not_modified(if_modified_since=last_modified)
+    assert not_modified(if_modified_since="Sat, 03 Jan 2026 00:00:00 GMT")
+    earlier = UPDATED_AT - timedelta(seconds=1)
+    assert not not_modified(
+        if_modified_since=earlier.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    )
+    assert not not_modified(if_modified_since="not a date")
+
+
+def test_etag_follows_the_analytics_snapshot(
+    data_version: list[int], monkeypatch
+) -> None:
+    etag = validators()["ETag"]
+    later = UPDATED_AT + timedelta(hours=1)
+    monkeypatch.setattr(analytics, "current_snapshot", lambda: ("s1", later))
+    headers = validators()
+    assert headers["ETag"] != etag
+    assert headers["Last-Modified"] == "Fri, 02 Jan 2026 04:04:05 GMT"
+    assert not not_modified(if_none_match=etag)
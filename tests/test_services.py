@@ -0,0 +1,168 @@
+import asyncio
+import re
+import uuid
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd  # type: ignore
+import pytest
+
+from api import crud, services
+from api.crud import get_sample_frame
+from api.database import SessionLocal
+from api.services import SUBSET_COLUMNS, _rows_html, _sample_listing
+
+
+def test_rows_html_escapes_and_leaves_missing_cells_empty() -> None:
+    df = pd.DataFrame(
+        {
+            "sample_id": ["s1", "<s2>"],
+            "b_cell": [10.0, np.nan],
+            "response": [None, "yes"],
+        }
+    )
+    assert _rows_html(df) == (
+        "<tr><td>s1</td><td>10.0</td><td></td></tr>\n"
+        "<tr><td>&lt;s2&gt;</td><td></td><td>yes</td></tr>"
+    )
+
+
+def test_cached_analysis_skips_results_computed_across_a_write(monkeypatch) -> None:
+    versions = iter([1, 2, 2, 2, 2, 2])
+    computed = []
+
+    async def get_data_version(db) -> int:
+        return next(versions)
+
+    async def compute() -> str:
+        computed.append(1)
+        return f"result {len(computed)}"
+
+    monkeypatch.setattr(services, "get_data_version", get_data_version)
+    services.result_cache.clear()
+
+    async def run() -> str:
+        return await services.cached_analysis(None, "test", {"a": [1]}, compute)  # type: ignore
+
+    # The version moved from 1 to 2 while computing, so nothing is stored
+    assert asyncio.run(run()) == "result 1"
+    assert services.result_cache.stats.entries == 0
+    # Computed and stored at version 2, then served from the cache
+    assert asyncio.run(run()) == "result 2"
+    assert asyncio.run(run()) == "result 2"
+    assert len(computed) == 2
+
+
+# A condition of its own, under which one subject is in two projects and the
+# other has two treatments, so each of their samples has two rows
+RUN = uuid.uuid4().hex[:8]
+CONDITION = f"test-condition-{RUN}"
+SUBJECTS = [f"test-subject-{RUN}-{i}" for i in [1, 2]]
+PROJECTS = [f"test-project-{RUN}-{i}" for i in [1, 2]]
+
+
+@pytest.fixture
+def cohort(database: asyncio.Runner) -> Iterator[list[str]]:
+    sample_ids = [f"test-sample-{RUN}-{i}" for i in range(1, 5)]
+
+    async def create() -> None:
+        async with SessionLocal() as db:
+            await crud.upsert_projects(db, [{"project_id": p} for p in PROJECTS])
+            await crud.upsert_subjects(
+                db, [{"subject_id": s, "age": 50, "sex": "F"} for s in SUBJECTS]
+            )
+            await crud.upsert_project_subjects(
+                db,
+                [
+                    {"project_id": PROJECTS[0], "subject_id": SUBJECTS[0]},
+                    {"project_id": PROJECTS[1], "subject_id": SUBJECTS[0]},
+                    {"project_id": PROJECTS[0], "subject_id": SUBJECTS[1]},
+                ],
+            )
+            await crud.upsert_subject_conditions(
+                db, [{"subject_id": s, "condition_name": CONDITION} for s in SUBJECTS]
+            )
+            await crud.upsert_treatments(
+                db,
+                [
+                    {
+                        "subject_id": subject_id,
+                        "subject_condition_name": CONDITION,
+                        "treatment_name": treatment,
+                        "response": True,
+                    }
+                    for subject_id, treatment in [
+                        (SUBJECTS[0], "a"),
+                        (SUBJECTS[1], "a"),
+                        (SUBJECTS[1], "b"),
+                    ]
+                ],
+            )
+            await crud.upsert_samples(
+                db,
+                [
+                    {
+                        "sample_id": sample_id,
+                        "sample_type": "PBMC",
+                        "time_from_treatment_start": 0,
+                        "b_cell": 100,
+                        "cd8_t_cell": 100,
+                        "cd4_t_cell": 100,
+                        "nk_cell": 100,
+                        "monocyte": 100,
+                        "subject_id": SUBJECTS[i % 2],
+                    }
+                    for i, sample_id in enumerate(sample_ids)
+                ],
+            )
+
+    async def remove() -> None:
+        async with SessionLocal() as db:
+            await crud.delete_samples_by_sample_id(db, sample_ids)
+            await crud.delete_subjects_by_subject_id(db, SUBJECTS)
+            await crud.delete_projects_by_project_id(db, PROJECTS)
+
+    database.run(create())
+    try:
+        yield sample_ids
+    finally:
+        database.run(remove())
+
+
+def test_sample_pages_keep_every_row_of_a_sample(
+    database: asyncio.Runner, cohort: list[str]
+) -> None:
+    filters: dict = {"conditions": [CONDITION]}
+
+    async def listing(after_sample_id: str | None, page_size: int) -> str:
+        async with SessionLocal() as db:
+            parts = _sample_listing(
+                db,
+                "Samples",
+                SUBSET_COLUMNS,
+                filters,
+                after_sample_id,
+                page_size,
+                chunk_size=1,
+            )
+            return "".join([part async for part in parts])
+
+    async def run() -> None:
+        async with SessionLocal() as db:
+            everything = await get_sample_frame(db, SUBSET_COLUMNS, **filters)
+            assert len(everything) == 8
+            # The limit counts samples, each with all of its rows
+            first = await get_sample_frame(db, SUBSET_COLUMNS, limit=1, **filters)
+            assert first["sample_id"].tolist() == [cohort[0]] * 2
+            assert set(first["project_id"]) == set(PROJECTS)
+
+        # Pages of three samples read one sample per chunk
+        page = await listing(None, 3)
+        assert len(re.findall("<tr><td>", page)) == 6
+        (after,) = re.findall(r"after_sample_id=([^&]+)&", page)
+        assert after == cohort[2]
+        last = await listing(after, 3)
+        assert len(re.findall("<tr><td>", last)) == 2
+        assert "after_sample_id=" not in last
+
+    database.run(run())
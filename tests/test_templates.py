@@ -0,0 +1,34 @@
+import pytest
+
+from api.templates import PAGE, STYLE_URL, Layout
+
+
+def test_render_fills_slots() -> None:
+    layout = Layout("<p>{a} and {b}, {a}</p>", b="fixed")
+    assert layout.render(a="x") == "<p>x and fixed, x</p>"
+    with pytest.raises(KeyError):
+        layout.render()
+
+
+def test_render_without_slots() -> None:
+    assert Layout("plain text").render() == "plain text"
+    assert Layout("{a}").render(a="only") == "only"
+
+
+def test_split_at_a_slot() -> None:
+    layout = Layout("<h1>{title}</h1><main>{main}</main><footer>{footer}</footer>")
+    head, tail = layout.split("main", title="T", footer="F")
+    assert head == "<h1>T</h1><main>"
+    assert tail.render() == "</main><footer>F</footer>"
+    # Slots left open stay in the tail
+    head, tail = layout.split("main", title="T")
+    assert tail.render(footer="G") == "</main><footer>G</footer>"
+    assert head + "body" + tail.render(footer="G") == layout.render(
+        title="T", main="body", footer="G"
+    )
+
+
+def test_page_links_the_stylesheet() -> None:
+    html = PAGE.render(title="Overview", nav="", main="", footer="")
+    assert f'href="{STYLE_URL}"' in html
+    assert html.count("Teiko Demo - Overview") == 2